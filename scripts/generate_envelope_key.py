@@ -0,0 +1,26 @@
+import os
+import sys
+import base64
+import getpass
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+# Writes the private key (restore identity) to the given file and prints the public key for
+# `encryption: {engine: envelope, public_key: ...}` in backupster.yaml
+if __name__ == "__main__":
+    key_path = sys.argv[1] if len(sys.argv) > 1 else "envelope_key.pem"
+    passphrase = getpass.getpass("Passphrase for the private key (empty for none): ")
+
+    key = X25519PrivateKey.generate()
+    encryption = serialization.BestAvailableEncryption(passphrase.encode()) if passphrase else serialization.NoEncryption()
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, encryption)
+
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+
+    print()
+    print(f"Private key written to {key_path}, keep it offline, it's needed for restores.")
+    print("Public key:")
+    print(base64.b64encode(key.public_key().public_bytes_raw()).decode())
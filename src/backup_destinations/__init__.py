@@ -1 +1,20 @@
-from .gcp_backup_destination import GCPBackupDestination, GCPBackupDestinationConfig
\ No newline at end of file
+from ._backup_destination import BackupDestination, BackupDestinationError, AsyncBackupDestination, SyncBackupDestinationAdapter, DestinationType, as_async_destination
+from ._backup_destination import Catalog, PruneReport, RetentionPolicy, TransferConf, VerifyReport
+
+from backup_utils.registry import TypeRegistry, lazy_exports
+
+# Destination types of the configuration, a module (and its storage client library) is only imported when its type is configured
+DESTINATIONS = TypeRegistry(__name__, "backupster.destinations", {
+    "gcp": ".gcp_backup_destination",
+    "local": ".local_backup_destination",
+    "aws": ".aws_backup_destination"
+}, "DESTINATION_TYPE")
+
+__getattr__ = lazy_exports(__name__, {
+    "GCPBackupDestination": ".gcp_backup_destination",
+    "GCPBackupDestinationConfig": ".gcp_backup_destination",
+    "LocalBackupDestination": ".local_backup_destination",
+    "LocalBackupDestinationConfig": ".local_backup_destination",
+    "AWSBackupDestination": ".aws_backup_destination",
+    "AWSBackupDestinationConfig": ".aws_backup_destination"
+})
\ No newline at end of file
@@ -1,31 +1,755 @@
 import os
 import glob
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import NamedTuple
+from typing import BinaryIO, Callable, ContextManager, Iterator, NamedTuple, TypeVar
+
+from backup_utils.journal import JournalSection
+from backup_utils.metrics import CountingWriter, RunMetrics
+
+from .catalog import Catalog, chunk_path
+from .checksums import Checksums, VerifyReport
+from .ranged_reader import RangedReader
+from .retention import PruneReport, RetentionPolicy, select_snapshots
+from .transfer import MultipartWriter, TransferConf, backoff_delay, part_size
+
+_T = TypeVar("_T")
+
+# Part size of the parallel ranged downloads of a restore
+_DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+
+# Objects per delete request batch (GCS allows up to 100 calls per batch)
+_DELETE_BATCH_SIZE = 100
+
+# Read size of files that are uploaded
+_READ_SIZE = 1024 * 1024
+
+# Seconds between the journal writes of the stored parts of a multipart upload
+_JOURNAL_INTERVAL_S = 5.0
+
+# Attempts of a catalog update that lost the race against a concurrent writer
+_CATALOG_ATTEMPTS = 8
+
+# File of a chunked snapshot listing its chunk ids, referenced from its catalog entry
+_CHUNK_INDEX_NAME = "chunks.json"
 
 class BackupDestination(ABC):
+    # Backends implement single requests (and optionally the _multipart_* calls), the transfer core
+    # in this class adds the parallelism, part sizing and retries, the same for every backend
+
+    # Set by backends that implement the _multipart_* calls
+    _multipart = False
 
-    def __init__(self, conf_dir: Path, backup_dir: Path, conf: NamedTuple) -> None:
+    # Checksum the backend reports for stored objects (_remote_checksum), see checksums.CHECKSUM_ALGORITHMS
+    _checksum = "sha256"
+
+    def __init__(self, conf_dir: Path, backup_dir: Path, conf: NamedTuple, workers: int = 1, transfer: TransferConf = TransferConf()) -> None:
         super().__init__()
 
         self._conf_dir = conf_dir
         self._backup_dir = backup_dir
         self._conf = conf
+        self._workers = max(1, workers)
+        self._transfer = transfer
+
+        # Parts held in memory across all multipart uploads of this destination
+        self.__part_slots = threading.BoundedSemaphore(self._workers * 2)
 
         self._timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
 
+        # Set by the job for the duration of a run, uploads are recorded under the "upload" stage
+        self.metrics: RunMetrics | None = None
+
+        # Set by the job when its runs are journaled: the snapshot id, uploaded files and open multipart
+        # uploads of the run are recorded, so a restarted run continues the same snapshot
+        self.journal: JournalSection | None = None
+
+        # Files (and chunks) uploaded in the current snapshot, added to the catalog by commit_snapshot
+        self.__snapshot_files: dict[str, dict] = {}
+        self.__snapshot_chunk_index: str | None = None
+        self.__snapshot_lock = threading.Lock()
+
+        # Retries per object, reported with the upload of the file they happened for
+        self.__retries: dict[str, int] = {}
+
+        # Local copy of the catalogs, only re-downloaded when their generation changed
+        cache_id = hashlib.sha256(f"{type(self).__name__}:{conf!r}".encode()).hexdigest()[:16]
+        self.__catalog_cache_dir = Path(conf_dir, "catalog", cache_id)
+
     @abstractmethod
-    def _upload_file(self, file_path: Path, target_path: str):
+    def _download_file(self, file_name: str, target_path: Path):
         pass
 
     @abstractmethod
-    def _download_file(self, file_name: str, target_path: Path):
+    def _upload_data(self, data: bytes, target_path: str):
+        # One request, validated against the checksum of data where the backend can
+        pass
+
+    @abstractmethod
+    def _list_files(self, prefix: str) -> list[str]:
+        pass
+
+    @abstractmethod
+    def _open_upload_stream(self, target_path: str) -> ContextManager[BinaryIO]:
+        # The upload must only be committed when the context exits without an exception
+        pass
+
+    @abstractmethod
+    def _get_size(self, source_path: str) -> int:
+        pass
+
+    @abstractmethod
+    def _download_range(self, source_path: str, start: int, end: int) -> bytes:
+        # Bytes start to end of the object, both inclusive
+        pass
+
+    def _download_data(self, source_path: str) -> bytes:
+        size = self._get_size(source_path)
+        return self._download_range(source_path, 0, size - 1) if size else b""
+
+    @abstractmethod
+    def _delete_files(self, paths: list[str]):
+        # Deletes up to _DELETE_BATCH_SIZE objects, preferably in one request; missing objects are no error
+        pass
+
+    @abstractmethod
+    def _remote_checksum(self, source_path: str) -> tuple[int, str | None]:
+        # Size and _checksum of the stored object from its metadata (None if unknown), without downloading it;
+        # raises FileNotFoundError if it doesn't exist
+        pass
+
+    @abstractmethod
+    def _get_generation(self, source_path: str) -> int | str:
+        # Version of the object (a number or an opaque token like an ETag), 0 if it doesn't exist
+        pass
+
+    @abstractmethod
+    def _read_versioned(self, source_path: str) -> tuple[bytes | None, int | str]:
+        # Content and generation of the object, read consistently; (None, 0) if it doesn't exist
+        pass
+
+    @abstractmethod
+    def _write_versioned(self, data: bytes, target_path: str, generation: int | str) -> int | str | None:
+        # Writes only if the object is still at generation (0: doesn't exist), returns the new
+        # generation or None if another writer got there first
+        pass
+
+    def _multipart_begin(self, target_path: str) -> str:
+        # Starts a multipart upload, returns its upload id
+        raise NotImplementedError(f"{type(self).__name__} has no multipart uploads")
+
+    def _multipart_put(self, target_path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        # Uploads part part_number (from 1), validated against its checksum, returns the token (ETag) of the part
+        raise NotImplementedError(f"{type(self).__name__} has no multipart uploads")
+
+    def _multipart_complete(self, target_path: str, upload_id: str, parts: list[str]):
+        raise NotImplementedError(f"{type(self).__name__} has no multipart uploads")
+
+    def _multipart_abort(self, target_path: str, upload_id: str):
+        raise NotImplementedError(f"{type(self).__name__} has no multipart uploads")
+
+    def _is_retryable(self, e: BaseException) -> bool:
+        # Transient errors worth another attempt, backends add their throttling and server errors
+        return isinstance(e, (ConnectionError, TimeoutError))
+
+    def _count_retry(self, stage: str = "upload", path: str | None = None):
+        if self.metrics:
+            self.metrics.count_retry(stage)
+        if path is not None:
+            with self.__snapshot_lock:
+                self.__retries[path] = self.__retries.get(path, 0) + 1
+
+    def _retry(self, call: Callable[[], _T], stage: str = "upload", path: str | None = None) -> _T:
+        # Exponential backoff with full jitter, so parallel workers don't retry in lockstep
+        for attempt in range(self._transfer.attempts):
+            try:
+                return call()
+            except Exception as e:
+                if attempt + 1 >= self._transfer.attempts or not self._is_retryable(e):
+                    raise
+                self._count_retry(stage, path)
+                delay = backoff_delay(attempt, self._transfer)
+                print(f"Transient error ({type(e).__name__}: {e}), retrying in {delay:.1f}s.")
+                time.sleep(delay)
+        raise BackupDestinationError("No transfer attempts configured")
+
+    def _transfer_data(self, data: bytes, target_path: str):
+        self._retry(lambda: self._upload_data(data, target_path), path=target_path)
+
+    def _transfer_file(self, file_path: Path, target_path: str) -> Checksums:
+        # The file is read once, sequentially: the checksums are computed on the data as it is uploaded
+        size = file_path.stat().st_size
+        checksums = Checksums(self._checksum, part_size(size, self._transfer))
+        if self._multipart:
+            # Parts are retried one by one, the file isn't read again
+            resumed = self.journal.section("uploads").get(target_path) if self.journal is not None else None
+            try:
+                self.__transfer_parts(file_path, target_path, checksums)
+            except Exception as e:
+                # The upload of an interrupted run may be gone (aborted, expired), it starts over once
+                if resumed is None or self.journal is None:
+                    raise
+                print(f"Resuming the upload of {target_path} failed ({type(e).__name__}: {e}), uploading it again.")
+                self.__abort_upload(target_path, resumed["upload_id"])
+                self.journal.section("uploads").remove(target_path)
+                checksums = Checksums(self._checksum, part_size(size, self._transfer))
+                self.__transfer_parts(file_path, target_path, checksums)
+        else:
+            def attempt() -> Checksums:
+                attempt_checksums = Checksums(self._checksum, part_size(size, self._transfer))
+                self.__stream_file(file_path, self._open_upload_stream(target_path), attempt_checksums)
+                return attempt_checksums
+            checksums = self._retry(attempt, path=target_path)
+        self._check_remote(target_path, checksums)
+        return checksums
+
+    def __transfer_parts(self, file_path: Path, target_path: str, checksums: Checksums):
+        # Journaled: the upload id and stored parts are recorded as they complete, a restarted run
+        # continues the upload with the first missing part (the data before it is only read for the checksums)
+        uploads = self.journal.section("uploads") if self.journal is not None else None
+        if uploads is None:
+            self.__stream_file(file_path, self._multipart_upload_stream(target_path, file_path.stat().st_size), checksums)
+            return
+
+        stat = file_path.stat()
+        source = [stat.st_size, stat.st_mtime_ns]
+        size = part_size(stat.st_size, self._transfer)
+        state = uploads.get(target_path)
+        upload_id, parts = None, []
+        if state is not None and state["source"] == source and state["part_size"] == size:
+            upload_id, parts = state["upload_id"], state["parts"]
+            print(f"Resuming the upload of {target_path} at part {len(parts) + 1} ({len(parts) * size} bytes stored).")
+        elif state is not None:
+            # The file changed since, its parts are of no use
+            self.__abort_upload(target_path, state["upload_id"])
+
+        # Every journal write is synced: the upload id is recorded at once, the stored parts at most every
+        # _JOURNAL_INTERVAL_S and when the upload fails; a killed run sends the parts since then again
+        saved = {"upload_id": upload_id, "parts": len(parts), "time": time.monotonic()}
+        latest: dict = {}
+
+        def save():
+            uploads.put(target_path, dict(latest))
+            saved.update(upload_id=latest["upload_id"], parts=len(latest["parts"]), time=time.monotonic())
+
+        def record(upload_id: str, parts: list[str]):
+            latest.update(upload_id=upload_id, parts=parts, part_size=size, source=source)
+            if upload_id != saved["upload_id"] or time.monotonic() - saved["time"] >= _JOURNAL_INTERVAL_S:
+                save()
+
+        upload = self._multipart_upload_stream(target_path, stat.st_size, upload_id, parts, record)
+        try:
+            self.__stream_file(file_path, upload, checksums, len(parts) * size)
+        except BaseException:
+            if latest and len(latest["parts"]) != saved["parts"]:
+                save()
+            raise
+        uploads.remove(target_path)
+
+    def __abort_upload(self, target_path: str, upload_id: str):
+        # Drops the stored parts of an upload that won't be continued, they would be billed until they expire
+        try:
+            self._multipart_abort(target_path, upload_id)
+        except Exception as e:
+            print(f"Failed to abort multipart upload {upload_id} of {target_path}: {e}")
+
+    def __stream_file(self, file_path: Path, upload: ContextManager[BinaryIO], checksums: Checksums, skip: int = 0):
+        with open(file_path, "rb") as f, upload as target:
+            # Data of parts stored by an interrupted run
+            while skip > 0 and (data := f.read(min(_READ_SIZE, skip))):
+                checksums.update(data)
+                skip -= len(data)
+            writer = CountingWriter(target, checksums)
+            while data := f.read(_READ_SIZE):
+                writer.write(data)
+
+    def _check_remote(self, target_path: str, checksums: Checksums):
+        # Compares what was sent with what the destination stored, one metadata request
+        size, value = self._retry(lambda: self._remote_checksum(target_path), path=target_path)
+        if size != checksums.size or (value is not None and value != checksums.value()):
+            raise BackupDestinationError(f"Integrity check of {target_path} failed: destination reports {size} bytes, "
+                                         f"{self._checksum} {value}; sent {checksums.size} bytes, {self._checksum} {checksums.value()}")
+
+    @contextmanager
+    def _multipart_upload_stream(self,
+                                 target_path: str,
+                                 size: int = 0,
+                                 upload_id: str | None = None,
+                                 parts: list[str] | None = None,
+                                 on_parts: Callable[[str, list[str]], None] | None = None) -> Iterator[BinaryIO]:
+        # _open_upload_stream for backends with multipart calls: parts are uploaded while the stream is written.
+        # size (if known) only raises the part size of very large files; upload_id and parts continue an
+        # upload, with on_parts it is left open on errors to be continued by the next run
+        writer = MultipartWriter(
+            lambda data: self._transfer_data(data, target_path),
+            lambda: self._retry(lambda: self._multipart_begin(target_path), path=target_path),
+            lambda upload_id, number, data: self._retry(lambda: self._multipart_put(target_path, upload_id, number, data), path=target_path),
+            lambda upload_id, parts: self._retry(lambda: self._multipart_complete(target_path, upload_id, parts), path=target_path),
+            lambda upload_id: self._multipart_abort(target_path, upload_id),
+            part_size(size, self._transfer),
+            self._workers,
+            self.__part_slots,
+            upload_id,
+            parts,
+            on_parts,
+            on_parts is not None
+        )
+        try:
+            yield writer  # type: ignore[misc]
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+
+    def _record_upload(self, target_path: str, size: int, start: float):
+        with self.__snapshot_lock:
+            retries = self.__retries.pop(target_path, 0)
+        if self.metrics:
+            self.metrics.add_file("upload", target_path, size, size, time.perf_counter() - start, retries)
+
+    @contextmanager
+    def open_backup_stream(self, backup_name: str, file_name: str) -> Iterator[BinaryIO]:
+        target_path = f"{backup_name}/{self._timestamp}/{file_name}"
+        start = time.perf_counter()
+        checksums = Checksums(self._checksum, part_size(0, self._transfer))
+        with self._open_upload_stream(target_path) as upload:
+            counter = CountingWriter(upload, checksums)
+            yield counter  # type: ignore[misc]
+        self._check_remote(target_path, checksums)
+        self._record_upload(target_path, counter.bytes, start)
+        self.__add_snapshot_file(file_name, checksums.entry())
+
+    def upload_backup_file(self, backup_name: str, file_path: Path):
+        if self.resume_upload(file_path.name):
+            return
+        target_path = f"{backup_name}/{self._timestamp}/{file_path.name}"
+        start = time.perf_counter()
+        checksums = self._transfer_file(file_path, target_path)
+        self._record_upload(target_path, checksums.size, start)
+        self.__add_snapshot_file(file_path.name, checksums.entry())
+
+    def resume_upload(self, file_name: str) -> bool:
+        # Adds the file to the snapshot if the interrupted run of a journaled job already uploaded it
+        entry = self.journal.section("files").get(file_name) if self.journal is not None else None
+        if entry is None:
+            return False
+        with self.__snapshot_lock:
+            self.__snapshot_files[file_name] = entry
+        if self.metrics:
+            self.metrics.add("resume", bytes_in=entry["size"], files=1)
+        print(f"Skipping {file_name}, uploaded to snapshot {self._timestamp} by the interrupted run.")
+        return True
+
+    def __add_snapshot_file(self, file_name: str, entry: dict):
+        with self.__snapshot_lock:
+            self.__snapshot_files[file_name] = entry
+        if self.journal is not None:
+            self.journal.section("files").put(file_name, entry)
+
+    def begin_snapshot(self):
+        # Called at the start of every run, one destination object may serve several runs;
+        # a journaled run continues the snapshot of the run it resumes
+        resumed = self.journal.get("snapshot") if self.journal is not None else None
+        self._timestamp = resumed["id"] if resumed else datetime.now().strftime("%Y%m%d-%H%M%S")
+        with self.__snapshot_lock:
+            self.__snapshot_files = {}
+            self.__snapshot_chunk_index = None
+            self.__retries = {}
+        if self.journal is not None and resumed is None:
+            self.journal.put("snapshot", {"id": self._timestamp})
+
+    def commit_snapshot(self, backup_name: str, archives: list[str] | None = None, fingerprint: dict | None = None) -> Catalog:
+        # Registers the files uploaded since begin_snapshot in the catalog, only after a successful run
+        with self.__snapshot_lock:
+            files = dict(self.__snapshot_files)
+            chunk_index = self.__snapshot_chunk_index
+        snapshot = self._timestamp
+        return self.update_catalog(backup_name, lambda catalog: catalog.add_snapshot(snapshot, files, chunk_index, archives, fingerprint))
+
+    def latest_fingerprint(self, backup_name: str) -> tuple[str, dict] | None:
+        return self.read_catalog(backup_name).latest_fingerprint()
+
+    def record_unchanged(self, backup_name: str, snapshot: str) -> bool:
+        # Marks snapshot as still current instead of committing a new one, False if it was pruned in the meantime
+        recorded: list[bool] = []
+        self.update_catalog(backup_name, lambda catalog: recorded.append(catalog.add_unchanged(snapshot)))
+        return recorded[-1]
+
+    def upload_backup(self, backup_name: str, suffix: str = ".gpg"):
+        errors: dict[str, BaseException] = {}
+
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            futures = {
+                pool.submit(self.upload_backup_file, backup_name, file_path): file_path.name
+                for file_path in sorted(self._backup_dir.glob(f"*{suffix}"))
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[futures[future]] = e
+
+        if errors:
+            report = "\n".join(f"  {name}: {type(e).__name__}: {e}" for name, e in sorted(errors.items()))
+            raise BackupDestinationError(f"{len(errors)} upload(s) failed:\n{report}")
+
+    def __catalog_path(self, backup_name: str) -> str:
+        return f"{backup_name}/catalog.json"
+
+    def __cache_path(self, backup_name: str) -> Path:
+        return self.__catalog_cache_dir / f"{hashlib.sha256(backup_name.encode()).hexdigest()[:16]}.json"
+
+    def __write_atomic(self, path: Path, data: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def __read_cache(self, backup_name: str, generation: int) -> Catalog | None:
+        try:
+            with open(self.__cache_path(backup_name), "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if cached.get("generation") != generation:
+            return None
+        return Catalog(backup_name, cached["catalog"], generation)
+
+    def __write_cache(self, catalog: Catalog, data: bytes):
+        self.__write_atomic(self.__cache_path(catalog.backup_name),
+                            json.dumps({"generation": catalog.generation, "catalog": json.loads(data)}, separators=(",", ":")))
+
+    def __chunk_index_cache_path(self, backup_name: str, snapshot: str) -> Path:
+        return self.__cache_path(backup_name).with_suffix("") / f"{snapshot}.{_CHUNK_INDEX_NAME}"
+
+    def snapshot_chunks(self, backup_name: str, snapshot: str, entry: dict) -> set[str]:
+        # Chunk ids of a chunked snapshot from its chunk index; the index never changes once written
+        # and is cached next to the catalog, so it is downloaded once per snapshot
+        if "chunk_index" not in entry:
+            return set(entry.get("chunks", []))
+        cache_path = self.__chunk_index_cache_path(backup_name, snapshot)
+        try:
+            with open(cache_path, "r") as f:
+                return set(json.load(f)["chunks"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        data = self._retry(lambda: self._download_data(f"{backup_name}/{snapshot}/{entry['chunk_index']}"), "catalog")
+        chunks = json.loads(data)["chunks"]
+        self.__write_atomic(cache_path, json.dumps({"chunks": chunks}, separators=(",", ":")))
+        return set(chunks)
+
+    def read_catalog(self, backup_name: str) -> Catalog:
+        # One metadata request if the cached copy is current, otherwise one download
+        catalog_path = self.__catalog_path(backup_name)
+        generation = self._get_generation(catalog_path)
+        if generation:
+            cached = self.__read_cache(backup_name, generation)
+            if cached is not None:
+                return cached
+
+        data, generation = self._read_versioned(catalog_path)
+        catalog = Catalog.decode(backup_name, data, generation)
+        if data:
+            self.__write_cache(catalog, data)
+        return catalog
+
+    def update_catalog(self, backup_name: str, update: Callable[[Catalog], None]) -> Catalog:
+        # Read-modify-write with a generation precondition, retried when a concurrent run won the race
+        for attempt in range(_CATALOG_ATTEMPTS):
+            catalog = self.read_catalog(backup_name)
+            update(catalog)
+            data = catalog.encode()
+
+            generation = self._write_versioned(data, self.__catalog_path(backup_name), catalog.generation)
+            if generation is not None:
+                catalog.generation = generation
+                self.__write_cache(catalog, data)
+                return catalog
+
+            self._count_retry("catalog")
+            time.sleep(min(5.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+        raise BackupDestinationError(f"Catalog of {backup_name} changed concurrently {_CATALOG_ATTEMPTS} times, giving up")
+
+    def rebuild_catalog(self, backup_name: str) -> Catalog:
+        # Adds snapshots that are missing in the catalog (e.g. created before it existed) from a full listing
+        snapshot_files: dict[str, dict[str, dict]] = {}
+        for name in self._list_files(f"{backup_name}/"):
+            parts = name[len(backup_name) + 1:].split("/")
+            if len(parts) == 2 and parts[0] != "chunks":
+                snapshot_files.setdefault(parts[0], {})[parts[1]] = {"size": self._get_size(name), "sha256": None}
+
+        def update(catalog: Catalog):
+            for snapshot, files in snapshot_files.items():
+                if snapshot not in catalog.snapshots:
+                    catalog.add_snapshot(snapshot, files, _CHUNK_INDEX_NAME if _CHUNK_INDEX_NAME in files else None)
+        return self.update_catalog(backup_name, update)
+
+    def delete_objects(self, paths: list[str]):
+        batches = [paths[i:i + _DELETE_BATCH_SIZE] for i in range(0, len(paths), _DELETE_BATCH_SIZE)]
+        errors: list[BaseException] = []
+
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            for future in as_completed([pool.submit(self._delete_files, batch) for batch in batches]):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+
+        if errors:
+            report = "\n".join(f"  {type(e).__name__}: {e}" for e in errors)
+            raise BackupDestinationError(f"{len(errors)} of {len(batches)} delete batch(es) failed:\n{report}")
+
+    def prune(self, backup_name: str, policy: RetentionPolicy) -> PruneReport:
+        catalog = self.read_catalog(backup_name)
+        if not catalog.snapshots:
+            raise BackupDestinationError(f"No catalog for {backup_name}, run 'main.py catalog {backup_name} --rebuild' first")
+
+        keep, delete = select_snapshots(catalog.snapshot_ids(), policy)
+        removed: dict[str, dict] = {}
+        orphaned: set[str] = set()
+
+        def update(catalog: Catalog):
+            # Evaluated against the latest catalog, chunks of snapshots committed in the meantime stay
+            removed.clear()
+            for snapshot in delete:
+                entry = catalog.remove_snapshot(snapshot)
+                if entry is not None:
+                    removed[snapshot] = entry
+            orphaned.clear()
+            chunks = set().union(*(self.snapshot_chunks(backup_name, snapshot, entry) for snapshot, entry in removed.items()))
+            if chunks:
+                referenced = set().union(*(self.snapshot_chunks(backup_name, snapshot, catalog.snapshots[snapshot]) for snapshot in catalog.chunked_snapshot_ids()))
+                orphaned.update(chunks - referenced)
+
+        if policy.dry_run or not delete:
+            update(Catalog(backup_name, {"snapshots": catalog.snapshots}))
+        else:
+            # Snapshots leave the catalog before their objects are deleted, so they are never listed half deleted
+            self.update_catalog(backup_name, update)
+
+        paths = [f"{backup_name}/{snapshot}/{file_name}" for snapshot, entry in sorted(removed.items()) for file_name in sorted(entry["files"])]
+        paths += [chunk_path(backup_name, chunk) for chunk in sorted(orphaned)]
+        size = sum(f["size"] for entry in removed.values() for f in entry["files"].values())
+
+        if not policy.dry_run:
+            self.delete_objects(paths)
+            for snapshot in removed:
+                self.__chunk_index_cache_path(backup_name, snapshot).unlink(missing_ok=True)
+            if self.metrics:
+                self.metrics.add("prune", bytes_in=size, files=len(paths))
+
+        action = "Would delete" if policy.dry_run else "Deleted"
+        for snapshot in sorted(removed):
+            print(f"{action} snapshot {backup_name}/{snapshot} ({len(removed[snapshot]['files'])} file(s)).")
+        print(f"{action} {len(removed)} snapshot(s) of {backup_name}: {len(paths)} object(s), "
+              f"{size} bytes without chunks, {len(orphaned)} unreferenced chunk(s); keeping {len(keep)}.")
+
+        return PruneReport(backup_name, keep, sorted(removed), len(paths), size, policy.dry_run)
+
+    def verify(self, backup_name: str, snapshots: list[str] | None = None) -> VerifyReport:
+        # Checks size and checksum of every file of the snapshots against the catalog, from object
+        # metadata only; chunks of deduplicated snapshots are checked for existence with one listing
+        catalog = self.read_catalog(backup_name)
+        if not catalog.snapshots:
+            raise BackupDestinationError(f"No catalog for {backup_name}, run 'main.py catalog {backup_name} --rebuild' first")
+        selected = snapshots or catalog.snapshot_ids()
+        unknown = sorted(set(selected) - set(catalog.snapshots))
+        if unknown:
+            raise BackupDestinationError(f"Snapshot(s) {', '.join(unknown)} of {backup_name} are not in the catalog")
+
+        objects = [(f"{backup_name}/{snapshot}/{file_name}", entry)
+                   for snapshot in selected for file_name, entry in sorted(catalog.snapshots[snapshot]["files"].items())]
+        failures: list[str] = []
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            for (path, _), problem in zip(objects, pool.map(lambda item: self.__verify_object(*item), objects)):
+                if problem:
+                    failures.append(f"{path}: {problem}")
+
+        chunks = sorted(set().union(*(self.snapshot_chunks(backup_name, snapshot, catalog.snapshots[snapshot]) for snapshot in selected)))
+        if chunks:
+            stored = set(self._list_files(f"{backup_name}/chunks/"))
+            failures += [f"{chunk_path(backup_name, chunk)}: missing" for chunk in chunks if chunk_path(backup_name, chunk) not in stored]
+
+        for failure in failures:
+            print(f"Verification failed for {failure}")
+        print(f"Verified {len(selected)} snapshot(s) of {backup_name}: {len(objects)} file(s), {len(chunks)} chunk(s), {len(failures)} problem(s).")
+        return VerifyReport(backup_name, selected, len(objects) + len(chunks), failures)
+
+    def __verify_object(self, path: str, entry: dict) -> str | None:
+        try:
+            size, value = self._retry(lambda: self._remote_checksum(path), "verify")
+        except FileNotFoundError:
+            return "missing"
+        if size != entry["size"]:
+            return f"{size} bytes, catalog has {entry['size']}"
+        # Entries from before checksums were recorded (or of another destination type) are checked by size only
+        expected = entry.get(self._checksum)
+        if expected is not None and value is not None and value != expected:
+            return f"{self._checksum} {value}, catalog has {expected}"
+        return None
+
+    def list_snapshots(self, backup_name: str) -> list[str]:
+        catalog = self.read_catalog(backup_name)
+        if catalog.snapshots:
+            return catalog.snapshot_ids()
+
+        # Backups from before the catalog existed
+        snapshots = set()
+        for name in self._list_files(f"{backup_name}/"):
+            parts = name[len(backup_name) + 1:].split("/")
+            if len(parts) == 2 and parts[0] != "chunks":
+                snapshots.add(parts[0])
+        return sorted(snapshots)
+
+    def list_snapshot_files(self, backup_name: str, snapshot: str) -> list[str]:
+        catalog = self.read_catalog(backup_name)
+        if snapshot in catalog.snapshots:
+            return sorted(catalog.snapshots[snapshot]["files"])
+
+        prefix = f"{backup_name}/{snapshot}/"
+        return sorted(name[len(prefix):] for name in self._list_files(prefix))
+
+    def open_download_stream(self, backup_name: str, snapshot: str, file_name: str) -> RangedReader:
+        source_path = f"{backup_name}/{snapshot}/{file_name}"
+        return RangedReader(
+            lambda start, end: self._retry(lambda: self._download_range(source_path, start, end), "restore"),
+            self._get_size(source_path),
+            _DOWNLOAD_PART_SIZE,
+            self._workers
+        )
+
+    def download_snapshot_data(self, backup_name: str, snapshot: str, file_name: str) -> bytes:
+        return self._retry(lambda: self._download_data(f"{backup_name}/{snapshot}/{file_name}"), "restore")
+
+    def download_chunk(self, backup_name: str, chunk_id: str) -> bytes:
+        return self._retry(lambda: self._download_data(chunk_path(backup_name, chunk_id)), "restore")
+
+    def __put_snapshot_data(self, data: bytes, target_path: str):
+        start = time.perf_counter()
+        checksums = Checksums(self._checksum, part_size(len(data), self._transfer))
+        checksums.update(data)
+        self._transfer_data(data, target_path)
+        self._check_remote(target_path, checksums)
+        self._record_upload(target_path, len(data), start)
+        self.__add_snapshot_file(Path(target_path).name, checksums.entry())
+
+    def upload_chunked_backup(self, backup_name: str, encrypt: Callable[[bytes], bytes], manifest_suffix: str = ".gpg"):
+        # Chunks referenced by cataloged snapshots are known without listing the chunk prefix, unless
+        # an interrupted run stored chunks that aren't in the catalog yet; only the chunk indexes of
+        # snapshots added since the last run are downloaded
+        catalog = self.read_catalog(backup_name)
+        known = set().union(*(self.snapshot_chunks(backup_name, snapshot, catalog.snapshots[snapshot]) for snapshot in catalog.chunked_snapshot_ids()))
+        if self.journal is not None:
+            if self.journal.get("chunked") is not None:
+                known = set()
+            self.journal.put("chunked", {})
+
+        # Only dedup jobs need the chunker (and numpy)
+        from .chunk_store import ChunkStore
+
+        chunk_store = ChunkStore(backup_name, self._list_files, self._transfer_data, encrypt, self._workers, known=known or None)
+        manifest = chunk_store.store_tree(self._backup_dir)
+        manifest["snapshot"] = self._timestamp
+
+        # The manifest holds the file names of the backup and is therefore encrypted as well
+        manifest_path = f"{backup_name}/{self._timestamp}/manifest.json{manifest_suffix}"
+        self.__put_snapshot_data(encrypt(ChunkStore.encode_manifest(manifest)), manifest_path)
+
+        # The chunk ids for prune and verify, in a file of the snapshot instead of the catalog, which
+        # is rewritten by every run and would otherwise grow with snapshots times chunks
+        chunks = sorted({chunk for entry in manifest["files"] for chunk in entry["chunks"]})
+        self.__put_snapshot_data(json.dumps({"snapshot": self._timestamp, "chunks": chunks}, separators=(",", ":")).encode(),
+                                 f"{backup_name}/{self._timestamp}/{_CHUNK_INDEX_NAME}")
+        with self.__snapshot_lock:
+            self.__snapshot_chunk_index = _CHUNK_INDEX_NAME
+
+        if self.metrics:
+            # Chunks are counted in bulk, one entry per chunk would flood the run summary
+            self.metrics.add("upload", chunk_store.uploaded_bytes, chunk_store.stored_bytes, chunk_store.uploaded_chunks)
+
+        print(f"Chunked backup {manifest_path}: {chunk_store.uploaded_chunks} new chunk(s) "
+              f"({chunk_store.uploaded_bytes} bytes), {chunk_store.skipped_chunks} already stored.")
+
+
+class AsyncBackupDestination(ABC):
+
+    def __init__(self, conf_dir: Path, backup_dir: Path, conf: NamedTuple, workers: int = 1) -> None:
+        super().__init__()
+
+        self._conf_dir = conf_dir
+        self._backup_dir = backup_dir
+        self._conf = conf
+        self._workers = max(1, workers)
+
+        self._timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    @abstractmethod
+    async def _upload_file(self, file_path: Path, target_path: str):
+        pass
+
+    @abstractmethod
+    async def _download_file(self, file_name: str, target_path: Path):
         pass
 
-    def upload_backup(self, backup_name: str):
-        for file_path in self._backup_dir.glob("*.gpg"):
-            target_path = f"{backup_name}/{self._timestamp}/{file_path.name}"
-            self._upload_file(file_path, target_path)
\ No newline at end of file
+    async def upload_backup_file(self, backup_name: str, file_path: Path):
+        await self._upload_file(file_path, f"{backup_name}/{self._timestamp}/{file_path.name}")
+
+    async def upload_backup(self, backup_name: str, suffix: str = ".gpg"):
+        semaphore = asyncio.Semaphore(self._workers)
+
+        async def upload(file_path: Path):
+            async with semaphore:
+                await self.upload_backup_file(backup_name, file_path)
+
+        file_paths = sorted(self._backup_dir.glob(f"*{suffix}"))
+        results = await asyncio.gather(*(upload(file_path) for file_path in file_paths), return_exceptions=True)
+
+        errors = {file_path.name: e for file_path, e in zip(file_paths, results) if isinstance(e, BaseException)}
+        if errors:
+            report = "\n".join(f"  {name}: {type(e).__name__}: {e}" for name, e in sorted(errors.items()))
+            raise BackupDestinationError(f"{len(errors)} upload(s) failed:\n{report}")
+
+class SyncBackupDestinationAdapter(AsyncBackupDestination):
+    # Runs the blocking storage calls of a destination in worker threads
+
+    def __init__(self, destination: BackupDestination) -> None:
+        super().__init__(destination._conf_dir, destination._backup_dir, destination._conf, destination._workers)
+        self._timestamp = destination._timestamp
+        self.__destination = destination
+
+    async def _upload_file(self, file_path: Path, target_path: str):
+        await asyncio.to_thread(self.__destination._transfer_file, file_path, target_path)
+
+    async def upload_backup_file(self, backup_name: str, file_path: Path):
+        # Through the wrapped destination, so the upload is recorded in its metrics
+        await asyncio.to_thread(self.__destination.upload_backup_file, backup_name, file_path)
+
+    async def _download_file(self, file_name: str, target_path: Path):
+        return await asyncio.to_thread(self.__destination._download_file, file_name, target_path)
+
+class DestinationType(NamedTuple):
+    # What the module of a destination type exposes as DESTINATION_TYPE, see backup_destinations.DESTINATIONS
+    parse_conf: Callable[[dict], NamedTuple]
+    destination: Callable[[Path, Path, NamedTuple, int, TransferConf], BackupDestination]
+
+def as_async_destination(destination: BackupDestination | AsyncBackupDestination) -> AsyncBackupDestination:
+    if isinstance(destination, AsyncBackupDestination):
+        return destination
+    return SyncBackupDestinationAdapter(destination)
+
+
+class BackupDestinationError(Exception):
+    pass
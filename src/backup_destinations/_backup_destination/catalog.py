@@ -0,0 +1,73 @@
+import json
+
+from datetime import datetime, timezone
+
+def chunk_path(backup_name: str, chunk_id: str) -> str:
+    # Chunks of a backup are stored next to its catalog and snapshots
+    return f"{backup_name}/chunks/{chunk_id[:2]}/{chunk_id}"
+
+class Catalog:
+    # Index of all snapshots of a backup, stored as {backup_name}/catalog.json next to them:
+    # {"version": 1, "snapshots": {snapshot: {"created", "files": {name: {"size", "sha256", <checksum>?}}, "chunk_index"?, "archives"?,
+    #                                          "fingerprint"?: {"root", "entries", "conf"}, "unchanged"?: {"runs", "last"}}}}
+    # where <checksum> is the checksum the destination reports for the object (crc32c, etag or sha256), chunk_index
+    # the file of a chunked snapshot listing its chunk ids (catalogs of older versions have them inline as "chunks"),
+    # fingerprint the source tree the snapshot was made of and unchanged the later runs that found the same tree
+    # generation is the storage version the catalog was read at, 0 if it didn't exist yet
+
+    def __init__(self, backup_name: str, data: dict | None = None, generation: int | str = 0) -> None:
+        self.backup_name = backup_name
+        self.generation = generation
+        self.snapshots: dict[str, dict] = dict((data or {}).get("snapshots", {}))
+
+    def add_snapshot(self, snapshot: str, files: dict[str, dict], chunk_index: str | None = None, archives: list[str] | None = None, fingerprint: dict | None = None):
+        # Merging into an existing entry keeps it idempotent when a conditional write is retried
+        entry = self.snapshots.setdefault(snapshot, {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "files": {}
+        })
+        entry["files"].update(files)
+        if chunk_index is not None:
+            entry["chunk_index"] = chunk_index
+        if archives is not None:
+            # Files that are archives of a directory, as opposed to files of the source that happen to be archives
+            entry["archives"] = sorted(set(entry.get("archives", [])) | set(archives))
+        if fingerprint is not None:
+            entry["fingerprint"] = fingerprint
+
+    def latest_fingerprint(self) -> tuple[str, dict] | None:
+        # (snapshot, fingerprint) of the latest snapshot, if it has one
+        if not self.snapshots:
+            return None
+        snapshot = self.snapshot_ids()[-1]
+        fingerprint = self.snapshots[snapshot].get("fingerprint")
+        return (snapshot, fingerprint) if fingerprint else None
+
+    def add_unchanged(self, snapshot: str) -> bool:
+        # No-change marker: a run found the source tree of the snapshot unchanged and made no new one
+        if snapshot not in self.snapshots:
+            return False
+        unchanged = self.snapshots[snapshot].setdefault("unchanged", {"runs": 0})
+        unchanged["runs"] += 1
+        unchanged["last"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        return True
+
+    def remove_snapshot(self, snapshot: str) -> dict | None:
+        return self.snapshots.pop(snapshot, None)
+
+    def chunked_snapshot_ids(self) -> list[str]:
+        return [snapshot for snapshot in self.snapshot_ids() if "chunk_index" in self.snapshots[snapshot] or "chunks" in self.snapshots[snapshot]]
+
+    def snapshot_ids(self) -> list[str]:
+        return sorted(self.snapshots)
+
+    def encode(self) -> bytes:
+        return json.dumps({
+            "version": 1,
+            "backup": self.backup_name,
+            "snapshots": {snapshot: self.snapshots[snapshot] for snapshot in sorted(self.snapshots)}
+        }, separators=(",", ":")).encode()
+
+    @staticmethod
+    def decode(backup_name: str, data: bytes | None, generation: int | str) -> "Catalog":
+        return Catalog(backup_name, json.loads(data) if data else None, generation)
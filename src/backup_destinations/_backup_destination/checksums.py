@@ -0,0 +1,83 @@
+import base64
+import hashlib
+
+from typing import NamedTuple
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+# Checksums a destination can report for a stored object without downloading it:
+#   crc32c: base64 of the big-endian CRC32C, as GCS reports it
+#   etag:   hex MD5 of a single part upload, MD5 of the concatenated part MD5s + "-<parts>" of a multipart upload
+#   sha256: hex SHA-256
+CHECKSUM_ALGORITHMS = ("crc32c", "etag", "sha256")
+
+class VerifyReport(NamedTuple):
+    backup_name: str
+    snapshots: list[str]
+    objects: int
+    failures: list[str]
+
+class Checksums:
+    # Digests of an object, fed with the data on its way to the destination: the SHA-256 for the
+    # catalog plus the checksum the destination reports (algorithm). part_size has to match the
+    # part size of the upload for etag.
+
+    def __init__(self, algorithm: str, part_size: int = 0) -> None:
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ChecksumsError(f"Unknown checksum algorithm {algorithm}, available: {', '.join(CHECKSUM_ALGORITHMS)}")
+        if algorithm == "crc32c" and google_crc32c is None:
+            raise ChecksumsError("CRC32C checksums need the google-crc32c package")
+
+        self.algorithm = algorithm
+        self.size = 0
+        self.__sha256 = hashlib.sha256()
+        self.__crc32c = google_crc32c.Checksum() if algorithm == "crc32c" else None
+        self.__part_size = part_size
+        self.__part_md5s: list[bytes] = []
+        self.__part = hashlib.md5() if algorithm == "etag" else None
+        self.__part_bytes = 0
+
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        self.size += len(view)
+        self.__sha256.update(view)
+        if self.__crc32c is not None:
+            self.__crc32c.update(bytes(view))
+        if self.__part is not None:
+            self.__update_parts(view)
+
+    def __update_parts(self, view: memoryview):
+        while view:
+            if self.__part_bytes == self.__part_size:
+                self.__part_md5s.append(self.__part.digest())  # type: ignore[union-attr]
+                self.__part = hashlib.md5()
+                self.__part_bytes = 0
+            take = min(len(view), self.__part_size - self.__part_bytes)
+            self.__part.update(view[:take])  # type: ignore[union-attr]
+            self.__part_bytes += take
+            view = view[take:]
+
+    def hexdigest(self) -> str:
+        # Same interface as a hashlib digest, e.g. for CountingWriter
+        return self.__sha256.hexdigest()
+
+    def value(self) -> str:
+        if self.__crc32c is not None:
+            return base64.b64encode(self.__crc32c.digest()).decode()
+        if self.__part is not None:
+            if not self.__part_md5s:
+                return self.__part.hexdigest()
+            md5s = self.__part_md5s + [self.__part.digest()]
+            return f"{hashlib.md5(b''.join(md5s)).hexdigest()}-{len(md5s)}"
+        return self.__sha256.hexdigest()
+
+    def entry(self) -> dict:
+        # Catalog entry of the object
+        return {"size": self.size, "sha256": self.hexdigest(), self.algorithm: self.value()}
+
+
+class ChecksumsError(Exception):
+    pass
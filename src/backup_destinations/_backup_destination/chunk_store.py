@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+import backup_utils.chunking as chunking
+
+from .catalog import chunk_path
+
+class ChunkStore:
+    # Content-addressed store below {backup_name}/chunks/: every chunk of the backup tree is
+    # named by the sha256 of its plaintext and only uploaded (encrypted) if the bucket lacks it
+
+    def __init__(self,
+                 backup_name: str,
+                 list_files: Callable[[str], list[str]],
+                 upload_data: Callable[[bytes, str], None],
+                 encrypt: Callable[[bytes], bytes],
+                 workers: int = 1,
+                 conf: chunking.ChunkerConf = chunking.ChunkerConf(),
+                 known: set[str] | None = None) -> None:
+        self.__backup_name = backup_name
+        self.__prefix = f"{backup_name}/chunks"
+        self.__upload_data = upload_data
+        self.__encrypt = encrypt
+        self.__workers = max(1, workers)
+        self.__conf = conf
+
+        # Without a known set (e.g. from the catalog) the stored chunks are listed once
+        if known is None:
+            known = {Path(name).name for name in list_files(f"{self.__prefix}/")}
+        self.__known = set(known)
+        self.__known_lock = threading.Lock()
+
+        self.uploaded_chunks = 0
+        self.uploaded_bytes = 0
+        self.stored_bytes = 0
+        self.skipped_chunks = 0
+
+    def chunk_path(self, chunk_id: str) -> str:
+        return chunk_path(self.__backup_name, chunk_id)
+
+    def __put_chunk(self, chunk_id: str, data: bytes):
+        encrypted = self.__encrypt(data)
+        self.__upload_data(encrypted, self.chunk_path(chunk_id))
+        with self.__known_lock:
+            self.uploaded_chunks += 1
+            self.uploaded_bytes += len(data)
+            self.stored_bytes += len(encrypted)
+
+    def __claim(self, chunk_id: str) -> bool:
+        with self.__known_lock:
+            if chunk_id in self.__known:
+                self.skipped_chunks += 1
+                return False
+            self.__known.add(chunk_id)
+            return True
+
+    def store_tree(self, root: Path) -> dict:
+        files: list[dict] = []
+        dirs: list[str] = []
+        # Bound the chunks held in memory while they wait for encryption/upload
+        in_flight = threading.BoundedSemaphore(self.__workers * 2)
+        futures: list[Future] = []
+
+        def put(chunk_id: str, data: bytes):
+            try:
+                self.__put_chunk(chunk_id, data)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+            for dir_path, dir_names, file_names in os.walk(root):
+                dir_names.sort()
+                rel_dir = Path(dir_path).relative_to(root)
+                if rel_dir != Path("."):
+                    dirs.append(rel_dir.as_posix())
+
+                for file_name in sorted(file_names):
+                    file_path = Path(dir_path) / file_name
+                    rel_path = file_path.relative_to(root).as_posix()
+                    if rel_dir == Path(".") and file_name.startswith("."):
+                        continue
+
+                    chunk_ids: list[str] = []
+                    with open(file_path, "rb") as f:
+                        for data in chunking.iter_chunks(f, self.__conf):
+                            chunk_id = chunking.chunk_id(data)
+                            chunk_ids.append(chunk_id)
+                            if self.__claim(chunk_id):
+                                in_flight.acquire()
+                                futures.append(pool.submit(put, chunk_id, data))
+
+                    files.append({
+                        "path": rel_path,
+                        "size": file_path.stat().st_size,
+                        "mode": file_path.stat().st_mode & 0o777,
+                        "chunks": chunk_ids
+                    })
+
+            for future in futures:
+                future.result()
+
+        return {
+            "version": 1,
+            "chunker": self.__conf._asdict(),
+            "dirs": dirs,
+            "files": files
+        }
+
+    @staticmethod
+    def encode_manifest(manifest: dict) -> bytes:
+        return json.dumps(manifest, separators=(",", ":")).encode()
@@ -0,0 +1,60 @@
+import io
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+class RangedReader(io.RawIOBase):
+    # Reads an object through parallel ranged requests. Parts are returned in order, with up to
+    # two parts per worker in flight, so memory stays bounded however large the object is.
+
+    def __init__(self, fetch_range: Callable[[int, int], bytes], size: int, part_size: int, workers: int = 1) -> None:
+        super().__init__()
+        self.__fetch_range = fetch_range
+        self.__size = size
+        self.__part_size = part_size
+        self.__window = max(1, workers) * 2
+        self.__pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.__pending: deque[Future] = deque()
+        self.__next_offset = 0
+        self.__buffer = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def __fetch(self, start: int, end: int) -> bytes:
+        data = self.__fetch_range(start, end)
+        if len(data) != end - start + 1:
+            raise RangedReaderError(f"Short read for bytes {start}-{end}: got {len(data)} bytes")
+        return data
+
+    def __fill_window(self):
+        while len(self.__pending) < self.__window and self.__next_offset < self.__size:
+            end = min(self.__next_offset + self.__part_size, self.__size) - 1
+            self.__pending.append(self.__pool.submit(self.__fetch, self.__next_offset, end))
+            self.__next_offset = end + 1
+
+    def readinto(self, buffer) -> int:
+        if not self.__buffer:
+            self.__fill_window()
+            if not self.__pending:
+                return 0
+            self.__buffer = memoryview(self.__pending.popleft().result())
+            self.__fill_window()
+
+        size = min(len(buffer), len(self.__buffer))
+        buffer[:size] = self.__buffer[:size]
+        self.__buffer = self.__buffer[size:]
+        self.bytes_read += size
+        return size
+
+    def close(self):
+        for future in self.__pending:
+            future.cancel()
+        self.__pool.shutdown(wait=True, cancel_futures=True)
+        super().close()
+
+
+class RangedReaderError(Exception):
+    pass
@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import NamedTuple
+
+# Snapshot ids are the timestamps of BackupDestination._timestamp
+_SNAPSHOT_FORMAT = "%Y%m%d-%H%M%S"
+
+class RetentionPolicy(NamedTuple):
+    # Grandfather-father-son: the newest snapshot of each of the last N days/weeks/months is kept
+    daily: int = 0
+    weekly: int = 0
+    monthly: int = 0
+    dry_run: bool = False
+
+class PruneReport(NamedTuple):
+    backup_name: str
+    kept: list[str]
+    deleted: list[str]
+    objects: int
+    bytes: int
+    dry_run: bool
+
+def _parse_snapshot(snapshot: str) -> datetime | None:
+    try:
+        return datetime.strptime(snapshot, _SNAPSHOT_FORMAT)
+    except ValueError:
+        return None
+
+def select_snapshots(snapshots: list[str], policy: RetentionPolicy) -> tuple[list[str], list[str]]:
+    # Returns (keep, delete). The newest snapshot and snapshots with unknown id format are always kept.
+    dated = sorted(((date, snapshot) for snapshot in snapshots if (date := _parse_snapshot(snapshot))), reverse=True)
+    keep = {snapshot for snapshot in snapshots if _parse_snapshot(snapshot) is None}
+    if dated:
+        keep.add(dated[0][1])
+
+    buckets = [
+        (policy.daily, lambda date: date.date()),
+        (policy.weekly, lambda date: date.isocalendar()[:2]),
+        (policy.monthly, lambda date: (date.year, date.month))
+    ]
+    for count, period in buckets:
+        seen = set()
+        for date, snapshot in dated:
+            if len(seen) >= count:
+                break
+            if period(date) not in seen:
+                seen.add(period(date))
+                keep.add(snapshot)
+
+    return sorted(keep), sorted(snapshot for snapshot in snapshots if snapshot not in keep)
@@ -0,0 +1,163 @@
+import io
+import base64
+import random
+import hashlib
+import threading
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+# Limits of S3 multipart uploads, GCS XML multipart uploads share them
+_MIN_PART_SIZE = 5 * 1024 * 1024
+_MAX_PARTS = 10000
+
+class TransferConf(NamedTuple):
+    # Files larger than a part are uploaded as parallel multipart uploads, if the backend supports them
+    part_size_mb: int = 32
+    # Attempts per request, retryable errors are retried with exponential backoff and full jitter
+    attempts: int = 5
+    backoff_s: float = 0.5
+    max_backoff_s: float = 30.0
+
+def part_size(size: int, conf: TransferConf) -> int:
+    # Configured part size, raised in MiB steps for files that would need more than _MAX_PARTS parts
+    mib = 1024 * 1024
+    minimum = -(size // -_MAX_PARTS)
+    return max(_MIN_PART_SIZE, conf.part_size_mb * mib, -(minimum // -mib) * mib)
+
+def part_ranges(size: int, part_size: int) -> list[tuple[int, int]]:
+    # (offset, length) of every part, an empty file is a single empty part
+    return [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)] or [(0, 0)]
+
+def backoff_delay(attempt: int, conf: TransferConf) -> float:
+    return random.uniform(0, min(conf.max_backoff_s, conf.backoff_s * 2 ** attempt))
+
+def content_md5(data: bytes) -> str:
+    # Base64 MD5 as in the Content-MD5 header, storage services reject a body that doesn't match
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+class MultipartWriter(io.RawIOBase):
+    # Upload stream on top of the multipart calls of a backend: full parts are uploaded in the
+    # background, at most two per worker in flight (and at most as many as slots across writers).
+    # A stream that fits into one part is sent with a single request instead. Nothing is
+    # committed unless the writer is closed without an error.
+    # Resuming: upload_id and the parts stored so far continue an interrupted upload with the
+    # remaining data; on_parts is called whenever the stored prefix of parts grows. A resumable
+    # writer leaves the upload open on errors instead of aborting it.
+
+    def __init__(self,
+                 put_single: Callable[[bytes], None],
+                 begin: Callable[[], str],
+                 put_part: Callable[[str, int, bytes], str],
+                 complete: Callable[[str, list[str]], None],
+                 abort: Callable[[str], None],
+                 part_size: int,
+                 workers: int = 1,
+                 slots: threading.Semaphore | None = None,
+                 upload_id: str | None = None,
+                 parts: list[str] | None = None,
+                 on_parts: Callable[[str, list[str]], None] | None = None,
+                 resumable: bool = False) -> None:
+        super().__init__()
+        self.__put_single = put_single
+        self.__begin = begin
+        self.__put_part = put_part
+        self.__complete = complete
+        self.__abort = abort
+        self.__part_size = part_size
+        self.__workers = max(1, workers)
+        self.__slots = slots
+        self.__on_parts = on_parts
+        self.__resumable = resumable
+
+        self.__buffer = bytearray()
+        self.__upload_id = upload_id
+        self.__pool: ThreadPoolExecutor | None = None
+        self.__pending: deque[Future] = deque()
+        self.__parts: list[str] = list(parts or [])
+        self.__failed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.__buffer += data
+        # Strictly more than a part buffered, so the last part is never empty
+        while len(self.__buffer) > self.__part_size:
+            self.__submit(bytes(self.__buffer[:self.__part_size]))
+            del self.__buffer[:self.__part_size]
+        return len(data)
+
+    def __submit(self, data: bytes):
+        if self.__upload_id is None:
+            self.__upload_id = self.__begin()
+            self.__report_parts()
+        if self.__pool is None:
+            self.__pool = ThreadPoolExecutor(max_workers=self.__workers)
+        self.__collect(len(self.__pending) - self.__workers * 2 + 1)
+        part_number = len(self.__parts) + len(self.__pending) + 1
+        if self.__slots is not None:
+            self.__slots.acquire()
+        future = self.__pool.submit(self.__put_part, self.__upload_id, part_number, data)
+        if self.__slots is not None:
+            future.add_done_callback(lambda _: self.__slots.release())  # type: ignore[union-attr]
+        self.__pending.append(future)
+
+    def __collect(self, wait: int = 0):
+        # Moves finished parts from the front of the queue, waiting for at least the first `wait` of them
+        collected = False
+        while self.__pending and (wait > 0 or self.__pending[0].done()):
+            self.__parts.append(self.__pending.popleft().result())
+            wait -= 1
+            collected = True
+        if collected:
+            self.__report_parts()
+
+    def __report_parts(self):
+        if self.__on_parts is not None and self.__upload_id is not None:
+            self.__on_parts(self.__upload_id, list(self.__parts))
+
+    def close(self):
+        if self.closed:
+            return
+        if self.__failed:
+            super().close()
+            return
+        try:
+            if self.__upload_id is None:
+                self.__put_single(bytes(self.__buffer))
+            else:
+                # A resumed upload may already hold every part
+                if self.__buffer or not self.__parts:
+                    self.__submit(bytes(self.__buffer))
+                self.__collect(len(self.__pending))
+                self.__complete(self.__upload_id, self.__parts)
+        except BaseException:
+            self.abort()
+            raise
+        self.__shutdown()
+        super().close()
+
+    def abort(self):
+        # Drops the upload, e.g. when the producer of the stream failed
+        if self.closed or self.__failed:
+            return
+        self.__failed = True
+        self.__shutdown()
+        if self.__upload_id is not None and not self.__resumable:
+            try:
+                self.__abort(self.__upload_id)
+            except Exception as e:
+                print(f"Failed to abort multipart upload {self.__upload_id}: {e}")
+        super().close()
+
+    def __shutdown(self):
+        self.__buffer.clear()
+        if self.__pool:
+            self.__pool.shutdown(wait=True, cancel_futures=True)
+
+    def __del__(self):
+        # A writer that was never closed explicitly is not committed
+        self.abort()
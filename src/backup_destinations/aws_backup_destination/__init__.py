@@ -0,0 +1,14 @@
+from .aws_backup_destination import AWSBackupDestination, AWSBackupDestinationConfig
+from .._backup_destination import DestinationType
+
+def parse_conf(data: dict) -> AWSBackupDestinationConfig:
+    return AWSBackupDestinationConfig(
+        bucket_name=data["aws_bucket_name"],
+        access_key_id=data["aws_access_key_id"],
+        secret_access_key=data["aws_secret_access_key"],
+        region=data.get("aws_region", "us-east-1"),
+        endpoint_url=data.get("aws_endpoint_url", ""),
+        storage_class=data.get("aws_storage_class", "")
+    )
+
+DESTINATION_TYPE = DestinationType(parse_conf, AWSBackupDestination)
\ No newline at end of file
@@ -0,0 +1,180 @@
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, NamedTuple
+from pathlib import Path
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+except ImportError:
+    boto3 = None
+
+from .._backup_destination import BackupDestination, TransferConf
+from .._backup_destination.transfer import content_md5
+
+# Error codes worth another attempt: throttling and transient server errors
+_RETRYABLE_CODES = {"SlowDown", "Throttling", "RequestTimeout", "RequestTimeTooSkewed", "InternalError", "ServiceUnavailable", "500", "502", "503", "504"}
+
+class AWSBackupDestinationConfig(NamedTuple):
+    bucket_name: str
+    access_key_id: str
+    secret_access_key: str
+    region: str = "us-east-1"
+    # S3-compatible services (MinIO, Ceph RGW, R2, ...), empty for AWS itself
+    endpoint_url: str = ""
+    # e.g. STANDARD_IA or GLACIER_IR, empty for the bucket default
+    storage_class: str = ""
+
+class AWSBackupDestination(BackupDestination):
+    _multipart = True
+    _checksum = "etag"
+
+    def __init__(self, conf_dir: Path, backup_dir: Path, conf: AWSBackupDestinationConfig, workers: int = 1, transfer: TransferConf = TransferConf()) -> None:
+        super().__init__(conf_dir, backup_dir, conf, workers, transfer)
+
+        if boto3 is None:
+            raise AWSBackupDestinationError("The aws destination needs boto3, install it with 'pip install boto3'")
+
+        self.__bucket_name = conf.bucket_name
+        self.__extra = {"StorageClass": conf.storage_class} if conf.storage_class else {}
+
+        # Clients are thread-safe, one keep-alive pool for all upload threads; botocore's own retries
+        # are off, the transfer core retries with the attempts of the transfer conf
+        self.__client = boto3.session.Session().client(
+            "s3",
+            aws_access_key_id=conf.access_key_id,
+            aws_secret_access_key=conf.secret_access_key,
+            region_name=conf.region,
+            endpoint_url=conf.endpoint_url or None,
+            config=Config(max_pool_connections=max(10, self._workers * 2), retries={"max_attempts": 1, "mode": "standard"})
+        )
+
+    def _download_file(self, file_name: str, target_path: Path):
+        self.__client.download_file(self.__bucket_name, file_name, str(target_path))
+
+        print(f"Object {file_name} downloaded to {target_path.name}.")
+
+    def _upload_data(self, data: bytes, target_path: str):
+        self.__client.put_object(Bucket=self.__bucket_name, Key=target_path, Body=data, ContentMD5=content_md5(data), **self.__extra)
+
+    def _list_files(self, prefix: str) -> list[str]:
+        paginator = self.__client.get_paginator("list_objects_v2")
+        return [item["Key"] for page in paginator.paginate(Bucket=self.__bucket_name, Prefix=prefix) for item in page.get("Contents", [])]
+
+    def _get_size(self, source_path: str) -> int:
+        try:
+            return self.__client.head_object(Bucket=self.__bucket_name, Key=source_path)["ContentLength"]
+        except ClientError as e:
+            if self.__is_not_found(e):
+                raise FileNotFoundError(f"s3://{self.__bucket_name}/{source_path} does not exist")
+            raise
+
+    def _download_range(self, source_path: str, start: int, end: int) -> bytes:
+        response = self.__client.get_object(Bucket=self.__bucket_name, Key=source_path, Range=f"bytes={start}-{end}")
+        return response["Body"].read()
+
+    def _download_data(self, source_path: str) -> bytes:
+        return self.__client.get_object(Bucket=self.__bucket_name, Key=source_path)["Body"].read()
+
+    def _delete_files(self, paths: list[str]):
+        # One DeleteObjects request per batch
+        response = self._retry(lambda: self.__client.delete_objects(
+            Bucket=self.__bucket_name,
+            Delete={"Objects": [{"Key": path} for path in paths], "Quiet": True}
+        ))
+        # Keys that are already gone count as deleted, anything else is a failure of the batch
+        errors = [error for error in response.get("Errors", []) if error.get("Code") != "NoSuchKey"]
+        if errors:
+            report = ", ".join(f"{error['Key']}: {error.get('Code')}" for error in errors[:10])
+            raise AWSBackupDestinationError(f"{len(errors)} object(s) could not be deleted: {report}")
+
+    def _remote_checksum(self, source_path: str) -> tuple[int, str | None]:
+        try:
+            response = self.__client.head_object(Bucket=self.__bucket_name, Key=source_path)
+        except ClientError as e:
+            if self.__is_not_found(e):
+                raise FileNotFoundError(f"s3://{self.__bucket_name}/{source_path} does not exist")
+            raise
+        # With SSE-KMS (and SSE-C) the ETag isn't derived from the MD5 of the content
+        if response.get("ServerSideEncryption") == "aws:kms" or response.get("SSECustomerAlgorithm"):
+            return response["ContentLength"], None
+        return response["ContentLength"], response["ETag"].strip('"')
+
+    def _get_generation(self, source_path: str) -> str | int:
+        # The ETag of the object, conditional writes compare against it
+        try:
+            return self.__client.head_object(Bucket=self.__bucket_name, Key=source_path)["ETag"]
+        except ClientError as e:
+            if self.__is_not_found(e):
+                return 0
+            raise
+
+    def _read_versioned(self, source_path: str) -> tuple[bytes | None, str | int]:
+        try:
+            response = self.__client.get_object(Bucket=self.__bucket_name, Key=source_path)
+        except ClientError as e:
+            if self.__is_not_found(e):
+                return None, 0
+            raise
+        # Body and ETag come from the same response and therefore belong together
+        return response["Body"].read(), response["ETag"]
+
+    def _write_versioned(self, data: bytes, target_path: str, generation: str | int) -> str | int | None:
+        # Conditional write, the S3 counterpart of if_generation_match
+        condition = {"IfMatch": generation} if generation else {"IfNoneMatch": "*"}
+        try:
+            response = self.__client.put_object(Bucket=self.__bucket_name, Key=target_path, Body=data,
+                                                ContentMD5=content_md5(data), ContentType="application/json", **condition)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+                return None
+            raise
+        return response["ETag"]
+
+    def _is_retryable(self, e: BaseException) -> bool:
+        if isinstance(e, (BotoConnectionError, ReadTimeoutError)):
+            return True
+        if isinstance(e, ClientError):
+            error = e.response.get("Error", {})
+            status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            return error.get("Code") in _RETRYABLE_CODES or status in (500, 502, 503, 504)
+        return super()._is_retryable(e)
+
+    def _multipart_begin(self, target_path: str) -> str:
+        return self.__client.create_multipart_upload(Bucket=self.__bucket_name, Key=target_path, **self.__extra)["UploadId"]
+
+    def _multipart_put(self, target_path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        response = self.__client.upload_part(Bucket=self.__bucket_name, Key=target_path, UploadId=upload_id,
+                                             PartNumber=part_number, Body=data, ContentMD5=content_md5(data))
+        return response["ETag"]
+
+    def _multipart_complete(self, target_path: str, upload_id: str, parts: list[str]):
+        self.__client.complete_multipart_upload(
+            Bucket=self.__bucket_name,
+            Key=target_path,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": number, "ETag": etag} for number, etag in enumerate(parts, start=1)]}
+        )
+        print(f"Multipart upload of {target_path} completed ({len(parts)} part(s)).")
+
+    def _multipart_abort(self, target_path: str, upload_id: str):
+        self.__client.abort_multipart_upload(Bucket=self.__bucket_name, Key=target_path, UploadId=upload_id)
+
+    @contextmanager
+    def _open_upload_stream(self, target_path: str) -> Iterator[BinaryIO]:
+        # Parts are uploaded while the stream is written, an aborted stream aborts the multipart upload
+        with self._multipart_upload_stream(target_path) as writer:
+            yield writer
+
+        print(f"Stream uploaded to {target_path}.")
+
+
+    #### Helpers ####
+
+
+    def __is_not_found(self, e: ClientError) -> bool:
+        return e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+class AWSBackupDestinationError(Exception):
+    pass
@@ -1 +1,11 @@
-from .gcp_backup_destination import GCPBackupDestination, GCPBackupDestinationConfig
\ No newline at end of file
+from .gcp_backup_destination import GCPBackupDestination, GCPBackupDestinationConfig
+from .._backup_destination import DestinationType
+
+def parse_conf(data: dict) -> GCPBackupDestinationConfig:
+    return GCPBackupDestinationConfig(
+        bucket_name=data["gcp_bucket_name"],
+        svc_key=data["gcp_svc_key"],
+        chunk_size_mb=data.get("gcp_chunk_size_mb", 32)
+    )
+
+DESTINATION_TYPE = DestinationType(parse_conf, GCPBackupDestination)
\ No newline at end of file
@@ -1,64 +1,248 @@
-import os
-import base64
+import hashlib
+import threading
 
-from typing import NamedTuple
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, NamedTuple
 from pathlib import Path
 
-from google.cloud import storage
+import requests
 
-from .._backup_destination import BackupDestination
+from google.api_core.exceptions import GoogleAPICallError, NotFound, PreconditionFailed, from_http_response
+from google.api_core.retry import Retry, if_transient_error
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.cloud.storage.exceptions import InvalidResponse
+from requests.adapters import HTTPAdapter
+
+from backup_utils.credentials import gcp_credentials
+
+from .._backup_destination import BackupDestination, TransferConf
+from .._backup_destination.transfer import content_md5
+
+# Resumable upload chunk size, must be a multiple of 256 KiB
+_STREAM_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Endpoint of the XML API, used for the multipart uploads the JSON API lacks
+_XML_API_URL = "https://storage.googleapis.com"
+
+# Statuses GCS documents as retryable, next to the error types of if_transient_error
+_RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+def _is_transient(e: BaseException) -> bool:
+    if if_transient_error(e) or isinstance(e, (ConnectionError, TimeoutError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(e, GoogleAPICallError):
+        return e.code in _RETRYABLE_STATUS_CODES
+    if isinstance(e, InvalidResponse):
+        return e.response.status_code in _RETRYABLE_STATUS_CODES
+    return False
+
+# OAuth scope of the storage clients, without one the first token refresh fails; cloud-platform
+# (not devstorage.read_write) so the credentials stay shared with the SOPS KMS calls of the account
+_SCOPES = ("https://www.googleapis.com/auth/cloud-platform",)
+
+# Storage clients (and their keep-alive pools) shared by all destinations of the process, per service account
+_clients: dict[str, storage.Client] = {}
+_clients_lock = threading.Lock()
+
+def _authorized_session(svc_key_b64: str, pool_size: int) -> AuthorizedSession:
+    # Credentials (and their access token) are shared with the SOPS KMS calls of the same account
+    session = AuthorizedSession(gcp_credentials(svc_key_b64, _SCOPES))
+    session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
+
+def _get_client(svc_key_b64: str, pool_size: int) -> storage.Client:
+    with _clients_lock:
+        key = hashlib.sha256(svc_key_b64.encode()).hexdigest()
+        if key not in _clients:
+            session = _authorized_session(svc_key_b64, pool_size)
+            _clients[key] = storage.Client(project=session.credentials.project_id, credentials=session.credentials, _http=session)
+        return _clients[key]
 
 class GCPBackupDestinationConfig(NamedTuple):
     svc_key: str
     bucket_name: str
+    chunk_size_mb: int = 32
 
 class GCPBackupDestination(BackupDestination):
+    # Large files go through the XML API multipart upload (parts in parallel, assembled server-side)
+    _multipart = True
+    # Reported for every object, unlike the MD5 which composed and multipart objects lack
+    _checksum = "crc32c"
 
-    def __init__(self, conf_dir: Path, backup_dir: Path, conf: GCPBackupDestinationConfig) -> None:
-        super().__init__(conf_dir, backup_dir, conf)
+    def __init__(self, conf_dir: Path, backup_dir: Path, conf: GCPBackupDestinationConfig, workers: int = 1, transfer: TransferConf | None = None) -> None:
+        super().__init__(conf_dir, backup_dir, conf, workers, transfer or TransferConf(part_size_mb=conf.chunk_size_mb))
 
         self.__bucket_name = conf.bucket_name
-        self.__svc_path = Path(self._conf_dir, ".gcp_svc.json")
+        self.__svc_key = conf.svc_key
 
-        self.__setup_auth(conf.svc_key)
+        self.__bucket: storage.Bucket | None = None
+        # Session of the XML API calls, with a keep-alive pool of its own
+        self.__session: AuthorizedSession | None = None
+        self.__bucket_lock = threading.Lock()
 
-    def __setup_auth(self, svc_key_b64: str):
-        with open(self.__svc_path, "w") as f:
-            svc_key = base64.b64decode(svc_key_b64).decode()
-            f.write(svc_key)
-            os.chmod(self.__svc_path, 0o400)
 
-    def __setup_env(self):
-        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(self.__svc_path)
+    def __pool_size(self) -> int:
+        return max(32, self._workers * self._workers)
 
-    def _upload_file(self, file_path: Path, target_path: str):
-        self.__upload_blob(file_path, target_path)
+    def __get_bucket(self) -> storage.Bucket:
+        # One client and one keep-alive connection pool for the whole run, shared by all upload threads
+        with self.__bucket_lock:
+            if self.__bucket is None:
+                storage_client = _get_client(self.__svc_key, self.__pool_size())
+                self.__bucket = storage_client.bucket(self.__bucket_name)
+            return self.__bucket
+
+    def __get_session(self) -> AuthorizedSession:
+        with self.__bucket_lock:
+            if self.__session is None:
+                self.__session = _authorized_session(self.__svc_key, self.__pool_size())
+            return self.__session
 
     def _download_file(self, file_name: str, target_path: Path):
         return self.__download_blob(file_name, target_path)
-    
 
-    #### Helpers ####
+    def _upload_data(self, data: bytes, target_path: str):
+        # Retried by the transfer core, so every write carries a generation precondition like the
+        # library's conditional retry policy requires: a repeated request can't replace a newer object
+        blob = self.__get_bucket().blob(target_path)
+        try:
+            blob.upload_from_string(data, content_type="application/octet-stream", checksum="md5", if_generation_match=0, retry=None)
+        except PreconditionFailed:
+            # Stored by an interrupted run or by an attempt whose response got lost, replaced pinned to its generation
+            generation = self._get_generation(target_path)
+            blob.upload_from_string(data, content_type="application/octet-stream", checksum="md5", if_generation_match=generation, retry=None)
+
+    def _list_files(self, prefix: str) -> list[str]:
+        bucket = self.__get_bucket()
+        return [blob.name for blob in bucket.client.list_blobs(bucket, prefix=prefix)]
+
+    def _get_size(self, source_path: str) -> int:
+        blob = self.__get_bucket().get_blob(source_path, retry=self.__retry(source_path))
+        if blob is None or blob.size is None:
+            raise FileNotFoundError(f"gs://{self.__bucket_name}/{source_path} does not exist")
+        return blob.size
+
+    def _download_range(self, source_path: str, start: int, end: int) -> bytes:
+        # Ranges can't be checked against the object checksum, the GPG integrity check covers them
+        blob = self.__get_bucket().blob(source_path)
+        return blob.download_as_bytes(start=start, end=end, checksum=None, retry=self.__retry(source_path))
+
+    def _download_data(self, source_path: str) -> bytes:
+        return self.__get_bucket().blob(source_path).download_as_bytes(retry=self.__retry(source_path))
+
+    def _delete_files(self, paths: list[str]):
+        bucket = self.__get_bucket()
+        try:
+            # One HTTP request for the whole batch
+            with bucket.client.batch():
+                for path in paths:
+                    bucket.delete_blob(path)
+        except Exception as e:
+            # A batch fails as a whole if a single call failed (e.g. an object was already gone),
+            # deleting one by one sorts out which ones are really left
+            print(f"Batch delete failed, deleting {len(paths)} object(s) one by one: {e}")
+            for path in paths:
+                try:
+                    # A repeated delete finds nothing, which is ignored
+                    bucket.delete_blob(path, retry=self.__retry(path))
+                except NotFound:
+                    pass
+
+    def _remote_checksum(self, source_path: str) -> tuple[int, str | None]:
+        blob = self.__get_bucket().get_blob(source_path, retry=self.__retry(source_path))
+        if blob is None or blob.size is None:
+            raise FileNotFoundError(f"gs://{self.__bucket_name}/{source_path} does not exist")
+        return blob.size, blob.crc32c
+
+    def _get_generation(self, source_path: str) -> int:
+        blob = self.__get_bucket().get_blob(source_path, retry=self.__retry(source_path))
+        return blob.generation if blob is not None and blob.generation else 0
+
+    def _read_versioned(self, source_path: str) -> tuple[bytes | None, int]:
+        bucket = self.__get_bucket()
+        while True:
+            blob = bucket.get_blob(source_path, retry=self.__retry(source_path))
+            if blob is None:
+                return None, 0
+            try:
+                # Pinned to the generation of the metadata, so content and generation belong together
+                return blob.download_as_bytes(if_generation_match=blob.generation, retry=self.__retry(source_path)), blob.generation
+            except (NotFound, PreconditionFailed):
+                continue
+
+    def _write_versioned(self, data: bytes, target_path: str, generation: int) -> int | None:
+        blob = self.__get_bucket().blob(target_path)
+        try:
+            blob.upload_from_string(data, content_type="application/json", if_generation_match=generation, retry=self.__retry(target_path))
+        except PreconditionFailed:
+            return None
+        return blob.generation
+
+    def _is_retryable(self, e: BaseException) -> bool:
+        return _is_transient(e) or super()._is_retryable(e)
+
+    def _multipart_begin(self, target_path: str) -> str:
+        response = self.__xml_request("POST", target_path, {"uploads": ""})
+        upload_id = ElementTree.fromstring(response.content).findtext("{*}UploadId")
+        if not upload_id:
+            raise GCPBackupDestinationError(f"No upload id in the multipart upload response for {target_path}")
+        return upload_id
+
+    def _multipart_put(self, target_path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        response = self.__xml_request("PUT", target_path, {"partNumber": str(part_number), "uploadId": upload_id},
+                                      data=data, headers={"Content-MD5": content_md5(data)})
+        return response.headers["ETag"]
+
+    def _multipart_complete(self, target_path: str, upload_id: str, parts: list[str]):
+        body = "".join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in enumerate(parts, start=1))
+        self.__xml_request("POST", target_path, {"uploadId": upload_id},
+                           data=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode())
+        print(f"Multipart upload of {target_path} completed ({len(parts)} part(s)).")
+
+    def _multipart_abort(self, target_path: str, upload_id: str):
+        self.__xml_request("DELETE", target_path, {"uploadId": upload_id})
+
+    @contextmanager
+    def _open_upload_stream(self, target_path: str) -> Iterator[BinaryIO]:
+        blob = self.__get_bucket().blob(target_path)
+        # Pinned to the current generation (0: new object), so the library retries the upload
+        generation = self._get_generation(target_path)
+
+        # Only close (and thereby finalize) the resumable upload on success, an aborted
+        # session is discarded by GCS instead of leaving a truncated object behind
+        writer = blob.open("wb", chunk_size=_STREAM_CHUNK_SIZE, ignore_flush=True, if_generation_match=generation, retry=self.__retry(target_path))
+        yield writer
+        writer.close()
+
+        print(f"Stream uploaded to {target_path}.")
 
 
-    def __upload_blob(self, source_file: Path, destination_blob_name: str):
-        self.__setup_env()
+    #### Helpers ####
 
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(self.__bucket_name)
-        blob = bucket.blob(destination_blob_name)
 
-        blob.upload_from_filename(source_file)
+    def __retry(self, path: str) -> Retry:
+        # Library retries of the calls on path, counted in the run metrics and for the file
+        return Retry(predicate=_is_transient, on_error=lambda e: self._count_retry(path=path))
 
-        print(f"File {source_file.name} uploaded to {destination_blob_name}.")
+    def __xml_request(self, method: str, target_path: str, params: dict[str, str], data: bytes | None = None, headers: dict[str, str] | None = None):
+        # Errors are mapped like the JSON API ones, so the same retry predicate applies
+        url = f"{_XML_API_URL}/{self.__bucket_name}/{quote(target_path, safe='')}"
+        response = self.__get_session().request(method, url, params=params, data=data, headers=headers)
+        if not response.ok:
+            raise from_http_response(response)
+        return response
 
     def __download_blob(self, source_blob_name: str, destination_file: Path):
-        self.__setup_env()
-
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(self.__bucket_name)
-        blob = bucket.blob(source_blob_name)
+        blob = self.__get_bucket().blob(source_blob_name)
 
         blob.download_to_filename(destination_file)
 
-        print(f"Blob {source_blob_name} downloaded to {destination_file.name}.")
\ No newline at end of file
+        print(f"Blob {source_blob_name} downloaded to {destination_file.name}.")
+
+
+class GCPBackupDestinationError(Exception):
+    pass
@@ -0,0 +1,10 @@
+from .local_backup_destination import LocalBackupDestination, LocalBackupDestinationConfig
+from .._backup_destination import DestinationType
+
+def parse_conf(data: dict) -> LocalBackupDestinationConfig:
+    return LocalBackupDestinationConfig(
+        path=data["local_path"],
+        fsync=data.get("local_fsync", True)
+    )
+
+DESTINATION_TYPE = DestinationType(parse_conf, LocalBackupDestination)
\ No newline at end of file
@@ -0,0 +1,196 @@
+import os
+import fcntl
+import shutil
+import hashlib
+import threading
+
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, NamedTuple
+from pathlib import Path
+
+from backup_utils.metrics import CountingWriter
+
+from .._backup_destination import BackupDestination, TransferConf
+
+# Read size of the read-back checks
+_READ_SIZE = 8 * 1024 * 1024
+
+# Hashes of written objects kept for their post-upload check, which follows the write right away;
+# chunks are never checked, the oldest entries make room
+_WRITTEN_CACHE_SIZE = 256
+
+class LocalBackupDestinationConfig(NamedTuple):
+    # Directory on a local disk or a mounted network share (NFS, SMB)
+    path: str
+    # fsync every object and its directory before it counts as uploaded
+    fsync: bool = True
+
+class LocalBackupDestination(BackupDestination):
+    # Objects are files below conf.path. Every write goes to a hidden temporary file first, is
+    # read back and compared against the checksum of what was written, and is then renamed into
+    # place, so a crashed run never leaves a truncated object under its final name.
+
+    def __init__(self, conf_dir: Path, backup_dir: Path, conf: LocalBackupDestinationConfig, workers: int = 1, transfer: TransferConf = TransferConf()) -> None:
+        super().__init__(conf_dir, backup_dir, conf, workers, transfer)
+
+        self.__root = Path(conf.path).expanduser().resolve()
+        self.__fsync = conf.fsync
+        self.__root.mkdir(parents=True, exist_ok=True)
+
+        # sha256 of the read-back check of objects just written, by path: (size, mtime_ns, sha256)
+        self.__written: dict[Path, tuple[int, int, str]] = {}
+        self.__written_lock = threading.Lock()
+
+    def _download_file(self, file_name: str, target_path: Path):
+        shutil.copyfile(self.__path(file_name), target_path)
+
+        print(f"File {file_name} copied to {target_path.name}.")
+
+    def _upload_data(self, data: bytes, target_path: str):
+        with self.__open_object(target_path) as target:
+            target.write(data)
+
+    def _list_files(self, prefix: str) -> list[str]:
+        # Same semantics as an object store listing: every file whose path starts with prefix
+        base = self.__path(prefix[:prefix.rfind("/") + 1]) if "/" in prefix else self.__root
+        names = []
+        for directory, dirs, files in os.walk(base):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for file_name in files:
+                if file_name.startswith("."):
+                    continue
+                name = Path(directory, file_name).relative_to(self.__root).as_posix()
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def _get_size(self, source_path: str) -> int:
+        return self.__path(source_path).stat().st_size
+
+    def _download_range(self, source_path: str, start: int, end: int) -> bytes:
+        with open(self.__path(source_path), "rb") as f:
+            return os.pread(f.fileno(), end - start + 1, start)
+
+    def _download_data(self, source_path: str) -> bytes:
+        return self.__path(source_path).read_bytes()
+
+    def _delete_files(self, paths: list[str]):
+        for path in paths:
+            try:
+                self.__path(path).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _remote_checksum(self, source_path: str) -> tuple[int, str | None]:
+        # The "server" is the file system, so the file itself is hashed; right after an upload the
+        # hash of its read-back check is used (once, a later verify reads the file again)
+        path = self.__path(source_path)
+        stat = path.stat()
+        with self.__written_lock:
+            written = self.__written.pop(path, None)
+        if written is not None and written[:2] == (stat.st_size, stat.st_mtime_ns):
+            return stat.st_size, written[2]
+        return stat.st_size, self.__sha256(path)
+
+    def _get_generation(self, source_path: str) -> int:
+        try:
+            return int(self.__generation_path(source_path).read_text() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _read_versioned(self, source_path: str) -> tuple[bytes | None, int]:
+        with self.__lock(source_path):
+            try:
+                data = self.__path(source_path).read_bytes()
+            except FileNotFoundError:
+                return None, 0
+            return data, self._get_generation(source_path)
+
+    def _write_versioned(self, data: bytes, target_path: str, generation: int) -> int | None:
+        # The generation lives in a sidecar file, both are only changed under an exclusive lock
+        # (flock works across processes, on NFS as well with a current client)
+        with self.__lock(target_path):
+            if self._get_generation(target_path) != generation:
+                return None
+            self._upload_data(data, target_path)
+            with self.__open_object(self.__generation_path(target_path).relative_to(self.__root).as_posix()) as f:
+                f.write(str(generation + 1).encode())
+            return generation + 1
+
+    @contextmanager
+    def _open_upload_stream(self, target_path: str) -> Iterator[BinaryIO]:
+        with self.__open_object(target_path) as target:
+            yield target
+
+        print(f"Stream written to {target_path}.")
+
+
+    #### Helpers ####
+
+
+    def __path(self, object_path: str) -> Path:
+        path = (self.__root / object_path).resolve()
+        if path != self.__root and self.__root not in path.parents:
+            raise LocalBackupDestinationError(f"{object_path} is outside of {self.__root}")
+        return path
+
+    def __generation_path(self, object_path: str) -> Path:
+        path = self.__path(object_path)
+        return path.with_name(f".{path.name}.generation")
+
+    @contextmanager
+    def __lock(self, object_path: str) -> Iterator[None]:
+        path = self.__path(object_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_name(f".{path.name}.lock"), "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def __open_object(self, object_path: str) -> Iterator[BinaryIO]:
+        path = self.__path(object_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                yield CountingWriter(f, digest)  # type: ignore[misc]
+                f.flush()
+                if self.__fsync:
+                    os.fsync(f.fileno())
+            self.__verify(tmp_path, digest.hexdigest())
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        stat = path.stat()
+        with self.__written_lock:
+            self.__written[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+            while len(self.__written) > _WRITTEN_CACHE_SIZE:
+                del self.__written[next(iter(self.__written))]
+        if self.__fsync:
+            # The rename itself is only durable once the directory is synced
+            fd = os.open(path.parent, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def __sha256(self, path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while data := f.read(_READ_SIZE):
+                digest.update(data)
+        return digest.hexdigest()
+
+    def __verify(self, path: Path, sha256: str):
+        # Read-back check, catches short writes and corruption on the way to a network share
+        if self.__sha256(path) != sha256:
+            raise LocalBackupDestinationError(f"Checksum mismatch after writing {path.name}")
+
+
+class LocalBackupDestinationError(Exception):
+    pass
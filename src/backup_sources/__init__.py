@@ -1,3 +1,20 @@
-from .dav_backup_source import DavBackupSource, DavBackupSourceConfig
-from .vaultwarden_backup_source import VaultwardenBackupSource, VaultwardenBackupSourceConfig
-from .test_backup_source import TestBackupSource, TestBackupSourceConfig
\ No newline at end of file
+from ._backup_source import BackupSource, AsyncBackupSource, SyncBackupSourceAdapter, SourceType, as_async_source
+
+from backup_utils.registry import TypeRegistry, lazy_exports
+
+# Source types of the configuration, a module is only imported when its type is configured
+SOURCES = TypeRegistry(__name__, "backupster.sources", {
+    "dav": ".dav_backup_source",
+    "vaultwarden": ".vaultwarden_backup_source",
+    "test": ".test_backup_source"
+}, "SOURCE_TYPE")
+
+__getattr__ = lazy_exports(__name__, {
+    "DavBackupSource": ".dav_backup_source",
+    "AsyncDavBackupSource": ".dav_backup_source",
+    "DavBackupSourceConfig": ".dav_backup_source",
+    "VaultwardenBackupSource": ".vaultwarden_backup_source",
+    "VaultwardenBackupSourceConfig": ".vaultwarden_backup_source",
+    "TestBackupSource": ".test_backup_source",
+    "TestBackupSourceConfig": ".test_backup_source"
+})
\ No newline at end of file
@@ -1,6 +1,11 @@
+import asyncio
+
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import NamedTuple
+from typing import Callable, NamedTuple
+
+# Called by async sources with a top-level entry of the backup dir as soon as it is complete
+ArtifactCallback = Callable[[Path], None]
 
 class BackupSource(ABC):
 
@@ -11,4 +16,37 @@ class BackupSource(ABC):
 
     @abstractmethod
     def create_backup(self):
-        pass
\ No newline at end of file
+        pass
+
+class AsyncBackupSource(ABC):
+
+    def __init__(self, work_dir: Path, backup_dir: Path, conf: NamedTuple) -> None:
+        super().__init__()
+        self._work_dir = work_dir
+        self._backup_dir = backup_dir
+
+    @abstractmethod
+    async def create_backup(self, artifact_ready: ArtifactCallback | None = None):
+        pass
+
+class SyncBackupSourceAdapter(AsyncBackupSource):
+    # Runs a blocking source in a worker thread, its artifacts are all reported at the end
+
+    def __init__(self, source: BackupSource) -> None:
+        super().__init__(source._work_dir, source._backup_dir, None)  # type: ignore[arg-type]
+        self.__source = source
+
+    async def create_backup(self, artifact_ready: ArtifactCallback | None = None):
+        await asyncio.to_thread(self.__source.create_backup)
+
+class SourceType(NamedTuple):
+    # What the module of a source type exposes as SOURCE_TYPE, see backup_sources.SOURCES
+    parse_conf: Callable[[dict], NamedTuple]
+    source: type[BackupSource]
+    # Native asyncio implementation for engine: async, if there is one
+    async_source: type[AsyncBackupSource] | None = None
+
+def as_async_source(source: BackupSource | AsyncBackupSource) -> AsyncBackupSource:
+    if isinstance(source, AsyncBackupSource):
+        return source
+    return SyncBackupSourceAdapter(source)
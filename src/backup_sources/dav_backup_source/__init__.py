@@ -1 +1,20 @@
-from .dav_backup_source import DavBackupSource, DavBackupSourceConfig
\ No newline at end of file
+from .dav_backup_source import DavBackupSource, AsyncDavBackupSource, DavBackupSourceConfig
+from .._backup_source import SourceType
+
+def parse_conf(data: dict) -> DavBackupSourceConfig:
+    engine = data.get("engine", "vdirsyncer")
+    if engine not in ("vdirsyncer", "native"):
+        raise ValueError(f"Unknown DAV engine: {engine}")
+    return DavBackupSourceConfig(
+        caldav_url=data["caldav_url"],
+        caldav_username=data["caldav_username"],
+        caldav_password=data["caldav_password"],
+        carddav_url=data["carddav_url"],
+        carddav_username=data["carddav_username"],
+        carddav_password=data["carddav_password"],
+        state_dir=data.get("state_dir", ""),
+        engine=engine,
+        concurrency=data.get("concurrency", 4)
+    )
+
+SOURCE_TYPE = SourceType(parse_conf, DavBackupSource, AsyncDavBackupSource)
\ No newline at end of file
@@ -1,11 +1,29 @@
 import os
+import asyncio
+import shutil
+import hashlib
 import subprocess
+import threading
+import urllib.request
+import xml.etree.ElementTree as ET
 
+from concurrent.futures import ThreadPoolExecutor
 from string import Template
 from typing import NamedTuple
 from pathlib import Path
 
-from .._backup_source import BackupSource
+from .._backup_source import ArtifactCallback, AsyncBackupSource, BackupSource
+from .dav_client import DavClient
+from .native_sync import NativeDavSync
+
+_PROPFIND_BODY = b"""<?xml version="1.0" encoding="utf-8"?>
+<d:propfind xmlns:d="DAV:"><d:prop><d:resourcetype/><d:displayname/></d:prop></d:propfind>"""
+
+# vdirsyncer pairs per top-level directory of the backup, see _files/config.ini.tpl
+_PAIRS = {
+    "contacts": ["contacts_i", "contacts_c"],
+    "calendar": ["calendar_i", "calendar_c"]
+}
 
 class DavBackupSourceConfig(NamedTuple):
     carddav_url: str
@@ -14,6 +32,11 @@ class DavBackupSourceConfig(NamedTuple):
     caldav_url: str
     caldav_username: str
     caldav_password: str
+    state_dir: str = ""
+    # vdirsyncer: the vdirsyncer binary, native: NativeDavSync (no binary, every collection fetched once)
+    engine: str = "vdirsyncer"
+    # Collections the native engine syncs at a time
+    concurrency: int = 4
 
 class DavBackupSource(BackupSource):
 
@@ -22,18 +45,96 @@ class DavBackupSource(BackupSource):
         self.__conf = conf
         self.__files_dir = Path(__file__).parent / "_files"
 
+        # With a state dir the vdirsyncer status and local storages survive between runs,
+        # so sync only fetches items whose ETag changed
+        self.__state_dir = Path(conf.state_dir) if conf.state_dir else None
+
+        # Created on first use, shared by the contacts and calendar syncs
+        self.__native: NativeDavSync | None = None
+        self.__native_lock = threading.Lock()
+
     def create_backup(self):
+        if self.__conf.engine == "native":
+            # Contacts and calendars side by side, their collections share the pool of the engine
+            try:
+                with ThreadPoolExecutor(max_workers=len(_PAIRS)) as pool:
+                    for future in [pool.submit(self._native_sync, name) for name in _PAIRS]:
+                        future.result()
+            finally:
+                self._close_native()
+            return
+
+        needs_discover, fingerprint = self._prepare()
+        if needs_discover:
+            self._discovered(self.__discover(), fingerprint)
+
+        # Sync
+        subprocess.run(
+            ["vdirsyncer", "sync"],
+            env=self._vdir_env(),
+            check=True,
+        )
+
+        for name in _PAIRS:
+            self._copy_state(name)
+
+    def _native_sync(self, name: str):
+        with self.__native_lock:
+            if self.__native is None:
+                status_dir = self.__state_dir / "native" if self.__state_dir else None
+                self.__native = NativeDavSync(self.__data_path(), status_dir, self.__conf.concurrency)
+        url, username, password = (
+            (self.__conf.carddav_url, self.__conf.carddav_username, self.__conf.carddav_password) if name == "contacts" else
+            (self.__conf.caldav_url, self.__conf.caldav_username, self.__conf.caldav_password)
+        )
+        client = DavClient(url, username, password, self.__conf.concurrency)
+        try:
+            self.__native.sync(name, client)
+        finally:
+            client.close()
+        self._copy_state(name)
+
+    def _close_native(self):
+        with self.__native_lock:
+            if self.__native is not None:
+                self.__native.close()
+                print(f"Native DAV sync: {self.__native.fetched_items} item(s) fetched, {self.__native.kept_items} unchanged.")
+                self.__native = None
+
+    def _prepare(self) -> tuple[bool, str | None]:
         self.__create_config()
-        self.__backup()
+        return self.__needs_discover()
+
+    def _vdir_env(self) -> dict:
+        return os.environ | {
+            "VDIRSYNCER_CONFIG": f"{self._work_dir}/config.ini"
+        }
+
+    def _discovered(self, success: bool, fingerprint: str | None):
+        if self.__state_dir and success and fingerprint:
+            (self.__state_dir / "discover.fingerprint").write_text(fingerprint)
+
+    def _copy_state(self, name: str):
+        if not self.__state_dir:
+            return
+        state_path = self.__data_path() / name
+        if state_path.is_dir():
+            shutil.copytree(state_path, self._backup_dir / name, dirs_exist_ok=True)
+
 
-    
     #### Helpers ####
 
 
+    def __vdir_path(self) -> Path:
+        return self.__state_dir if self.__state_dir else self._work_dir
+
+    def __data_path(self) -> Path:
+        return self.__state_dir / "data" if self.__state_dir else self._backup_dir
+
     def __create_config(self):
         d = {
-            'VDIR_PATH': self._work_dir,
-            'BAK_PATH': self._backup_dir,
+            'VDIR_PATH': self.__vdir_path(),
+            'BAK_PATH': self.__data_path(),
             'CARDDAV_URL': self.__conf.carddav_url,
             'CARDDAV_USERNAME': self.__conf.carddav_username,
             'CARDDAV_PASSWORD': self.__conf.carddav_password,
@@ -46,35 +147,143 @@ class DavBackupSource(BackupSource):
             vconfig_tpl = Template(f.read())
             vconfig = vconfig_tpl.substitute(d)
 
+        if self.__state_dir:
+            self.__data_path().mkdir(parents=True, exist_ok=True)
+
         with open(self._work_dir / "config.ini", "w") as f:
             f.write(vconfig)
             os.chmod(f"{self._work_dir}/config.ini", 0o400)
 
-    def __backup(self):
-        # Discover
-        yes_proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
+    def __list_collections(self, url: str, username: str, password: str) -> list[str]:
+        password_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
+        password_mgr.add_password(None, url, username, password)
+        opener = urllib.request.build_opener(urllib.request.HTTPBasicAuthHandler(password_mgr))
 
-        vdir_env = os.environ | {
-            "VDIRSYNCER_CONFIG": f"{self._work_dir}/config.ini"
-        }
+        request = urllib.request.Request(url, data=_PROPFIND_BODY, method="PROPFIND", headers={
+            "Depth": "1",
+            "Content-Type": "application/xml; charset=utf-8"
+        })
+        with opener.open(request, timeout=30) as response:
+            tree = ET.fromstring(response.read())
+
+        collections = []
+        for dav_response in tree.iter("{DAV:}response"):
+            href = dav_response.findtext("{DAV:}href", default="")
+            resource_type = dav_response.find(".//{DAV:}resourcetype")
+            types = sorted(child.tag for child in resource_type) if resource_type is not None else []
+            collections.append(f"{href}|{','.join(types)}")
+        return sorted(collections)
+
+    def __discover_fingerprint(self) -> str | None:
+        digest = hashlib.sha256()
+        with open(self._work_dir / "config.ini", "rb") as f:
+            digest.update(f.read())
+
+        try:
+            for url, username, password in [
+                (self.__conf.carddav_url, self.__conf.carddav_username, self.__conf.carddav_password),
+                (self.__conf.caldav_url, self.__conf.caldav_username, self.__conf.caldav_password)
+            ]:
+                for collection in self.__list_collections(url, username, password):
+                    digest.update(collection.encode())
+        except Exception as e:
+            print(f"Could not list DAV collections, running full discover: {e}")
+            return None
+
+        return digest.hexdigest()
+
+    def __needs_discover(self) -> tuple[bool, str | None]:
+        if not self.__state_dir:
+            return True, None
+
+        fingerprint = self.__discover_fingerprint()
+        fingerprint_file = self.__state_dir / "discover.fingerprint"
+        status_dir = self.__state_dir / "status"
+
+        if fingerprint is None or not fingerprint_file.exists() or not status_dir.is_dir():
+            return True, fingerprint
+        if fingerprint_file.read_text().strip() != fingerprint:
+            return True, fingerprint
+
+        print("DAV collection list unchanged, skipping discover.")
+        return False, fingerprint
+
+    def __discover(self) -> bool:
+        yes_proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
 
         try:
             subprocess.run(
                 ["vdirsyncer", "discover"],
-                env=vdir_env,
+                env=self._vdir_env(),
                 stdin=yes_proc.stdout,
                 check=True
             )
         except subprocess.CalledProcessError as e:
             print(f"Error occurred: {e}")
+            return False
         finally:
             if yes_proc.stdout:
                 yes_proc.stdout.close()
             yes_proc.wait()
+        return True
 
-        # Sync
-        subprocess.run(
-            ["vdirsyncer", "sync"],
-            env=vdir_env,
-            check=True,
-        )
+
+class AsyncDavBackupSource(AsyncBackupSource):
+    # Runs vdirsyncer as asyncio subprocesses and syncs contacts and calendars side by side,
+    # each of them is handed to the pipeline as soon as its own sync finished
+
+    def __init__(self, work_dir: Path, backup_dir: Path, conf: DavBackupSourceConfig) -> None:
+        super().__init__(work_dir, backup_dir, conf)
+        self.__conf = conf
+        self.__dav = DavBackupSource(work_dir, backup_dir, conf)
+
+    async def create_backup(self, artifact_ready: ArtifactCallback | None = None):
+        if self.__conf.engine == "native":
+            try:
+                await asyncio.gather(*(self.__native_sync(name, artifact_ready) for name in _PAIRS))
+            finally:
+                await asyncio.to_thread(self.__dav._close_native)
+            return
+
+        needs_discover, fingerprint = await asyncio.to_thread(self.__dav._prepare)
+        if needs_discover:
+            self.__dav._discovered(await self.__discover(), fingerprint)
+
+        await asyncio.gather(*(self.__sync(name, pairs, artifact_ready) for name, pairs in _PAIRS.items()))
+
+
+    #### Helpers ####
+
+
+    async def __discover(self) -> bool:
+        yes_proc = subprocess.Popen(["yes"], stdout=subprocess.PIPE)
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "vdirsyncer", "discover",
+                env=self.__dav._vdir_env(),
+                stdin=yes_proc.stdout
+            )
+            if await proc.wait() != 0:
+                print(f"Error occurred: vdirsyncer discover returned {proc.returncode}")
+                return False
+        finally:
+            if yes_proc.stdout:
+                yes_proc.stdout.close()
+            yes_proc.wait()
+        return True
+
+    async def __native_sync(self, name: str, artifact_ready: ArtifactCallback | None):
+        await asyncio.to_thread(self.__dav._native_sync, name)
+        if artifact_ready and (self._backup_dir / name).exists():
+            artifact_ready(self._backup_dir / name)
+
+    async def __sync(self, name: str, pairs: list[str], artifact_ready: ArtifactCallback | None):
+        # Every pair has its own status files, so separate vdirsyncer processes don't interfere
+        proc = await asyncio.create_subprocess_exec("vdirsyncer", "sync", *pairs, env=self.__dav._vdir_env())
+        if await proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, ["vdirsyncer", "sync", *pairs])
+
+        await asyncio.to_thread(self.__dav._copy_state, name)
+        if artifact_ready and (self._backup_dir / name).exists():
+            artifact_ready(self._backup_dir / name)
@@ -0,0 +1,206 @@
+import base64
+import queue
+import http.client
+import xml.etree.ElementTree as ET
+
+from typing import NamedTuple
+from urllib.parse import unquote, urljoin, urlsplit
+from xml.sax.saxutils import escape
+
+_DAV = "{DAV:}"
+_CALDAV = "{urn:ietf:params:xml:ns:caldav}"
+_CARDDAV = "{urn:ietf:params:xml:ns:carddav}"
+_ICAL = "{http://apple.com/ns/ical/}"
+
+_NAMESPACES = 'xmlns:d="DAV:" xmlns:c="urn:ietf:params:xml:ns:caldav" xmlns:a="urn:ietf:params:xml:ns:carddav" xmlns:i="http://apple.com/ns/ical/"'
+
+_DISCOVER_BODY = f"""<?xml version="1.0" encoding="utf-8"?>
+<d:propfind {_NAMESPACES}><d:prop><d:resourcetype/><d:current-user-principal/><c:calendar-home-set/><a:addressbook-home-set/></d:prop></d:propfind>""".encode()
+
+_COLLECTIONS_BODY = f"""<?xml version="1.0" encoding="utf-8"?>
+<d:propfind {_NAMESPACES}><d:prop><d:resourcetype/><d:displayname/><c:calendar-description/><i:calendar-color/><i:calendar-order/></d:prop></d:propfind>""".encode()
+
+_ITEMS_BODY = f"""<?xml version="1.0" encoding="utf-8"?>
+<d:propfind {_NAMESPACES}><d:prop><d:resourcetype/><d:getetag/></d:prop></d:propfind>""".encode()
+
+# Connection errors after which a request is sent once more on a new connection, e.g. when
+# the server closed an idle keep-alive connection
+_RECONNECT_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError)
+
+class DavKind(NamedTuple):
+    # Collection type of the resourcetype and the data property/REPORT of its items
+    collection: str
+    data: str
+    multiget: str
+
+CALENDAR = DavKind(f"{_CALDAV}calendar", "c:calendar-data", "c:calendar-multiget")
+ADDRESSBOOK = DavKind(f"{_CARDDAV}addressbook", "a:address-data", "a:addressbook-multiget")
+
+class DavCollection(NamedTuple):
+    href: str
+    # Last segment of the href, the collection name of vdirsyncer's "from b"
+    name: str
+    # displayname, color, description and order, as vdirsyncer's filesystem storage keeps them
+    metadata: dict[str, str]
+
+class DavClient:
+    # Minimal CalDAV/CardDAV client on keep-alive connections (http.client), thread-safe: every
+    # request borrows an idle connection of the pool or opens a new one, at most pool_size stay open
+
+    def __init__(self, url: str, username: str, password: str, pool_size: int = 4, timeout: float = 30) -> None:
+        self.url = url if url.endswith("/") else f"{url}/"
+        parts = urlsplit(self.url)
+        if parts.scheme not in ("http", "https"):
+            raise DavClientError(f"Unsupported DAV URL {url}")
+        self.__scheme = parts.scheme
+        self.__netloc = parts.netloc.rsplit("@", 1)[-1]
+        self.__timeout = timeout
+        self.__auth = "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.__idle: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue(maxsize=max(1, pool_size))
+
+    def close(self):
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def discover(self, kind: DavKind) -> list[DavCollection]:
+        # The URL is a collection, a home set or anything the current-user-principal can be found from
+        responses = self.__propfind(self.url, _DISCOVER_BODY, 0)
+        _, props = responses.get(self.__key(self.url)) or next(iter(responses.values()), ("", {}))
+        if self.__is_collection(props, kind):
+            return [self.__collection(urlsplit(self.url).path, props)]
+
+        home_set = self.__href(props, f"{_CALDAV}calendar-home-set" if kind is CALENDAR else f"{_CARDDAV}addressbook-home-set")
+        principal = self.__href(props, f"{_DAV}current-user-principal")
+        if home_set is None and principal is not None:
+            _, principal_props = next(iter(self.__propfind(principal, _DISCOVER_BODY, 0).values()), ("", {}))
+            home_set = self.__href(principal_props, f"{_CALDAV}calendar-home-set" if kind is CALENDAR else f"{_CARDDAV}addressbook-home-set")
+
+        home = home_set or self.url
+        collections = [self.__collection(href, props) for href, props in self.__propfind(home, _COLLECTIONS_BODY, 1).values() if self.__is_collection(props, kind)]
+        return sorted(collections, key=lambda collection: collection.name)
+
+    def list_items(self, collection: DavCollection) -> dict[str, str]:
+        # href -> ETag of every item of the collection
+        items = {}
+        for href, props in self.__propfind(collection.href, _ITEMS_BODY, 1).values():
+            resource_type = props.get(f"{_DAV}resourcetype")
+            if resource_type is not None and len(resource_type):
+                continue
+            items[href] = self.__text(props, f"{_DAV}getetag")
+        return items
+
+    def multiget(self, collection: DavCollection, kind: DavKind, hrefs: list[str]) -> dict[str, tuple[str, str]]:
+        # href -> (ETag, data) of the requested items, one REPORT; items deleted in the meantime are missing
+        body = (f'<?xml version="1.0" encoding="utf-8"?>\n<{kind.multiget} {_NAMESPACES}><d:prop><d:getetag/><{kind.data}/></d:prop>'
+                + "".join(f"<d:href>{escape(href)}</d:href>" for href in hrefs)
+                + f"</{kind.multiget}>")
+        data_tag = kind.data.replace("c:", _CALDAV).replace("a:", _CARDDAV)
+        responses = self.__multistatus(self.__request("REPORT", collection.href, body.encode(), 1))
+        items = {}
+        for href in hrefs:
+            _, props = responses.get(self.__key(href), ("", {}))
+            data = self.__text(props, data_tag)
+            if data:
+                items[href] = (self.__text(props, f"{_DAV}getetag"), data)
+        return items
+
+
+    #### Helpers ####
+
+
+    def __path(self, href: str) -> str:
+        # Absolute path of an href, quoted as the server reports it
+        return urlsplit(urljoin(self.url, href.strip())).path
+
+    def __key(self, href: str) -> str:
+        # Servers don't agree on how to quote hrefs, they are compared unquoted
+        return unquote(self.__path(href))
+
+    def __text(self, props: dict[str, ET.Element], tag: str) -> str:
+        element = props.get(tag)
+        return element.text or "" if element is not None else ""
+
+    def __href(self, props: dict[str, ET.Element], tag: str) -> str | None:
+        element = props.get(tag)
+        href = element.findtext(f"{_DAV}href") if element is not None else None
+        return href.strip() if href else None
+
+    def __is_collection(self, props: dict[str, ET.Element], kind: DavKind) -> bool:
+        resource_type = props.get(f"{_DAV}resourcetype")
+        return resource_type is not None and resource_type.find(kind.collection) is not None
+
+    def __collection(self, href: str, props: dict[str, ET.Element]) -> DavCollection:
+        metadata = {}
+        for key, tag in (("displayname", f"{_DAV}displayname"), ("description", f"{_CALDAV}calendar-description"),
+                         ("color", f"{_ICAL}calendar-color"), ("order", f"{_ICAL}calendar-order")):
+            element = props.get(tag)
+            if element is not None and element.text:
+                metadata[key] = element.text
+        path = self.__path(href)
+        return DavCollection(path if path.endswith("/") else f"{path}/", unquote(path.rstrip("/").rsplit("/", 1)[-1]), metadata)
+
+    def __propfind(self, href: str, body: bytes, depth: int) -> dict[str, tuple[str, dict[str, ET.Element]]]:
+        return self.__multistatus(self.__request("PROPFIND", href, body, depth))
+
+    def __multistatus(self, data: bytes) -> dict[str, tuple[str, dict[str, ET.Element]]]:
+        # Unquoted path -> (path, {tag: element} of the properties found (status 200)) of every response
+        responses = {}
+        for response in ET.fromstring(data).iter(f"{_DAV}response"):
+            href = response.findtext(f"{_DAV}href")
+            if not href:
+                continue
+            props = {}
+            for propstat in response.iter(f"{_DAV}propstat"):
+                if " 200 " not in f"{propstat.findtext(f'{_DAV}status', default='')} ":
+                    continue
+                for prop in propstat.iter(f"{_DAV}prop"):
+                    props.update({child.tag: child for child in prop})
+            responses[self.__key(href)] = (self.__path(href), props)
+        return responses
+
+    def __connection(self) -> http.client.HTTPConnection:
+        try:
+            return self.__idle.get_nowait()
+        except queue.Empty:
+            connection_type = http.client.HTTPSConnection if self.__scheme == "https" else http.client.HTTPConnection
+            return connection_type(self.__netloc, timeout=self.__timeout)
+
+    def __release(self, connection: http.client.HTTPConnection):
+        try:
+            self.__idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def __request(self, method: str, href: str, body: bytes, depth: int) -> bytes:
+        path = self.__path(href)
+        headers = {"Authorization": self.__auth, "Depth": str(depth), "Content-Type": "application/xml; charset=utf-8"}
+        connection = self.__connection()
+        for attempt in range(2):
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except _RECONNECT_ERRORS:
+                # http.client opens a new connection with the next request
+                connection.close()
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                connection.close()
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        self.__release(connection)
+        if response.status != 207:
+            raise DavClientError(f"{method} {path} returned {response.status} {response.reason}")
+        return data
+
+
+class DavClientError(Exception):
+    pass
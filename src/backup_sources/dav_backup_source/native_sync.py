@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import unquote
+
+from .dav_client import ADDRESSBOOK, CALENDAR, DavClient, DavCollection, DavKind
+
+# Items per calendar-multiget/addressbook-multiget REPORT
+_MULTIGET_BATCH = 100
+
+# Characters vdirsyncer's filesystem storage keeps in file names
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.@+-]")
+
+class _Output(NamedTuple):
+    kind: DavKind
+    extension: str
+    # Directories of the per-item and the single-file output, as the vdirsyncer pairs name them
+    items_dir: str
+    single_dir: str
+
+_OUTPUTS = {
+    "contacts": _Output(ADDRESSBOOK, ".vcf", "contacts_i", "contacts_c"),
+    "calendar": _Output(CALENDAR, ".ics", "calendar_i", "calendar_c")
+}
+
+def _item_file_name(href: str, extension: str) -> str:
+    # Last segment of the href; names that had to be changed get a hash, so they can't collide
+    name = unquote(href.rstrip("/").rsplit("/", 1)[-1])
+    if name.endswith(extension):
+        name = name[:-len(extension)]
+    safe = _UNSAFE_CHARS.sub("_", name)
+    if safe != name or not safe or safe.startswith("."):
+        safe = f"{safe.lstrip('.')[:64]}-{hashlib.sha256(href.encode()).hexdigest()[:16]}"
+    return f"{safe}{extension}"
+
+def _lines(data: str) -> list[str]:
+    return [line for line in data.replace("\r\n", "\n").split("\n") if line]
+
+def join_vcards(items: list[str]) -> str:
+    return "".join("\r\n".join(_lines(item)) + "\r\n" for item in items)
+
+def join_calendars(items: list[str]) -> str:
+    # One VCALENDAR with the properties of the first item and the components of all of them,
+    # time zones only once, like vdirsyncer's singlefile storage
+    properties: list[str] = []
+    timezones: dict[str, list[str]] = {}
+    components: list[str] = []
+
+    for index, item in enumerate(items):
+        depth = 0
+        component: list[str] = []
+        for line in _lines(item):
+            upper = line.upper()
+            if depth == 0:
+                if upper.startswith("BEGIN:VCALENDAR"):
+                    depth = 1
+                continue
+            if depth == 1:
+                if upper.startswith("END:VCALENDAR"):
+                    depth = 0
+                elif upper.startswith("BEGIN:"):
+                    depth = 2
+                    component = [line]
+                elif index == 0:
+                    properties.append(line)
+                continue
+            component.append(line)
+            if upper.startswith("BEGIN:"):
+                depth += 1
+            elif upper.startswith("END:"):
+                depth -= 1
+                if depth == 1:
+                    if component[0].upper() == "BEGIN:VTIMEZONE":
+                        tzid = next((l.split(":", 1)[1] for l in component if l.upper().startswith("TZID")), "")
+                        timezones.setdefault(tzid, component)
+                    else:
+                        components.extend(component)
+
+    body = properties + [line for component in timezones.values() for line in component] + components
+    return "\r\n".join(["BEGIN:VCALENDAR"] + body + ["END:VCALENDAR"]) + "\r\n"
+
+class NativeDavSync:
+    # Native engine of the DAV source: every collection is fetched once (an item listing, then
+    # multiget REPORTs) and written both as one file per item (<name>_i/<collection>/) and as one
+    # file per collection (<name>_c/<collection>.<ext>), the layout of the vdirsyncer pairs.
+    # Collections of all calls are synced in one pool, at most concurrency at a time. With a
+    # status dir only items whose ETag changed are fetched, the others are kept in data_dir.
+
+    def __init__(self, data_dir: Path, status_dir: Path | None = None, concurrency: int = 4) -> None:
+        self.__data_dir = data_dir
+        self.__status_dir = status_dir
+        self.__pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="dav")
+        self.__lock = threading.Lock()
+        self.fetched_items = 0
+        self.kept_items = 0
+
+    def close(self):
+        self.__pool.shutdown(wait=True, cancel_futures=True)
+
+    def sync(self, name: str, client: DavClient):
+        output = _OUTPUTS[name]
+        collections = client.discover(output.kind)
+        items_dir = self.__data_dir / name / output.items_dir
+        single_dir = self.__data_dir / name / output.single_dir
+
+        futures = [self.__pool.submit(self.__sync_collection, name, output, client, collection) for collection in collections]
+        for future in futures:
+            future.result()
+
+        # Collections deleted on the server
+        names = {collection.name for collection in collections}
+        for path in items_dir.iterdir() if items_dir.is_dir() else []:
+            if path.is_dir() and path.name not in names:
+                shutil.rmtree(path)
+        for path in single_dir.iterdir() if single_dir.is_dir() else []:
+            if path.is_file() and path.name[:-len(output.extension)] not in names:
+                path.unlink()
+
+        print(f"Synced {len(collections)} {name} collection(s) natively.")
+
+
+    #### Helpers ####
+
+
+    def __sync_collection(self, name: str, output: _Output, client: DavClient, collection: DavCollection):
+        collection_dir = self.__data_dir / name / output.items_dir / collection.name
+        collection_dir.mkdir(parents=True, exist_ok=True)
+        status = self.__read_status(name, collection)
+
+        items = client.list_items(collection)
+        files = {href: _item_file_name(href, output.extension) for href in items}
+        changed = [href for href, etag in items.items()
+                   if status.get(href) != etag or not (collection_dir / files[href]).is_file()]
+
+        fetched: dict[str, str] = {}
+        for start in range(0, len(changed), _MULTIGET_BATCH):
+            for href, (etag, data) in client.multiget(collection, output.kind, changed[start:start + _MULTIGET_BATCH]).items():
+                (collection_dir / files[href]).write_text(data, newline="")
+                items[href] = etag or items[href]
+                fetched[href] = data
+
+        # Items the server listed but didn't return were deleted in between
+        for href in set(changed) - set(fetched):
+            items.pop(href)
+        current = {files[href] for href in items}
+        for path in collection_dir.iterdir():
+            if path.suffix == output.extension and path.name not in current:
+                path.unlink()
+
+        for key, value in collection.metadata.items() if output.kind is CALENDAR else []:
+            (collection_dir / key).write_text(value)
+
+        # The single file is joined from the same data, unchanged items are read back from their files
+        datas = [fetched[href] if href in fetched else (collection_dir / files[href]).read_text() for href in sorted(items, key=files.get)]
+        joined = join_calendars(datas) if output.kind is CALENDAR else join_vcards(datas)
+        single_path = self.__data_dir / name / output.single_dir / f"{collection.name}{output.extension}"
+        single_path.parent.mkdir(parents=True, exist_ok=True)
+        single_path.write_text(joined, newline="")
+
+        self.__write_status(name, collection, items)
+        with self.__lock:
+            self.fetched_items += len(fetched)
+            self.kept_items += len(items) - len(fetched)
+
+    def __status_path(self, name: str, collection: DavCollection) -> Path | None:
+        if self.__status_dir is None:
+            return None
+        return self.__status_dir / name / f"{hashlib.sha256(collection.href.encode()).hexdigest()[:16]}.json"
+
+    def __read_status(self, name: str, collection: DavCollection) -> dict[str, str]:
+        # href -> ETag of the items in data_dir
+        path = self.__status_path(name, collection)
+        if path is None:
+            return {}
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __write_status(self, name: str, collection: DavCollection, items: dict[str, str]):
+        path = self.__status_path(name, collection)
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(items, f)
+        os.replace(tmp_path, path)
@@ -1 +1,7 @@
-from .test_backup_source import TestBackupSource, TestBackupSourceConfig
\ No newline at end of file
+from .test_backup_source import TestBackupSource, TestBackupSourceConfig
+from .._backup_source import SourceType
+
+def parse_conf(data: dict) -> TestBackupSourceConfig:
+    return TestBackupSourceConfig()
+
+SOURCE_TYPE = SourceType(parse_conf, TestBackupSource)
\ No newline at end of file
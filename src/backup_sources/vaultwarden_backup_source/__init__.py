@@ -1 +1,17 @@
-from .vaultwarden_backup_source import VaultwardenBackupSource, VaultwardenBackupSourceConfig
\ No newline at end of file
+from .vaultwarden_backup_source import VaultwardenBackupSource, VaultwardenBackupSourceConfig
+from .keepass_builder import KeepassBuilder
+from .._backup_source import SourceType
+
+def parse_conf(data: dict) -> VaultwardenBackupSourceConfig:
+    return VaultwardenBackupSourceConfig(
+        url=data["vw_url"],
+        client_id=data["vw_client_id"],
+        client_secret=data["vw_client_secret"],
+        password=data["vw_password"],
+        snapshot=data.get("vw_snapshot", False),
+        attachments=data.get("vw_attachments", False),
+        attachment_workers=data.get("vw_attachment_workers", 8),
+        attachment_attempts=data.get("vw_attachment_attempts", 3)
+    )
+
+SOURCE_TYPE = SourceType(parse_conf, VaultwardenBackupSource)
\ No newline at end of file
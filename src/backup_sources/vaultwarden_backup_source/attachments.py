@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import time
+import random
+import socket
+import threading
+import subprocess
+import http.client
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple
+from urllib.parse import quote
+
+# Chunk size attachments are streamed to disk with
+_CHUNK_SIZE = 1024 * 1024
+
+# Seconds between two progress lines
+_PROGRESS_INTERVAL_S = 5.0
+
+# Characters that can't be part of a file name in the backup tree
+_UNSAFE_CHARS = re.compile(r"[/\\\x00-\x1f]")
+
+class Attachment(NamedTuple):
+    item_id: str
+    attachment_id: str
+    file_name: str
+    size: int
+
+def attachments_of(items: Iterable[dict]) -> list[Attachment]:
+    attachments = []
+    for item in items:
+        for attachment in item.get("attachments") or []:
+            attachments.append(Attachment(item["id"], attachment["id"], attachment.get("fileName") or attachment["id"], int(attachment.get("size") or 0)))
+    return attachments
+
+def attachment_path(target_dir: Path, attachment: Attachment) -> Path:
+    # <item id>/<attachment id>_<file name>, the id keeps attachments with the same name apart
+    name = _UNSAFE_CHARS.sub("_", attachment.file_name).lstrip(".") or "attachment"
+    return target_dir / attachment.item_id / f"{attachment.attachment_id}_{name}"
+
+class BwServe:
+    # `bw serve` on a free local port: one Node process on the unlocked session answers all requests,
+    # instead of one `bw get attachment` process (and vault decryption) per file.
+    # Every thread keeps its own keep-alive connection.
+
+    def __init__(self, bw_path: str, session: str, env: dict[str, str], log_path: Path, timeout: float = 60) -> None:
+        self.__port = self.__free_port()
+        self.__timeout = timeout
+        self.__local = threading.local()
+        self.__connections: list[http.client.HTTPConnection] = []
+        self.__lock = threading.Lock()
+
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.__log_path = log_path
+        with open(log_path, "wb") as log:
+            self.__proc = subprocess.Popen(
+                [bw_path, "serve", "--hostname", "127.0.0.1", "--port", str(self.__port)],
+                stdout=log, stderr=subprocess.STDOUT, env={**env, "BW_SESSION": session}
+            )
+        try:
+            self.__wait_ready()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self.__lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections.clear()
+        if self.__proc.poll() is None:
+            self.__proc.terminate()
+            try:
+                self.__proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.__proc.kill()
+                self.__proc.wait()
+
+    def get(self, path: str) -> http.client.HTTPResponse:
+        # The response has to be read completely before the thread sends its next request
+        connection = self.__connection()
+        try:
+            connection.request("GET", path)
+            return connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # Opened again with the next request
+            connection.close()
+            raise
+
+    def get_json(self, path: str):
+        # data of a {"success": ..., "data": ...} answer of the API
+        response = self.get(path)
+        body = response.read()
+        try:
+            answer = json.loads(body)
+        except ValueError:
+            answer = {}
+        if response.status != 200 or not answer.get("success"):
+            raise AttachmentError(f"GET {path} returned {response.status}: {answer.get('message') or body[:200]!r}")
+        return answer.get("data")
+
+    def discard(self):
+        # Closes the connection of the calling thread, e.g. after a response broke off
+        connection = getattr(self.__local, "connection", None)
+        if connection is not None:
+            connection.close()
+
+
+    #### Helpers ####
+
+
+    def __free_port(self) -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def __connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection("127.0.0.1", self.__port, timeout=self.__timeout)
+            self.__local.connection = connection
+            with self.__lock:
+                self.__connections.append(connection)
+        return connection
+
+    def __wait_ready(self):
+        deadline = time.monotonic() + self.__timeout
+        while True:
+            if self.__proc.poll() is not None:
+                raise AttachmentError(f"bw serve exited with {self.__proc.returncode}: {self.__log_path.read_text(errors='replace').strip()}")
+            try:
+                response = self.get("/status")
+                response.read()
+                if response.status == 200:
+                    return
+            except (http.client.HTTPException, OSError):
+                pass
+            if time.monotonic() > deadline:
+                raise AttachmentError(f"bw serve didn't start within {self.__timeout}s")
+            time.sleep(0.2)
+
+class AttachmentDownloader:
+    # Downloads attachments through BwServe with a bounded pool, each one streamed into its file
+    # and retried on its own. on_done is called in the calling thread, in completion order.
+
+    def __init__(self, serve: BwServe, target_dir: Path, workers: int = 8, attempts: int = 3, backoff_s: float = 1.0) -> None:
+        self.__serve = serve
+        self.__target_dir = target_dir
+        self.__workers = max(1, workers)
+        self.__attempts = max(1, attempts)
+        self.__backoff_s = backoff_s
+        self.__lock = threading.Lock()
+        self.downloaded_bytes = 0
+        self.retries = 0
+
+    def download(self, attachments: list[Attachment], on_done: Callable[[Attachment, Path], None] | None = None):
+        failures: list[tuple[Attachment, BaseException]] = []
+        total_bytes = sum(attachment.size for attachment in attachments)
+        done = 0
+        last_progress = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix="bw-attachment") as pool:
+            futures = {pool.submit(self.__download, attachment): attachment for attachment in attachments}
+            try:
+                for future in as_completed(futures):
+                    attachment = futures[future]
+                    try:
+                        path = future.result()
+                    except Exception as e:
+                        failures.append((attachment, e))
+                        continue
+
+                    done += 1
+                    if on_done is not None:
+                        on_done(attachment, path)
+                    if time.monotonic() - last_progress >= _PROGRESS_INTERVAL_S or done == len(attachments):
+                        last_progress = time.monotonic()
+                        print(f"Downloaded {done}/{len(attachments)} attachments, {self.downloaded_bytes / 2**20:.1f}/{total_bytes / 2**20:.1f} MiB")
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        if failures:
+            for attachment, e in failures:
+                print(f"Failed to download attachment {attachment.file_name} ({attachment.attachment_id}) of item {attachment.item_id}: {e}")
+            raise AttachmentError(f"{len(failures)} of {len(attachments)} attachments couldn't be downloaded")
+
+
+    #### Helpers ####
+
+
+    def __download(self, attachment: Attachment) -> Path:
+        path = attachment_path(self.__target_dir, attachment)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        request_path = f"/object/attachment/{quote(attachment.attachment_id, safe='')}?itemid={quote(attachment.item_id, safe='')}"
+
+        attempt = 0
+        while True:
+            try:
+                response = self.__serve.get(request_path)
+                if response.status != 200:
+                    message = response.read().decode(errors="replace")
+                    error = AttachmentError(f"status {response.status}: {message}")
+                    # Client errors won't go away with another attempt
+                    if 400 <= response.status < 500 and response.status != 429:
+                        raise error
+                    raise _RetryableError(error)
+
+                size = 0
+                with open(tmp_path, "wb") as f:
+                    while chunk := response.read(_CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, path)
+                self.__count(size)
+                return path
+            except (_RetryableError, http.client.HTTPException, OSError) as e:
+                tmp_path.unlink(missing_ok=True)
+                self.__serve.discard()
+                attempt += 1
+                if attempt == self.__attempts:
+                    raise (e.args[0] if isinstance(e, _RetryableError) else e)
+                self.__count(0, retry=True)
+                # Full jitter, so the workers don't retry in lockstep
+                time.sleep(random.uniform(0, self.__backoff_s * 2 ** (attempt - 1)))
+
+    def __count(self, size: int, retry: bool = False):
+        with self.__lock:
+            self.downloaded_bytes += size
+            self.retries += int(retry)
+
+class _RetryableError(Exception):
+    pass
+
+class AttachmentError(Exception):
+    pass
@@ -0,0 +1,87 @@
+import codecs
+import json
+
+from typing import Any, BinaryIO, Iterator
+
+_WHITESPACE = " \t\n\r"
+
+class _JsonReader:
+    # Minimal pull parser over a byte stream: reads the top-level object of a `bw export --format json`
+    # and hands out one array element at a time, so only a single item is decoded at once
+
+    def __init__(self, stream: BinaryIO, chunk_size: int) -> None:
+        self.__stream = stream
+        self.__chunk_size = chunk_size
+        self.__decoder = codecs.getincrementaldecoder("utf-8")()
+        self.__json = json.JSONDecoder()
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self) -> bool:
+        if self.__eof:
+            return False
+        data = self.__stream.read(self.__chunk_size)
+        self.__eof = not data
+        # Drop what was already consumed before appending
+        self.__buffer = self.__buffer[self.__pos:] + self.__decoder.decode(data, final=self.__eof)
+        self.__pos = 0
+        return not self.__eof or bool(self.__buffer)
+
+    def peek(self) -> str:
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in _WHITESPACE:
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ExportStreamError(f"Expected '{char}' in vaultwarden export, got '{self.peek()}'")
+        self.__pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self.__json.raw_decode(self.__buffer, self.__pos)
+            except json.JSONDecodeError:
+                if not self.__fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may still continue in the next chunk
+            if end == len(self.__buffer) and not self.__eof:
+                self.__fill()
+                continue
+            self.__pos = end
+            return obj
+
+def iter_export(stream: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[tuple[str, Any]]:
+    # Yields (key, element) for every element of top-level arrays and (key, value) for other values
+    reader = _JsonReader(stream, chunk_size)
+    reader.expect("{")
+
+    while reader.peek() != "}":
+        key = reader.value()
+        reader.expect(":")
+
+        if reader.peek() == "[":
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield key, reader.value()
+                if reader.peek() == ",":
+                    reader.expect(",")
+            reader.expect("]")
+        else:
+            yield key, reader.value()
+
+        if reader.peek() == ",":
+            reader.expect(",")
+
+    reader.expect("}")
+
+
+class ExportStreamError(Exception):
+    pass
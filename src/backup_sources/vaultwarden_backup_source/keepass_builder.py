@@ -0,0 +1,88 @@
+import pykeepass
+
+from pathlib import Path
+from typing import Iterable
+
+# Vaultwarden/Bitwarden cipher types
+_TYPE_LOGIN = 1
+_TYPE_NOTE = 2
+_TYPE_CARD = 3
+_TYPE_IDENTITY = 4
+
+class KeepassBuilder:
+    # Builds the KeePass database in memory: groups are resolved through a path -> Group index
+    # instead of XPath searches over the whole tree, entries are added without duplicate lookups
+
+    def __init__(self, keepass_path: Path | str, password: str) -> None:
+        self.__db = pykeepass.create_database(str(keepass_path), password)
+        self.__groups: dict[tuple[str, ...], pykeepass.Group] = {(): self.__db.root_group}
+        self.__folders: dict[str, tuple[str, ...]] = {}
+        self.entries: dict[str, pykeepass.Entry] = {}
+
+    def add_folders(self, folders: dict[str, str]):
+        for folder_id, folder in folders.items():
+            path = tuple(segment for segment in folder.split("/") if segment)
+            self.__folders[folder_id] = path
+            self.__get_group(path)
+
+    def add_items(self, items: Iterable[dict]):
+        for item in items:
+            self.add_item(item)
+
+    def add_item(self, item: dict):
+        # Items without (known) folder end up in the root group
+        group = self.__get_group(self.__folders.get(item.get("folderId") or "", ()))
+        login = item.get("login") or {}
+        uris = login.get("uris") or []
+
+        # Same as PyKeePass.add_entry, minus its duplicate check which searches the whole group per entry
+        entry = pykeepass.Entry(
+            title=item.get("name") or "",
+            username=login.get("username") or "",
+            password=login.get("password") or "",
+            url=(uris[0].get("uri") if uris else None) or None,
+            notes=item.get("notes") or None,
+            otp=login.get("totp") or None,
+            kp=self.__db
+        )
+        group.append(entry)
+
+        item_type = item.get("type")
+        if item_type == _TYPE_CARD:
+            self.__add_properties(entry, "card", item.get("card"))
+        elif item_type == _TYPE_IDENTITY:
+            self.__add_properties(entry, "identity", item.get("identity"))
+
+        for field in item.get("fields") or []:
+            if field.get("name"):
+                entry.set_custom_property(field["name"], str(field.get("value") or ""), protect=field.get("type") == 1)
+
+        if item.get("id"):
+            self.entries[item["id"]] = entry
+
+    def add_attachment(self, item_id: str, file_name: str, data: bytes) -> bool:
+        # Attachments of items that aren't in the database are only kept in the backup tree
+        entry = self.entries.get(item_id)
+        if entry is None:
+            return False
+        entry.add_attachment(self.__db.add_binary(data, compressed=True, protected=False), file_name)
+        return True
+
+    def save(self):
+        self.__db.save()
+
+
+    #### Helpers ####
+
+
+    def __get_group(self, path: tuple[str, ...]) -> pykeepass.Group:
+        group = self.__groups.get(path)
+        if group is None:
+            group = self.__db.add_group(self.__get_group(path[:-1]), path[-1])
+            self.__groups[path] = group
+        return group
+
+    def __add_properties(self, entry: pykeepass.Entry, prefix: str, data: dict | None):
+        for key, value in (data or {}).items():
+            if value is not None:
+                entry.set_custom_property(f"{prefix}.{key}", str(value), protect=key in ("number", "code", "ssn", "passportNumber"))
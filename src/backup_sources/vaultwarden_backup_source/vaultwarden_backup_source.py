@@ -2,29 +2,54 @@ import subprocess
 import os
 import re
 import json
-import pykeepass
+import zipfile
 
 from pathlib import Path
-from typing import NamedTuple
+from typing import BinaryIO, NamedTuple
 
 from .._backup_source import BackupSource
+from .keepass_builder import KeepassBuilder
+from .export_stream import iter_export
+from .attachments import Attachment, AttachmentDownloader, AttachmentError, BwServe, attachments_of
 
 class VaultwardenBackupSourceConfig(NamedTuple):
     url: str
     client_id: str
     client_secret: str
     password: str
+    snapshot: bool = False
+    # Download the attachments of all items into attachments/ and the KeePass database
+    attachments: bool = False
+    # Attachments downloaded at a time through one `bw serve`
+    attachment_workers: int = 8
+    # Attempts per attachment
+    attachment_attempts: int = 3
+
+class _TeeReader:
+    # Copies everything read from the export stream into the zip entry
+    def __init__(self, source: BinaryIO, copy: BinaryIO) -> None:
+        self.__source = source
+        self.__copy = copy
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.__source.read(size)
+        self.__copy.write(data)
+        return data
 
 class VaultwardenBackupSource(BackupSource):
     def __init__(self, workdir: Path, backup_dir: Path, conf: VaultwardenBackupSourceConfig) -> None:
         super().__init__(workdir, backup_dir, conf)
         self.__bw_path = "bw"
         self.__conf = conf
-        self.__env_login = {**os.environ, **{
+        # Separate CLI state per work dir, so several Vaultwarden jobs can run side by side
+        self.__env = {**os.environ, **{
+            "BITWARDENCLI_APPDATA_DIR": str(Path(self._work_dir, ".bw").absolute()),
+        }}
+        self.__env_login = {**self.__env, **{
             "BW_CLIENTID": self.__conf.client_id,
             "BW_CLIENTSECRET": self.__conf.client_secret,
         }}
-        self.__env_unlock = {**os.environ, **{
+        self.__env_unlock = {**self.__env, **{
             "BWPW": self.__conf.password,
         }}
 
@@ -33,17 +58,20 @@ class VaultwardenBackupSource(BackupSource):
 
     def create_backup(self):
         try:
-            folders = self.__get_folders()
-            items = self.__get_items()
-
-            self.__create_keepass(folders, items)
-            self.__create_zip_export()
+            if self.__conf.snapshot:
+                self.__create_snapshot_backup()
+            else:
+                folders = self.__get_folders()
+                items = self.__get_items()
+
+                self.__create_keepass(folders, items)
+                self.__create_zip_export()
         finally:
-            print(subprocess.run([self.__bw_path, "lock"]))
-            print(subprocess.run([self.__bw_path, "logout"]))
+            print(subprocess.run([self.__bw_path, "lock"], env=self.__env))
+            print(subprocess.run([self.__bw_path, "logout"], env=self.__env))
 
     def __configure_cli(self):
-        config_res = subprocess.run([self.__bw_path, "config", "server", self.__conf.url], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        config_res = subprocess.run([self.__bw_path, "config", "server", self.__conf.url], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.__env)
         if config_res.returncode != 0:
             raise VaultwardenBackupSourceError(f"Error configuring vaultwarden cli: {config_res.stderr.decode()}")
         print(config_res.stdout.decode())
@@ -62,12 +90,12 @@ class VaultwardenBackupSource(BackupSource):
         return session
 
     def __create_zip_export(self):
-        export_res = subprocess.run([self.__bw_path, "export", "--format", "zip", "--output", f"{self._backup_dir}/", "--session", self.__session], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        export_res = subprocess.run([self.__bw_path, "export", "--format", "zip", "--output", f"{self._backup_dir}/", "--session", self.__session], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.__env)
         if export_res.returncode != 0:
             raise VaultwardenBackupSourceError(f"Error exporting vaultwarden data: {export_res.stderr.decode()}")
 
     def __get_folders(self) -> dict[str, str]:
-        folder_res = subprocess.run([self.__bw_path, "list", "folders", "--session", self.__session], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        folder_res = subprocess.run([self.__bw_path, "list", "folders", "--session", self.__session], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.__env)
         if folder_res.returncode != 0:
             raise VaultwardenBackupSourceError(f"Error retrieving vaultwarden folders: {folder_res.stderr.decode()}")
         
@@ -77,7 +105,7 @@ class VaultwardenBackupSource(BackupSource):
         return folders_map
     
     def __get_items(self) -> list[dict]:
-        item_res = subprocess.run([self.__bw_path, "list", "items", "--session", self.__session], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        item_res = subprocess.run([self.__bw_path, "list", "items", "--session", self.__session], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.__env)
         if item_res.returncode != 0:
             raise VaultwardenBackupSourceError(f"Error retrieving vaultwarden items: {item_res.stderr.decode()}")
 
@@ -86,26 +114,76 @@ class VaultwardenBackupSource(BackupSource):
 
     def __create_keepass(self, folders: dict[str, str], items: list[dict]):
         keepass_path = f"{self._backup_dir}/vaultwarden-backup.kdbx"
-        keepass_db = pykeepass.create_database(keepass_path, self.__env_unlock["BWPW"])
-
-        # Create groups
-        for folder in folders.values():
-            groups = folder.split("/")
-            last_group: pykeepass.Group = keepass_db.root_group
-            for group in groups:
-                group_exists: pykeepass.Group | None = keepass_db.find_groups(path=[*last_group.path, group])
-                if group_exists:
-                    last_group = group_exists
-                else:
-                    last_group = keepass_db.add_group(last_group, group)
-
-        # Add entries
-        for entry in items:
-            group_name = folders[entry["folderId"]]
-            group = keepass_db.find_groups(path=group_name.split("/"))
-            keepass_db.add_entry(group, entry["name"], entry["login"]["username"] if entry["login"]["username"] else "", entry["login"]["password"])
-
-        keepass_db.save()
+        keepass = KeepassBuilder(keepass_path, self.__env_unlock["BWPW"])
+
+        keepass.add_folders(folders)
+        keepass.add_items(items)
+
+        if self.__conf.attachments:
+            self.__download_attachments(keepass, items)
+
+        keepass.save()
+
+    def __create_snapshot_backup(self):
+        # One `bw export` decrypts the vault once, its JSON is streamed into the zip export and,
+        # item by item, into the KeePass database at the same time
+        keepass = KeepassBuilder(f"{self._backup_dir}/vaultwarden-backup.kdbx", self.__env_unlock["BWPW"])
+
+        export_proc = subprocess.Popen(
+            [self.__bw_path, "export", "--format", "json", "--raw", "--session", self.__session],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.__env
+        )
+        try:
+            assert export_proc.stdout is not None
+            with zipfile.ZipFile(f"{self._backup_dir}/vaultwarden-export.zip", "w", zipfile.ZIP_DEFLATED) as zf, \
+                    zf.open("vaultwarden-export.json", "w", force_zip64=True) as export_file:
+                # bw exports all folders before the items, so each folder is known before it's used
+                for key, value in iter_export(_TeeReader(export_proc.stdout, export_file)):
+                    if key == "folders":
+                        keepass.add_folders({value["id"]: value["name"]})
+                    elif key == "items":
+                        keepass.add_item(value)
+                    elif key == "encrypted" and value:
+                        raise VaultwardenBackupSourceError("Vaultwarden export is encrypted, expected a plain json export!")
+        finally:
+            if export_proc.stdout:
+                export_proc.stdout.close()
+            stderr = export_proc.stderr.read().decode() if export_proc.stderr else ""
+            export_proc.wait()
+
+        if export_proc.returncode != 0:
+            raise VaultwardenBackupSourceError(f"Error exporting vaultwarden data: {stderr}")
+
+        if self.__conf.attachments:
+            self.__download_attachments(keepass)
+
+        keepass.save()
+
+    def __download_attachments(self, keepass: KeepassBuilder, items: list[dict] | None = None):
+        # All attachments through one `bw serve` on the unlocked session, streamed into
+        # attachments/<item id>/ and added to the KeePass entry of their item
+        def add_to_keepass(attachment: Attachment, path: Path):
+            keepass.add_attachment(attachment.item_id, attachment.file_name, path.read_bytes())
+
+        try:
+            serve = BwServe(self.__bw_path, self.__session, self.__env, Path(self._work_dir, ".bw", "serve.log"))
+            try:
+                if items is None:
+                    # The json export doesn't contain attachments, the items are listed once more
+                    items = serve.get_json("/list/object/items")["data"]
+                attachments = attachments_of(items)
+                if not attachments:
+                    return
+
+                print(f"Downloading {len(attachments)} attachments with {self.__conf.attachment_workers} workers")
+                downloader = AttachmentDownloader(serve, Path(self._backup_dir, "attachments"),
+                                                  self.__conf.attachment_workers, self.__conf.attachment_attempts)
+                downloader.download(attachments, add_to_keepass)
+                print(f"Downloaded {len(attachments)} attachments ({downloader.downloaded_bytes / 2**20:.1f} MiB, {downloader.retries} retries)")
+            finally:
+                serve.close()
+        except AttachmentError as e:
+            raise VaultwardenBackupSourceError(f"Error downloading vaultwarden attachments: {e}")
 
 class VaultwardenBackupSourceError(Exception):
     pass
\ No newline at end of file
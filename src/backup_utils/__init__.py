@@ -1,13 +1,71 @@
-from .simple_gpg import SimpleGPG
-from .simple_sops import SimpleSops, SopsError, SopsConfAWS, SopsConfGCP
+from .encryptor import ENCRYPTED_SUFFIXES, ENVELOPE_SUFFIX, GPG_SUFFIX, Encryptor
+from .credentials import CredentialsError, gcp_credentials, service_account_info
+from .zip_stream import ZipStreamError, extract_zip_stream, safe_path
+from .archive import ARCHIVE_SUFFIXES, ArchiveConf, ArchiveError, archive_directory, archive_directory_to_stream, check_codec, codec_of, extract_archive_stream
+from .metrics import RunMetrics, CountingWriter, MetricsError, write_textfile, write_summary, push_gateway
+from .journal import JournalConf, JournalSection, RunJournal
+from .tree_fingerprint import TreeFingerprint, fingerprint_tree
+from .cron import CronError, CronSchedule
+from .registry import lazy_exports
 
+# Modules with heavy dependencies (gnupg, cryptography, sopsy) are only imported on first use
+__getattr__ = lazy_exports(__name__, {
+    **dict.fromkeys(["SimpleGPG", "MyGPGDecryptionError", "decrypt_bytes", "decrypt_pipe"], ".simple_gpg"),
+    **dict.fromkeys(["EnvelopeEncryptor", "EnvelopeError", "EnvelopeReader", "EnvelopeWriter", "envelope_decrypt_bytes",
+                     "envelope_decrypt_stream", "is_envelope", "load_identity"], ".envelope"),
+    **dict.fromkeys(["SimpleSops", "SopsCacheConf", "SopsError", "SopsConfAWS", "SopsConfGCP"], ".simple_sops"),
+    **dict.fromkeys(["SopsNativeError", "decrypt_document"], ".sops_native")
+})
+
+import os
 import shutil
+import threading
 
+from contextlib import contextmanager
 from pathlib import Path
-from typing import NamedTuple
+from typing import BinaryIO, Iterator, NamedTuple
+
+def zip_directory(base_path: Path, dir_name: str, target_path: Path) -> Path:
+    return Path(shutil.make_archive(f"{target_path}/{dir_name}", 'zip', base_path, dir_name))
+
+def zip_directory_to_stream(base_path: Path, dir_name: str, stream: BinaryIO):
+    # Same layout as zip_directory, but written to a (possibly unseekable) stream
+    archive_directory_to_stream(base_path, dir_name, stream, ArchiveConf("zip"))
+
+@contextmanager
+def archive_directory_pipe(base_path: Path, dir_name: str, conf: ArchiveConf = ArchiveConf()) -> Iterator[int]:
+    # Yields the read end of a pipe a background thread archives dir_name into
+    read_fd, write_fd = os.pipe()
+    errors: list[BaseException] = []
+
+    def writer():
+        try:
+            with os.fdopen(write_fd, "wb") as stream:
+                archive_directory_to_stream(base_path, dir_name, stream, conf)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=writer, name=f"archive-{dir_name}", daemon=True)
+    thread.start()
+    try:
+        yield read_fd
+    finally:
+        # Closing the read end unblocks the writer if the consumer bailed out early
+        os.close(read_fd)
+        thread.join()
+
+    if errors:
+        raise errors[0]
 
-def zip_directory(base_path: Path, dir_name: str, target_path: Path):
-    shutil.make_archive(f"{target_path}/{dir_name}", 'zip', base_path, dir_name)
+def dir_stats(dir_path: Path) -> tuple[int, int]:
+    # (file count, total bytes) below dir_path
+    files = 0
+    size = 0
+    for root, _, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, file_name))
+    return files, size
 
 def delete_dir(dir_path: Path):
     shutil.rmtree(dir_path)
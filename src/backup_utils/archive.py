@@ -0,0 +1,165 @@
+import os
+import sys
+import importlib
+import shutil
+import tarfile
+import zipfile
+
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+
+# Optional codecs, only needed (and imported) when configured: codec -> (module, package)
+_CODEC_MODULES = {
+    "zstd": ("zstandard", "zstandard"),
+    "lz4": ("lz4.frame", "lz4")
+}
+
+from .zip_stream import extract_zip_stream
+
+# Timestamp of all entries of deterministic archives, the earliest a zip entry can have
+_FIXED_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_FIXED_MTIME = 315532800
+
+# codec -> suffix of the archive file
+ARCHIVE_SUFFIXES = {
+    "zip": ".zip",
+    "zstd": ".tar.zst",
+    "lz4": ".tar.lz4",
+    "none": ".tar"
+}
+
+class ArchiveConf(NamedTuple):
+    codec: str = "zip"
+    # Codec specific, None for the codec default (zip: 6, zstd: 3, lz4: 0)
+    level: int | None = None
+    # zstd worker threads, 0 compresses in the calling thread, -1 uses all cores
+    threads: int = 0
+    # Fixed timestamps and owners, the same tree always gives the same archive
+    deterministic: bool = False
+
+    @property
+    def suffix(self) -> str:
+        return ARCHIVE_SUFFIXES[self.codec]
+
+    @property
+    def compressed(self) -> bool:
+        return self.codec != "none"
+
+def check_codec(codec: str):
+    if codec not in ARCHIVE_SUFFIXES:
+        raise ArchiveError(f"Unknown archive codec: {codec}, expected one of {', '.join(ARCHIVE_SUFFIXES)}")
+    if codec in _CODEC_MODULES:
+        _codec_module(codec)
+
+def _codec_module(codec: str):
+    module, package = _CODEC_MODULES[codec]
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ArchiveError(f"The {codec} archive codec needs the {package} package") from None
+
+def codec_of(file_name: str) -> str | None:
+    # Longest suffix first, ".tar" would otherwise match ".tar.zst" archives as well
+    for codec, suffix in sorted(ARCHIVE_SUFFIXES.items(), key=lambda item: -len(item[1])):
+        if file_name.endswith(suffix):
+            return codec
+    return None
+
+def _walk(base_path: Path, dir_name: str):
+    # Directories and files below dir_name in a stable order, as (path, archive name)
+    for root, dirs, files in os.walk(base_path / dir_name):
+        dirs.sort()
+        root_path = Path(root)
+        yield root_path, root_path.relative_to(base_path)
+        for file_name in sorted(files):
+            file_path = root_path / file_name
+            yield file_path, file_path.relative_to(base_path)
+
+def _normalize_tarinfo(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    info.mtime = _FIXED_MTIME
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+def _write_tar(base_path: Path, dir_name: str, stream: BinaryIO, deterministic: bool = False):
+    # Stream mode ("w|") never seeks, so the target may be a pipe or a compressor
+    with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        for path, name in _walk(base_path, dir_name):
+            tar.add(path, name.as_posix(), recursive=False, filter=_normalize_tarinfo if deterministic else None)
+
+def _set_zip_level(info: zipfile.ZipInfo, level: int):
+    # ZipFile.open uses the level of the entry, not the one of the archive; public from 3.13 on
+    if sys.version_info >= (3, 13):
+        info.compress_level = level
+    else:
+        info._compresslevel = level
+
+def _write_zip_entry(zf: zipfile.ZipFile, path: Path, name: Path, level: int):
+    # Same as ZipFile.write (streamed, the file is never read whole), with the fixed timestamp
+    info = zipfile.ZipInfo.from_file(path, name)
+    info.date_time = _FIXED_DATE_TIME
+    if info.is_dir():
+        # Without data descriptor, streamed restores can't read stored entries that have one
+        info.compress_size = info.CRC = 0
+        zf.mkdir(info)
+        return
+    info.compress_type = zipfile.ZIP_DEFLATED
+    _set_zip_level(info, level)
+    with open(path, "rb") as src, zf.open(info, "w") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+def archive_directory_to_stream(base_path: Path, dir_name: str, stream: BinaryIO, conf: ArchiveConf = ArchiveConf()):
+    check_codec(conf.codec)
+
+    if conf.codec == "zip":
+        level = 6 if conf.level is None else conf.level
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+            for path, name in _walk(base_path, dir_name):
+                if conf.deterministic:
+                    _write_zip_entry(zf, path, name, level)
+                else:
+                    zf.write(path, name)
+    elif conf.codec == "zstd":
+        compressor = _codec_module("zstd").ZstdCompressor(level=3 if conf.level is None else conf.level, threads=conf.threads)
+        with compressor.stream_writer(stream, closefd=False) as writer:
+            _write_tar(base_path, dir_name, writer, conf.deterministic)
+    elif conf.codec == "lz4":
+        with _codec_module("lz4").open(stream, mode="wb", compression_level=conf.level or 0) as writer:
+            _write_tar(base_path, dir_name, writer, conf.deterministic)
+    else:
+        _write_tar(base_path, dir_name, stream, conf.deterministic)
+
+def archive_directory(base_path: Path, dir_name: str, target_path: Path, conf: ArchiveConf = ArchiveConf()) -> Path:
+    archive_path = Path(target_path, f"{dir_name}{conf.suffix}")
+    with open(archive_path, "wb") as f:
+        archive_directory_to_stream(base_path, dir_name, f, conf)
+    return archive_path
+
+def extract_archive_stream(stream: BinaryIO, target_dir: Path, codec: str) -> int:
+    # Counterpart of archive_directory_to_stream for restores, stream doesn't need to be seekable
+    check_codec(codec)
+    if codec == "zip":
+        return extract_zip_stream(stream, target_dir)
+
+    if codec == "zstd":
+        reader = _codec_module("zstd").ZstdDecompressor().stream_reader(stream, closefd=False)
+    elif codec == "lz4":
+        reader = _codec_module("lz4").open(stream, mode="rb")
+    else:
+        reader = stream
+
+    files = 0
+    with tarfile.open(fileobj=reader, mode="r|") as tar:
+        for member in tar:
+            # The "data" filter rejects absolute paths, links out of target_dir and special files
+            tar.extract(member, target_dir, filter="data")
+            files += member.isfile()
+
+    # Drain what follows the tar end marker, so the producer of the stream isn't cut off
+    while reader.read(1024 * 1024):
+        pass
+    return files
+
+
+class ArchiveError(Exception):
+    pass
@@ -0,0 +1,100 @@
+import hashlib
+import random
+
+from typing import BinaryIO, Iterator, NamedTuple
+
+# Optional, vectorizes the rolling hash; without it chunking runs at Python loop speed (a few MB/s)
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ChunkerConf(NamedTuple):
+    min_size: int = 256 * 1024
+    avg_size: int = 1024 * 1024
+    max_size: int = 4 * 1024 * 1024
+
+# Gear table of the rolling hash, fixed seed so chunk boundaries are stable across runs and hosts
+_rng = random.Random(0x6261636B)
+_GEAR = [_rng.getrandbits(32) for _ in range(256)]
+_HASH_MASK = 0xFFFFFFFF
+
+# Bytes hashed per vectorized step; a cut point is usually found in the first few blocks
+_BLOCK_SIZE = 64 * 1024
+
+_GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint32) if numpy is not None else None
+
+def _masks(avg_size: int) -> tuple[int, int]:
+    # FastCDC normalized chunking: harder to cut before the average size, easier after it
+    bits = avg_size.bit_length() - 1
+    return ((1 << (bits + 1)) - 1) << (31 - bits), ((1 << (bits - 1)) - 1) << (33 - bits)
+
+def _cut_point(data: bytes | bytearray, conf: ChunkerConf) -> int:
+    length = len(data)
+    if length <= conf.min_size:
+        return length
+
+    end = min(length, conf.max_size)
+    normal = min(end, conf.avg_size)
+    mask_s, mask_l = _masks(conf.avg_size)
+    if numpy is not None:
+        return _cut_point_vectorized(data, conf.min_size, normal, end, mask_s, mask_l)
+
+    gear = _GEAR
+    h = 0
+
+    # The first min_size bytes can never contain a cut point and are skipped entirely
+    for i, b in enumerate(data[conf.min_size:normal], conf.min_size):
+        h = ((h << 1) + gear[b]) & _HASH_MASK
+        if not h & mask_s:
+            return i + 1
+    for i, b in enumerate(data[normal:end], normal):
+        h = ((h << 1) + gear[b]) & _HASH_MASK
+        if not h & mask_l:
+            return i + 1
+    return end
+
+def _cut_point_vectorized(data: bytes | bytearray, min_size: int, normal: int, end: int, mask_s: int, mask_l: int) -> int:
+    # Same cut points as the loop: the hash at i only depends on the gear values of the last 32
+    # bytes (older ones are shifted out of the 32 bits), h[i] = sum(gear[data[i - k]] << k), which
+    # is built for a whole block in five doubling steps instead of one step per byte
+    view = numpy.frombuffer(data, dtype=numpy.uint8, count=end)
+    for start, stop, mask in ((min_size, normal, mask_s), (normal, end, mask_l)):
+        for block_start in range(start, stop, _BLOCK_SIZE):
+            block_stop = min(stop, block_start + _BLOCK_SIZE)
+            # Hashing starts at min_size, earlier bytes don't contribute
+            context = max(min_size, block_start - 31)
+            h = _GEAR_ARRAY[view[context:block_stop]]
+            shift = 1
+            while shift < 32:
+                h[shift:] += h[:-shift] << shift
+                shift <<= 1
+            hits = numpy.flatnonzero((h[block_start - context:] & mask) == 0)
+            if hits.size:
+                return block_start + int(hits[0]) + 1
+    return end
+
+def iter_chunks(stream: BinaryIO, conf: ChunkerConf = ChunkerConf()) -> Iterator[bytes]:
+    buffer = bytearray()
+    eof = False
+
+    while True:
+        while not eof and len(buffer) < conf.max_size:
+            data = stream.read(conf.max_size)
+            if not data:
+                eof = True
+            buffer += data
+
+        if not buffer:
+            return
+
+        if eof and len(buffer) <= conf.min_size:
+            cut = len(buffer)
+        else:
+            cut = _cut_point(buffer, conf)
+
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+def chunk_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,31 @@
+import json
+import base64
+import hashlib
+import threading
+
+# Service account credentials shared by everything in the process that authenticates as the same
+# account (the SOPS KMS calls, the storage clients), so a key is parsed and an access token is
+# fetched once per account instead of once per user
+_service_accounts: dict[str, object] = {}
+_service_accounts_lock = threading.Lock()
+
+def service_account_info(svc_key_b64: str) -> dict:
+    # The base64 encoded JSON key as it is stored in the configuration
+    try:
+        return json.loads(base64.b64decode(svc_key_b64))
+    except ValueError as e:
+        raise CredentialsError(f"Invalid service account key: {e}")
+
+def gcp_credentials(svc_key_b64: str, scopes: tuple[str, ...] = ("https://www.googleapis.com/auth/cloud-platform",)):
+    # google.oauth2.service_account.Credentials, built from memory, no key file is written
+    from google.oauth2 import service_account
+
+    key = hashlib.sha256(f"{svc_key_b64}|{' '.join(scopes)}".encode()).hexdigest()
+    with _service_accounts_lock:
+        if key not in _service_accounts:
+            _service_accounts[key] = service_account.Credentials.from_service_account_info(service_account_info(svc_key_b64), scopes=list(scopes))
+        return _service_accounts[key]
+
+
+class CredentialsError(Exception):
+    pass
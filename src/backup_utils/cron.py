@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+# Shortcuts of the five-field syntax
+_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *"
+}
+
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_DAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+
+# (minimum, maximum, names) of minute, hour, day of month, month and day of week
+_FIELDS = [(0, 59, None), (0, 23, None), (1, 31, None), (1, 12, _MONTHS), (0, 7, _DAYS)]
+
+# Upper bound of the search for the next run, e.g. "0 0 30 2 *" never matches
+_MAX_YEARS = 5
+
+class CronSchedule:
+    # Standard cron expression ("minute hour day-of-month month day-of-week" with *, lists, ranges,
+    # steps, month and day names, or an @alias) in local time. Like cron, a day matches if day of
+    # month or day of week matches when both are restricted.
+
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        fields = _ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise CronError(f"Cron expression {expression!r} needs 5 fields, has {len(fields)}")
+
+        self.__minutes, self.__hours, self.__days, self.__months, weekdays = [
+            self.__parse_field(field, *limits) for field, limits in zip(fields, _FIELDS)
+        ]
+        # 7 is Sunday as well
+        self.__weekdays = {day % 7 for day in weekdays}
+        # Like cron, a field starting with "*" (e.g. "*/2") counts as unrestricted for the day rule
+        self.__any_day = fields[2].startswith("*")
+        self.__any_weekday = fields[4].startswith("*")
+
+    def next_after(self, moment: datetime) -> datetime:
+        # First matching minute after moment
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * _MAX_YEARS)
+        while candidate <= limit:
+            if candidate.month not in self.__months:
+                candidate = (candidate.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.__day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.__hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.__minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise CronError(f"Cron expression {self.expression!r} doesn't match any time in {_MAX_YEARS} years")
+
+
+    #### Helpers ####
+
+
+    def __day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.__days
+        # isoweekday: Monday 1 .. Sunday 7
+        weekday = moment.isoweekday() % 7 in self.__weekdays
+        if self.__any_day or self.__any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def __parse_value(self, value: str, names: list[str] | None, minimum: int) -> int:
+        if names and value.lower() in names:
+            return names.index(value.lower()) + minimum
+        try:
+            return int(value)
+        except ValueError:
+            raise CronError(f"Invalid value {value!r} in cron expression {self.expression!r}")
+
+    def __parse_field(self, field: str, minimum: int, maximum: int, names: list[str] | None) -> set[int]:
+        values: set[int] = set()
+        for part in field.split(","):
+            range_part, _, step_part = part.partition("/")
+            step = self.__parse_value(step_part, None, 0) if step_part else 1
+            if range_part == "*":
+                start, end = minimum, maximum
+            elif "-" in range_part:
+                start_part, end_part = range_part.split("-", 1)
+                start, end = self.__parse_value(start_part, names, minimum), self.__parse_value(end_part, names, minimum)
+            else:
+                start = self.__parse_value(range_part, names, minimum)
+                # "5/15" runs from 5 to the end of the range
+                end = maximum if step_part else start
+            if step < 1 or not minimum <= start <= end <= maximum:
+                raise CronError(f"Invalid field {field!r} in cron expression {self.expression!r}, expected values from {minimum} to {maximum}")
+            values.update(range(start, end + 1, step))
+        return values
+
+
+class CronError(Exception):
+    pass
@@ -0,0 +1,22 @@
+from typing import BinaryIO, Protocol
+
+# Suffixes of the encrypted files, known without importing the engines (gnupg, cryptography)
+GPG_SUFFIX = ".gpg"
+ENVELOPE_SUFFIX = ".enc"
+ENCRYPTED_SUFFIXES = (GPG_SUFFIX, ENVELOPE_SUFFIX)
+
+class Encryptor(Protocol):
+    # What the encryption engines (SimpleGPG, EnvelopeEncryptor) share, with the suffix of their output
+    suffix: str
+
+    def encrypt_file(self, file_path, output_path, compress: bool = True):
+        ...
+
+    async def encrypt_file_async(self, file_path, output_path, compress: bool = True):
+        ...
+
+    def encrypt_stream(self, source: BinaryIO | int, target: BinaryIO, chunk_size: int = 1024 * 1024, compress: bool = True):
+        ...
+
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        ...
@@ -0,0 +1,228 @@
+import io
+import os
+import base64
+import asyncio
+import hashlib
+import struct
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .encryptor import ENVELOPE_SUFFIX
+
+# Envelope format, v1:
+#   header = magic (8) | key id (8) | ephemeral X25519 public key (32) | nonce prefix (7)
+#   then the plaintext in segments of _SEGMENT_SIZE bytes, each sealed with AES-256-GCM under
+#   nonce = prefix | segment counter (4, big endian) | last segment flag (1), header as associated data.
+# The file key is derived with HKDF-SHA256 from the X25519 shared secret of the ephemeral key and
+# the recipient key. The flag on the last segment makes truncation detectable, the counter reordering.
+ENVELOPE_MAGIC = b"BKSTENV1"
+
+_HEADER = struct.Struct("<8s8s32s7s")
+_SEGMENT_SIZE = 64 * 1024
+_TAG_SIZE = 16
+_INFO = b"backupster envelope v1"
+
+def _key_id(public_key: X25519PublicKey) -> bytes:
+    return hashlib.sha256(public_key.public_bytes_raw()).digest()[:8]
+
+def _file_key(shared_secret: bytes, ephemeral: bytes, recipient: bytes) -> AESGCM:
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=ephemeral + recipient, info=_INFO)
+    return AESGCM(hkdf.derive(shared_secret))
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    if counter >= 2 ** 32:
+        raise EnvelopeError("Too many segments for one envelope")
+    return prefix + counter.to_bytes(4, "big") + (b"\x01" if last else b"\x00")
+
+def is_envelope(data: bytes) -> bool:
+    return data[:len(ENVELOPE_MAGIC)] == ENVELOPE_MAGIC
+
+def load_public_key(public_key_base64: str) -> X25519PublicKey:
+    try:
+        return X25519PublicKey.from_public_bytes(base64.b64decode(public_key_base64))
+    except ValueError as e:
+        raise EnvelopeError(f"Invalid envelope public key: {e}")
+
+def load_identity(key_path: Path, passphrase: str | None = None) -> X25519PrivateKey:
+    # Private key of the operator running a restore, a PKCS#8 PEM file as written by scripts/generate_envelope_key.py
+    key = serialization.load_pem_private_key(key_path.read_bytes(), passphrase.encode() if passphrase else None)
+    if not isinstance(key, X25519PrivateKey):
+        raise EnvelopeError(f"{key_path} is not an X25519 private key")
+    return key
+
+
+class EnvelopeWriter(io.RawIOBase):
+    # Encrypts everything written to it into target. One segment is held back until close(),
+    # which seals it as the last one, so the writer never needs to know the total size upfront.
+
+    def __init__(self, target: BinaryIO, public_key: X25519PublicKey) -> None:
+        super().__init__()
+        self.__target = target
+        ephemeral = X25519PrivateKey.generate()
+        ephemeral_public = ephemeral.public_key().public_bytes_raw()
+        self.__header = _HEADER.pack(ENVELOPE_MAGIC, _key_id(public_key), ephemeral_public, os.urandom(7))
+        self.__prefix = self.__header[-7:]
+        self.__aead = _file_key(ephemeral.exchange(public_key), ephemeral_public, public_key.public_bytes_raw())
+        self.__counter = 0
+        self.__buffer = bytearray()
+        self.__aborted = False
+        self.__target.write(self.__header)
+
+    def writable(self) -> bool:
+        return True
+
+    def __seal(self, segment: bytes | memoryview, last: bool):
+        self.__target.write(self.__aead.encrypt(_nonce(self.__prefix, self.__counter, last), segment, self.__header))
+        self.__counter += 1
+
+    def write(self, data) -> int:
+        view = memoryview(data).cast("B")
+        if self.__buffer:
+            take = min(len(view), _SEGMENT_SIZE - len(self.__buffer))
+            self.__buffer += view[:take]
+            view = view[take:]
+            if not view:
+                return len(data)
+            # More data follows, so the buffered segment isn't the last one
+            self.__seal(bytes(self.__buffer), False)
+            self.__buffer.clear()
+        # Large writes are sealed straight from the caller's buffer, only the tail is kept back
+        while len(view) > _SEGMENT_SIZE:
+            self.__seal(view[:_SEGMENT_SIZE], False)
+            view = view[_SEGMENT_SIZE:]
+        self.__buffer += view
+        return len(data)
+
+    def close(self):
+        if not self.closed and not self.__aborted:
+            self.__seal(bytes(self.__buffer), True)
+            self.__buffer.clear()
+        super().close()
+
+    def abort(self):
+        # Closes without sealing a last segment, what was written so far fails to decrypt
+        self.__aborted = True
+        self.close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class EnvelopeReader(io.RawIOBase):
+    # Decrypts an envelope read from an unseekable source, segment by segment
+
+    def __init__(self, source: BinaryIO, identity: X25519PrivateKey) -> None:
+        super().__init__()
+        self.__source = source
+        self.__header = self.__read_exact(_HEADER.size)
+        if len(self.__header) != _HEADER.size or not is_envelope(self.__header):
+            raise EnvelopeError("Not an envelope, the header is missing")
+        _, key_id, ephemeral_public, self.__prefix = _HEADER.unpack(self.__header)
+        public_key = identity.public_key()
+        if key_id != _key_id(public_key):
+            raise EnvelopeError("Envelope is encrypted for another key")
+
+        shared_secret = identity.exchange(X25519PublicKey.from_public_bytes(ephemeral_public))
+        self.__aead = _file_key(shared_secret, ephemeral_public, public_key.public_bytes_raw())
+        self.__counter = 0
+        self.__done = False
+        # One byte of lookahead tells whether the current segment is the last one
+        self.__next = self.__read_exact(_SEGMENT_SIZE + _TAG_SIZE + 1)
+        self.__plain = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def __read_exact(self, size: int) -> bytes:
+        parts = []
+        while size > 0:
+            data = self.__source.read(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def __open_segment(self):
+        sealed_size = _SEGMENT_SIZE + _TAG_SIZE
+        last = len(self.__next) <= sealed_size
+        sealed, rest = self.__next[:sealed_size], self.__next[sealed_size:]
+        if len(sealed) < _TAG_SIZE:
+            raise EnvelopeError("Envelope is truncated")
+        try:
+            self.__plain = memoryview(self.__aead.decrypt(_nonce(self.__prefix, self.__counter, last), sealed, self.__header))
+        except InvalidTag:
+            raise EnvelopeError(f"Envelope segment {self.__counter} failed authentication (corrupt or truncated)")
+        self.__counter += 1
+        self.__done = last
+        self.__next = b"" if last else rest + self.__read_exact(sealed_size)
+
+    def readinto(self, buffer) -> int:
+        while not self.__plain and not self.__done:
+            self.__open_segment()
+        size = min(len(buffer), len(self.__plain))
+        buffer[:size] = self.__plain[:size]
+        self.__plain = self.__plain[size:]
+        return size
+
+
+class EnvelopeEncryptor:
+    # Drop-in alternative to SimpleGPG that encrypts in-process. Envelopes aren't compressed,
+    # the compress flags only exist for the common interface, archives bring their own codec.
+    suffix = ENVELOPE_SUFFIX
+
+    def __init__(self, public_key_base64: str):
+        self.__public_key = load_public_key(public_key_base64)
+
+    def open_writer(self, target: BinaryIO) -> EnvelopeWriter:
+        return EnvelopeWriter(target, self.__public_key)
+
+    def encrypt_stream(self, source: BinaryIO | int, target: BinaryIO, chunk_size: int = 1024 * 1024, compress: bool = True):
+        with self.open_writer(target) as writer:
+            while data := (os.read(source, chunk_size) if isinstance(source, int) else source.read(chunk_size)):
+                writer.write(data)
+
+    def encrypt_file(self, file_path, output_path, compress: bool = True):
+        with open(file_path, "rb") as source, open(output_path, "wb") as target:
+            self.encrypt_stream(source, target)
+
+    async def encrypt_file_async(self, file_path, output_path, compress: bool = True):
+        await asyncio.to_thread(self.encrypt_file, file_path, output_path, compress)
+
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        target = io.BytesIO()
+        with self.open_writer(target) as writer:
+            writer.write(data)
+        return target.getvalue()
+
+
+#### Decryption ####
+
+
+def envelope_decrypt_bytes(data: bytes, identity: X25519PrivateKey) -> bytes:
+    with EnvelopeReader(io.BytesIO(data), identity) as reader:
+        return reader.readall()
+
+@contextmanager
+def envelope_decrypt_stream(source: BinaryIO, identity: X25519PrivateKey) -> Iterator[BinaryIO]:
+    # Same contract as decrypt_pipe: the rest of the envelope is read and authenticated after the
+    # consumer is done, so a truncated or tampered tail fails the restore
+    with io.BufferedReader(EnvelopeReader(source, identity), 1024 * 1024) as reader:
+        yield reader  # type: ignore[misc]
+        while reader.read(1024 * 1024):
+            pass
+
+
+class EnvelopeError(Exception):
+    pass
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import threading
+
+from pathlib import Path
+from typing import NamedTuple
+
+class JournalConf(NamedTuple):
+    enabled: bool = False
+    # Older journals are discarded and the run starts over, e.g. after the job failed for days
+    max_age_h: float = 24.0
+
+class RunJournal:
+    # Progress of a backup run, saved after every step so a run that was killed (e.g. an evicted pod)
+    # continues where it stopped: completed stages, encrypted artifacts and, per destination, the
+    # snapshot id, uploaded files and open multipart uploads, each an entry of a section.
+    # A journal of another configuration (fingerprint) or older than max_age_h isn't resumed.
+    # {"version": 1, "fingerprint", "started", "sections": {section: {key: value}}}
+
+    def __init__(self, path: Path, fingerprint: str, conf: JournalConf = JournalConf()) -> None:
+        self.__path = Path(path)
+        self.__fingerprint = fingerprint
+        self.__lock = threading.Lock()
+
+        state = self.__load(conf)
+        self.resumed = state is not None
+        self.__state = state or self.__new_state()
+
+    def __load(self, conf: JournalConf) -> dict | None:
+        try:
+            with open(self.__path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable run journal {self.__path}: {e}")
+            return None
+
+        if state.get("version") != 1 or state.get("fingerprint") != self.__fingerprint:
+            print(f"Ignoring run journal {self.__path}, the configuration changed.")
+            return None
+        if time.time() - state.get("started", 0) > conf.max_age_h * 3600:
+            print(f"Ignoring run journal {self.__path}, it is older than {conf.max_age_h}h.")
+            return None
+        return state
+
+    def section(self, name: str) -> "JournalSection":
+        return JournalSection(self, name)
+
+    def get(self, section: str, key: str) -> dict | None:
+        with self.__lock:
+            value = self.__state["sections"].get(section, {}).get(key)
+            return dict(value) if value is not None else None
+
+    def items(self, section: str) -> dict[str, dict]:
+        with self.__lock:
+            return {key: dict(value) for key, value in self.__state["sections"].get(section, {}).items()}
+
+    def put(self, section: str, key: str, value: dict):
+        with self.__lock:
+            self.__state["sections"].setdefault(section, {})[key] = value
+            self.__save()
+
+    def remove(self, section: str, key: str):
+        with self.__lock:
+            if self.__state["sections"].get(section, {}).pop(key, None) is not None:
+                self.__save()
+
+    def reset(self):
+        # Starts over, e.g. after a successful run or when the state on disk can't be resumed
+        with self.__lock:
+            self.__state = self.__new_state()
+            self.resumed = False
+            self.__path.unlink(missing_ok=True)
+
+
+    #### Helpers ####
+
+
+    def __new_state(self) -> dict:
+        return {"version": 1, "fingerprint": self.__fingerprint, "started": time.time(), "sections": {}}
+
+    def __save(self):
+        # Replaced atomically and synced, a kill in the middle leaves the previous state
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.__path.with_name(f".{self.__path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(self.__state, separators=(",", ":")))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.__path)
+
+class JournalSection:
+    # The entries of one section, e.g. handed to a destination for its uploads
+
+    def __init__(self, journal: RunJournal, name: str) -> None:
+        self.__journal = journal
+        self.__name = name
+
+    def section(self, name: str) -> "JournalSection":
+        return JournalSection(self.__journal, f"{self.__name}.{name}")
+
+    def get(self, key: str) -> dict | None:
+        return self.__journal.get(self.__name, key)
+
+    def items(self) -> dict[str, dict]:
+        return self.__journal.items(self.__name)
+
+    def put(self, key: str, value: dict):
+        self.__journal.put(self.__name, key, value)
+
+    def remove(self, key: str):
+        self.__journal.remove(self.__name, key)
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+import urllib.request
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+class StageMetrics:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        # Number of times the stage was run as a timed block, counter-only stages stay at 0
+        self.runs = 0
+        self.duration = 0.0
+        # Sum of the per-file durations, exceeds the wall time when files are processed in parallel
+        self.busy = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.files = 0
+        self.retries = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "duration_seconds": round(self.duration, 6),
+            "runs": self.runs,
+            "busy_seconds": round(self.busy, 6),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "files": self.files,
+            "retries": self.retries,
+            "errors": self.errors
+        }
+
+class RunMetrics:
+    # Collects duration, byte and file counters of one job run, per stage and per file.
+    # All methods are thread-safe, the pipeline records from its worker threads.
+
+    def __init__(self, job: str) -> None:
+        self.job = job
+        self.started = time.time()
+        self.finished: float | None = None
+        self.success: bool | None = None
+        self.stages: dict[str, StageMetrics] = {}
+        self.files: list[dict] = []
+        self.__lock = threading.Lock()
+
+    def __get_stage(self, stage: str) -> StageMetrics:
+        if stage not in self.stages:
+            self.stages[stage] = StageMetrics(stage)
+        return self.stages[stage]
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[StageMetrics]:
+        with self.__lock:
+            metrics = self.__get_stage(stage)
+            metrics.runs += 1
+        start = time.perf_counter()
+        try:
+            yield metrics
+        except BaseException:
+            with self.__lock:
+                metrics.errors += 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self.__lock:
+                metrics.duration += duration
+
+    def add(self, stage: str, bytes_in: int = 0, bytes_out: int = 0, files: int = 0, retries: int = 0):
+        with self.__lock:
+            metrics = self.__get_stage(stage)
+            metrics.bytes_in += bytes_in
+            metrics.bytes_out += bytes_out
+            metrics.files += files
+            metrics.retries += retries
+
+    def add_file(self, stage: str, name: str, bytes_in: int, bytes_out: int, duration: float, retries: int = 0):
+        # retries of the file, the stage already counted them with count_retry as they happened
+        self.add(stage, bytes_in, bytes_out, 1)
+        with self.__lock:
+            self.stages[stage].busy += duration
+            self.files.append({
+                "stage": stage,
+                "name": name,
+                "bytes_in": bytes_in,
+                "bytes_out": bytes_out,
+                "duration_seconds": round(duration, 6),
+                "retries": retries
+            })
+
+    def count_retry(self, stage: str):
+        self.add(stage, retries=1)
+
+    def stage_times(self) -> dict[str, float]:
+        with self.__lock:
+            return {name: stage.duration for name, stage in self.stages.items() if stage.runs}
+
+    def finish(self, success: bool):
+        self.finished = time.time()
+        self.success = success
+
+    def duration(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    def summary(self) -> dict:
+        with self.__lock:
+            return {
+                "job": self.job,
+                "started": self.started,
+                "finished": self.finished,
+                "duration_seconds": round(self.duration(), 6),
+                "success": self.success,
+                "stages": {name: stage.as_dict() for name, stage in self.stages.items()},
+                "files": list(self.files)
+            }
+
+class CountingWriter:
+    # Passes writes through to target and counts the bytes, optionally feeding a hashlib digest
+    def __init__(self, target: BinaryIO, digest=None) -> None:
+        self.__target = target
+        self.digest = digest
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.__target.write(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+#### Export ####
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def to_openmetrics(runs: list[RunMetrics]) -> str:
+    # Prometheus text exposition format, per-file values are left to the JSON summary to keep cardinality low
+    families: dict[str, tuple[str, str, list[str]]] = {
+        "backupster_run_duration_seconds": ("gauge", "Duration of the last run of a job", []),
+        "backupster_run_success": ("gauge", "1 if the last run of a job succeeded", []),
+        "backupster_run_last_timestamp_seconds": ("gauge", "Start of the last run of a job", []),
+        "backupster_stage_duration_seconds": ("gauge", "Wall time of a pipeline stage in the last run", []),
+        "backupster_stage_busy_seconds": ("gauge", "Summed per-file processing time of a pipeline stage in the last run", []),
+        "backupster_stage_bytes_in": ("gauge", "Bytes read by a pipeline stage in the last run", []),
+        "backupster_stage_bytes_out": ("gauge", "Bytes written by a pipeline stage in the last run", []),
+        "backupster_stage_files": ("gauge", "Files processed by a pipeline stage in the last run", []),
+        "backupster_stage_retries": ("gauge", "Retries of a pipeline stage in the last run", []),
+        "backupster_stage_errors": ("gauge", "Failed executions of a pipeline stage in the last run", []),
+    }
+
+    for run in runs:
+        job = f'job_name="{_escape(run.job)}"'
+        families["backupster_run_duration_seconds"][2].append(f"{{{job}}} {run.duration():.6f}")
+        families["backupster_run_success"][2].append(f"{{{job}}} {1 if run.success else 0}")
+        families["backupster_run_last_timestamp_seconds"][2].append(f"{{{job}}} {run.started:.3f}")
+        for name, stage in run.stages.items():
+            labels = f'{{{job},stage="{_escape(name)}"}}'
+            if stage.runs:
+                families["backupster_stage_duration_seconds"][2].append(f"{labels} {stage.duration:.6f}")
+            if stage.busy:
+                families["backupster_stage_busy_seconds"][2].append(f"{labels} {stage.busy:.6f}")
+            families["backupster_stage_bytes_in"][2].append(f"{labels} {stage.bytes_in}")
+            families["backupster_stage_bytes_out"][2].append(f"{labels} {stage.bytes_out}")
+            families["backupster_stage_files"][2].append(f"{labels} {stage.files}")
+            families["backupster_stage_retries"][2].append(f"{labels} {stage.retries}")
+            families["backupster_stage_errors"][2].append(f"{labels} {stage.errors}")
+
+    lines = []
+    for name, (metric_type, help_text, samples) in families.items():
+        if not samples:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(f"{name}{sample}" for sample in samples)
+    return "\n".join(lines) + "\n"
+
+def _write_atomic(path: Path, data: str):
+    # The node_exporter textfile collector must never see a half written file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_textfile(path: Path, runs: list[RunMetrics]):
+    _write_atomic(Path(path), to_openmetrics(runs))
+
+def write_summary(path: Path, runs: list[RunMetrics]):
+    _write_atomic(Path(path), json.dumps({"runs": [run.summary() for run in runs]}, indent=2))
+
+def push_gateway(url: str, runs: list[RunMetrics], instance: str = ""):
+    target = f"{url.rstrip('/')}/metrics/job/backupster"
+    if instance:
+        target += f"/instance/{instance}"
+
+    request = urllib.request.Request(
+        target,
+        data=to_openmetrics(runs).encode(),
+        method="PUT",
+        headers={"Content-Type": "text/plain; version=0.0.4"}
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        if response.status >= 300:
+            raise MetricsError(f"Pushgateway returned {response.status}")
+
+
+class MetricsError(Exception):
+    pass
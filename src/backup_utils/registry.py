@@ -0,0 +1,59 @@
+import time
+import importlib
+import threading
+
+class TypeRegistry:
+    # Maps the type names of the configuration to the modules implementing them. A module (and with
+    # it its client libraries) is only imported when its type is used. Types of other packages are
+    # found through the entry point group, e.g. in pyproject.toml:
+    #   [project.entry-points."backupster.destinations"]
+    #   sftp = "backupster_sftp"
+    # The module of a type exposes it as `attribute`.
+
+    def __init__(self, package: str, group: str, modules: dict[str, str], attribute: str) -> None:
+        self.__package = package
+        self.__group = group
+        self.__modules = dict(modules)
+        self.__attribute = attribute
+        self.__loaded: dict[str, object] = {}
+        self.__lock = threading.Lock()
+        # Seconds spent importing each loaded type, for --profile-startup
+        self.load_times: dict[str, float] = {}
+
+    def names(self) -> list[str]:
+        # Built-in types only, looking up entry points costs a scan of all installed packages
+        return sorted(self.__modules)
+
+    def __module_name(self, name: str) -> str:
+        if name in self.__modules:
+            return self.__modules[name]
+        # Imported here, importlib.metadata alone costs more than the startup of the built-in types
+        from importlib.metadata import entry_points
+        for entry_point in entry_points(group=self.__group):
+            if entry_point.name == name:
+                return entry_point.value
+        raise ValueError(f"Unknown {self.__group.split('.')[-1][:-1]} type: {name}, available: {', '.join(self.names())}")
+
+    def load(self, name: str):
+        with self.__lock:
+            if name not in self.__loaded:
+                start = time.perf_counter()
+                module = importlib.import_module(self.__module_name(name), self.__package)
+                try:
+                    self.__loaded[name] = getattr(module, self.__attribute)
+                except AttributeError:
+                    raise RegistryError(f"{module.__name__} doesn't define {self.__attribute}")
+                self.load_times[name] = time.perf_counter() - start
+            return self.__loaded[name]
+
+def lazy_exports(package: str, exports: dict[str, str]):
+    # Module __getattr__ (PEP 562) that imports the submodule of a name on first access
+    def __getattr__(name: str):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        return getattr(importlib.import_module(exports[name], package), name)
+    return __getattr__
+
+
+class RegistryError(Exception):
+    pass
@@ -1,7 +1,17 @@
 import gnupg
+import asyncio
 import base64
+import threading
+import subprocess
+
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+from .encryptor import GPG_SUFFIX
 
 class SimpleGPG:
+    suffix = GPG_SUFFIX
+
     def __init__(self, public_key_base64: str):
         self.__gpg = gnupg.GPG()
         self.__fingerprint = self.__import_key(public_key_base64)
@@ -11,13 +21,133 @@ class SimpleGPG:
         self.__gpg.trust_keys(key_import.fingerprints, 'TRUST_ULTIMATE')
         return key_import.fingerprints[0]
 
-    def encrypt_file(self, file_path, output_path):
+    def encrypt_file(self, file_path, output_path, compress: bool = True):
         with open(file_path, 'rb') as file:
-            status = self.__gpg.encrypt_file(file, recipients=[self.__fingerprint], output=output_path)
+            status = self.__gpg.encrypt_file(file, recipients=[self.__fingerprint], output=output_path, extra_args=self.__compress_args(compress))
 
             if not status.ok:
                 raise MyGPGEncryptionError("Failed to encrypt file:\n" + status.stderr)
 
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        status = self.__gpg.encrypt(data, recipients=[self.__fingerprint], armor=False)
+
+        if not status.ok:
+            raise MyGPGEncryptionError("Failed to encrypt data:\n" + status.stderr)
+        return status.data
+
+    def __compress_args(self, compress: bool) -> list[str]:
+        # Already compressed archives would only be compressed a second time for nothing
+        return [] if compress else ["--compress-algo", "none"]
+
+    def __encrypt_args(self, compress: bool = True) -> list[str]:
+        args = [self.__gpg.gpgbinary, "--batch", "--no-tty", "--yes", "--trust-model", "always"]
+        if self.__gpg.gnupghome:
+            args += ["--homedir", self.__gpg.gnupghome]
+        return args + self.__compress_args(compress) + ["--recipient", self.__fingerprint]
+
+    async def encrypt_file_async(self, file_path, output_path, compress: bool = True):
+        proc = await asyncio.create_subprocess_exec(
+            *self.__encrypt_args(compress), "--output", str(output_path), "--encrypt", str(file_path),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await proc.communicate()
+
+        if proc.returncode != 0:
+            raise MyGPGEncryptionError("Failed to encrypt file:\n" + stderr.decode(errors="replace"))
+
+    def encrypt_stream(self, source: BinaryIO | int, target: BinaryIO, chunk_size: int = 1024 * 1024, compress: bool = True):
+        # python-gnupg buffers the whole ciphertext in memory when no output file is given,
+        # so for streaming the gpg binary is driven directly against the imported keyring
+        args = self.__encrypt_args(compress) + ["--encrypt"]
+
+        proc = subprocess.Popen(args, stdin=source, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        assert proc.stdout is not None and proc.stderr is not None
+        stderr: list[bytes] = []
+        # Read stderr in the background, a full stderr pipe would block gpg while this waits on stdout
+        stderr_reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)  # type: ignore[union-attr]
+        stderr_reader.start()
+        try:
+            while chunk := proc.stdout.read(chunk_size):
+                target.write(chunk)
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            stderr_reader.join()
+
+        if proc.returncode != 0:
+            raise MyGPGEncryptionError("Failed to encrypt stream:\n" + b"".join(stderr).decode(errors="replace"))
+
+
+#### Decryption ####
+
+
+def _decrypt_args(gnupghome: str | None) -> list[str]:
+    # Decryption uses the keyring of the operator running the restore, not the one of the backup run
+    args = ["gpg", "--batch", "--no-tty", "--yes"]
+    if gnupghome:
+        args += ["--homedir", gnupghome]
+    return args + ["--decrypt"]
+
+def decrypt_bytes(data: bytes, gnupghome: str | None = None) -> bytes:
+    res = subprocess.run(_decrypt_args(gnupghome), input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        raise MyGPGDecryptionError("Failed to decrypt data:\n" + res.stderr.decode(errors="replace"))
+    return res.stdout
+
+@contextmanager
+def decrypt_pipe(source: BinaryIO, gnupghome: str | None = None, chunk_size: int = 1024 * 1024) -> Iterator[BinaryIO]:
+    # Yields the plaintext stream of gpg, fed from source by a background thread. gpg only reports
+    # a failed integrity check at the end, so the result is checked after the consumer is done.
+    proc = subprocess.Popen(_decrypt_args(gnupghome), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.stdin is not None and proc.stdout is not None and proc.stderr is not None
+    errors: list[BaseException] = []
+    stderr: list[bytes] = []
+
+    def feed():
+        try:
+            while data := source.read(chunk_size):
+                proc.stdin.write(data)  # type: ignore[union-attr]
+        except BrokenPipeError:
+            pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()  # type: ignore[union-attr]
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="gpg-decrypt-feed", daemon=True)
+    # Read stderr in the background as well, a full stderr pipe would block gpg
+    stderr_reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)  # type: ignore[union-attr]
+    feeder.start()
+    stderr_reader.start()
+
+    try:
+        yield proc.stdout  # type: ignore[misc]
+        while proc.stdout.read(chunk_size):
+            pass
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        proc.wait()
+        feeder.join()
+        stderr_reader.join()
+
+    if errors:
+        raise errors[0]
+    if proc.returncode != 0:
+        raise MyGPGDecryptionError("Failed to decrypt stream:\n" + b"".join(stderr).decode(errors="replace"))
+
 
 class MyGPGEncryptionError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class MyGPGDecryptionError(Exception):
+    pass
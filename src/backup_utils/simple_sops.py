@@ -1,13 +1,22 @@
 import os
+import json
+import time
 import base64
+import hashlib
+import threading
 
 from pathlib import Path
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 from typing import NamedTuple
 from abc import ABC, abstractmethod
 
+import yaml
+
 from sopsy import Sops
 
+from .credentials import gcp_credentials
+from .sops_native import SopsNativeError, decrypt_document, gcp_kms_data_key
+
 
 class SopsConfGCP(NamedTuple):
     kms_id: str
@@ -18,6 +27,12 @@ class SopsConfAWS(NamedTuple):
     profile: str = ""
     role: str = ""
 
+class SopsCacheConf(NamedTuple):
+    # Decrypted configurations are reused for ttl_s seconds (0 disables the cache), in memory and,
+    # if dir is set (ideally a tmpfs like /dev/shm), across processes; files are sealed with the SOPS secret
+    ttl_s: int = 600
+    dir: str = ""
+
 class _ConfParser(ABC):
     def _decrypt_string(self, pw: str, encrypted: str) -> str:
         cipher_suite = Fernet(pw)
@@ -28,27 +43,51 @@ class _ConfParser(ABC):
     def parse_conf(self, pw: str) -> dict:
         pass
 
+    @abstractmethod
+    def setup_subprocess_auth(self):
+        # Credentials for the sops binary, only needed when it actually runs
+        pass
+
+    @abstractmethod
+    def decrypt_data_key(self, metadata: dict) -> bytes:
+        # Data key of a SOPS document for the in-process decryption
+        pass
+
 class _ConfParserGCP(_ConfParser):
     def __init__(self, conf_dir: Path, conf: SopsConfGCP) -> None:
         super().__init__()
         self.__conf = conf
+        self.__svc_key_b64 = ""
 
     def parse_conf(self, pw: str) -> dict:
+        self.__svc_key_b64 = self._decrypt_string(pw, self.__conf.svc_key)
+
+        conf = {
+            "gcp_kms": self.__conf.kms_id
+        }
+
+        return conf
+
+    def setup_subprocess_auth(self):
         svc_key_path = Path.home() / ".config/gcloud/application_default_credentials.json"
+        svc_key = base64.b64decode(self.__svc_key_b64).decode()
 
-        svc_key_b64 = self._decrypt_string(pw, self.__conf.svc_key)
-        svc_key = base64.b64decode(svc_key_b64).decode()
+        # Unchanged since the last run of this container, no need to rewrite the read-only file
+        if svc_key_path.exists() and svc_key_path.read_text() == svc_key:
+            return
 
         svc_key_path.parent.mkdir(exist_ok=True, parents=True)
+        if svc_key_path.exists():
+            os.chmod(svc_key_path, 0o600)
         with open(svc_key_path, "w+") as f:
             f.write(svc_key)
             os.chmod(svc_key_path, 0o400)
 
-        conf = {
-            "gcp_kms": self.__conf.kms_id
-        }
+    def decrypt_data_key(self, metadata: dict) -> bytes:
+        from google.auth.transport.requests import AuthorizedSession
 
-        return conf
+        # Same credentials object as the storage clients of the same service account
+        return gcp_kms_data_key(metadata, AuthorizedSession(gcp_credentials(self.__svc_key_b64)))
     
 class __ConfParserAWS(_ConfParser):
     def __init__(self, conf_dir: Path, conf: SopsConfAWS) -> None:
@@ -59,10 +98,77 @@ class __ConfParserAWS(_ConfParser):
     def parse_conf(self, pw: str) -> dict:
         return super().parse_conf(pw)
 
+    def setup_subprocess_auth(self):
+        raise SopsError("AWS KMS is not supported yet")
+
+    def decrypt_data_key(self, metadata: dict) -> bytes:
+        raise SopsNativeError("AWS KMS is not supported yet")
+
+class _SopsCache:
+    # Decrypted documents by the hash of the encrypted file and the SOPS configuration. Files are
+    # Fernet tokens, which carry their creation time, so the TTL is checked on decryption.
+
+    # Shared by all SimpleSops objects of the process
+    _memory: dict[str, tuple[float, str]] = {}
+    _memory_lock = threading.Lock()
+
+    def __init__(self, pw: str, conf: SopsCacheConf) -> None:
+        self.__fernet = Fernet(pw)
+        self.__ttl_s = conf.ttl_s
+        self.__dir = Path(conf.dir) if conf.dir else None
+
+    def get(self, key: str) -> dict | None:
+        if self.__ttl_s <= 0:
+            return None
+        with self._memory_lock:
+            cached = self._memory.get(key)
+        if cached and cached[0] > time.monotonic():
+            # A copy, callers may modify what they get
+            return json.loads(cached[1])
+        if self.__dir is None:
+            return None
+        try:
+            data = self.__fernet.decrypt((self.__dir / key).read_bytes(), ttl=self.__ttl_s).decode()
+            document = json.loads(data)
+        except (OSError, InvalidToken, ValueError):
+            return None
+        self.__remember(key, data)
+        return document
+
+    def put(self, key: str, document: dict):
+        if self.__ttl_s <= 0:
+            return
+        data = json.dumps(document)
+        self.__remember(key, data)
+        if self.__dir is None:
+            return
+        try:
+            self.__dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp_path = self.__dir / f".{key}.{os.getpid()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.__fernet.encrypt(data.encode()))
+            os.replace(tmp_path, self.__dir / key)
+        except OSError as e:
+            # The cache only saves time, a read-only or full tmpfs must not fail the run
+            print(f"Failed to cache the decrypted configuration in {self.__dir}: {e}")
+
+    def __remember(self, key: str, data: str):
+        with self._memory_lock:
+            self._memory[key] = (time.monotonic() + self.__ttl_s, data)
+
 class SimpleSops:
 
-    def __init__(self, conf_dir: Path, pw: str, provider: str, config: SopsConfGCP | SopsConfAWS) -> None:
+    def __init__(self,
+                 conf_dir: Path,
+                 pw: str,
+                 provider: str,
+                 config: SopsConfGCP | SopsConfAWS,
+                 cache: SopsCacheConf = SopsCacheConf(),
+                 native: bool = False) -> None:
         self.__conf_dir = conf_dir
+        self.__native = native
+        self.__cache = _SopsCache(pw, cache)
 
         if provider == "gcp" and isinstance(config, SopsConfGCP):
             conf_parser = _ConfParserGCP(conf_dir, config)
@@ -72,6 +178,7 @@ class SimpleSops:
             raise SopsError(f"Unknown provider or wrong provider config: {provider}")
 
         conf = conf_parser.parse_conf(pw)
+        self.__conf_parser = conf_parser
 
         self.__config = {
             "creation_rules": [
@@ -80,6 +187,32 @@ class SimpleSops:
         }
 
     def decrypt_file(self, src_path: Path, dst_path: Path | None = None) -> dict | None:
+        if dst_path:
+            self.__decrypt_subprocess(src_path, dst_path)
+            return None
+
+        # A hit skips the sops binary and the KMS call, the key covers content and configuration
+        encrypted = Path(src_path).read_bytes()
+        key = hashlib.sha256(encrypted + json.dumps(self.__config, sort_keys=True).encode()).hexdigest()
+        cached = self.__cache.get(key)
+        if cached is not None:
+            print("Using the cached decrypted configuration.")
+            return cached
+
+        decrypted = None
+        if self.__native:
+            try:
+                decrypted = decrypt_document(yaml.safe_load(encrypted), self.__conf_parser.decrypt_data_key)
+            except SopsNativeError as e:
+                print(f"In-process SOPS decryption failed, falling back to the sops binary: {e}")
+        if decrypted is None:
+            decrypted = self.__decrypt_subprocess(src_path)
+
+        self.__cache.put(key, decrypted)
+        return decrypted
+
+    def __decrypt_subprocess(self, src_path: Path, dst_path: Path | None = None) -> dict:
+        self.__conf_parser.setup_subprocess_auth()
         sops = Sops(
             file=Path(src_path),
             config=f"{self.__conf_dir}/.sops.yaml",
@@ -89,6 +222,7 @@ class SimpleSops:
 
         if dst_path:
             sops.decrypt()
+            return {}
         else:
             decrypted = sops.decrypt(to_dict=True)
             if isinstance(decrypted, dict):
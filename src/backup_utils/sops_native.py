@@ -0,0 +1,108 @@
+import re
+import base64
+import hashlib
+
+from datetime import datetime, timezone
+from typing import Callable
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# In-process decryption of SOPS (v3) YAML/JSON documents, without the sops binary:
+#   every encrypted value is ENC[AES256_GCM,data:..,iv:..,tag:..,type:..], sealed with the data key
+#   and the path of its keys ("a:b:") as associated data; list items share the path of the list.
+#   sops.mac is the uppercase hex SHA-512 over all values of the tree in document order, sealed with
+#   sops.lastmodified as associated data. The data key itself is encrypted by a KMS, decrypt_key
+#   is called with the metadata of the document and returns it.
+_ENC_VALUE = re.compile(r"^ENC\[AES256_GCM,data:(?P<data>[^,]*),iv:(?P<iv>[^,]+),tag:(?P<tag>[^,]+),type:(?P<type>[a-z]+)\]$")
+
+def _decrypt_value(value: str, key: AESGCM, aad: str) -> tuple[object, bytes]:
+    # Returns the typed value and the bytes sops hashes for the MAC
+    match = _ENC_VALUE.match(value)
+    if match is None:
+        raise SopsNativeError(f"Malformed encrypted value at {aad or 'the root'}")
+    try:
+        sealed = base64.b64decode(match["data"]) + base64.b64decode(match["tag"])
+        plain = key.decrypt(base64.b64decode(match["iv"]), sealed, aad.encode())
+    except InvalidTag:
+        raise SopsNativeError(f"Value at {aad} failed authentication (wrong key or tampered file)")
+
+    value_type = match["type"]
+    text = plain.decode()
+    if value_type == "str":
+        return text, plain
+    if value_type == "int":
+        return int(text), plain
+    if value_type == "float":
+        return float(text), plain
+    if value_type == "bool":
+        return text == "True", plain
+    if value_type == "bytes":
+        return plain, plain
+    raise SopsNativeError(f"Unsupported value type {value_type} at {aad} (encrypted comments need the sops binary)")
+
+def _plain_bytes(value: object) -> bytes:
+    # Same representation sops uses when it hashes an unencrypted value
+    if isinstance(value, bool):
+        return b"True" if value else b"False"
+    if isinstance(value, bytes):
+        return value
+    if value is None:
+        return b""
+    return str(value).encode()
+
+def _walk(node: object, path: list[str], key: AESGCM, digest, only_encrypted: bool) -> object:
+    if isinstance(node, dict):
+        return {name: _walk(value, path + [str(name)], key, digest, only_encrypted) for name, value in node.items()}
+    if isinstance(node, list):
+        return [_walk(item, path, key, digest, only_encrypted) for item in node]
+    if isinstance(node, str) and node.startswith("ENC["):
+        value, plain = _decrypt_value(node, key, ":".join(path) + ":")
+        digest.update(plain)
+        return value
+    if not only_encrypted:
+        digest.update(_plain_bytes(node))
+    return node
+
+def _lastmodified(metadata: dict) -> str:
+    value = metadata.get("lastmodified")
+    if isinstance(value, datetime):
+        # YAML loaders turn the unquoted timestamp into a datetime, sops seals the RFC 3339 string
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    if not isinstance(value, str):
+        raise SopsNativeError("The document has no sops.lastmodified")
+    return value
+
+def decrypt_document(document: dict, decrypt_key: Callable[[dict], bytes]) -> dict:
+    metadata = document.get("sops")
+    if not isinstance(metadata, dict):
+        raise SopsNativeError("Not a SOPS document, the sops metadata is missing")
+    key = AESGCM(decrypt_key(metadata))
+
+    digest = hashlib.sha512()
+    tree = {name: value for name, value in document.items() if name != "sops"}
+    decrypted = _walk(tree, [], key, digest, bool(metadata.get("mac_only_encrypted")))
+
+    mac, _ = _decrypt_value(metadata.get("mac", ""), key, _lastmodified(metadata))
+    if not isinstance(mac, str) or mac.upper() != digest.hexdigest().upper():
+        raise SopsNativeError("MAC mismatch, the document was modified or holds encrypted comments")
+    return decrypted  # type: ignore[return-value]
+
+def gcp_kms_data_key(metadata: dict, session) -> bytes:
+    # Data key of the first gcp_kms entry, decrypted with the KMS REST API on an authorized session
+    entries = metadata.get("gcp_kms") or []
+    if not entries:
+        raise SopsNativeError("The document has no gcp_kms key")
+    entry = entries[0]
+    response = session.post(
+        f"https://cloudkms.googleapis.com/v1/{entry['resource_id']}:decrypt",
+        json={"ciphertext": entry["enc"]},
+        timeout=30
+    )
+    if not response.ok:
+        raise SopsNativeError(f"KMS decrypt with {entry['resource_id']} failed: {response.status_code} {response.text[:200]}")
+    return base64.b64decode(response.json()["plaintext"])
+
+
+class SopsNativeError(Exception):
+    pass
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+# Cached hashes of files modified this close to the cache write aren't trusted, a change within
+# the same mtime tick wouldn't show in size and mtime
+_RACY_NS = 2_000_000_000
+
+_READ_SIZE = 1024 * 1024
+
+class TreeFingerprint(NamedTuple):
+    # Merkle root over the top-level entries, equal roots mean equal content, names and modes
+    root: str
+    # Merkle hash of every top-level directory and file
+    entries: dict[str, str]
+    # Relative path -> [size, mtime_ns, sha256] of every file
+    files: dict[str, list]
+
+    def as_dict(self) -> dict:
+        # What the catalog keeps, the per-file list stays in the local cache
+        return {"root": self.root, "entries": self.entries}
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(_READ_SIZE):
+            digest.update(data)
+    return digest.hexdigest()
+
+def _file_node(mode: int, sha256: str) -> str:
+    return hashlib.sha256(f"file\0{mode & 0o777:o}\0{sha256}".encode()).hexdigest()
+
+def _dir_node(children: dict[str, str]) -> str:
+    return hashlib.sha256(b"dir\0" + "".join(f"{name}\0{node}\n" for name, node in sorted(children.items())).encode()).hexdigest()
+
+def _load_cache(cache_path: Path | None) -> tuple[dict[str, list], int]:
+    if cache_path is None:
+        return {}, 0
+    try:
+        with open(cache_path, "r") as f:
+            cache = json.load(f)
+        return cache["files"], cache["written_ns"]
+    except (OSError, ValueError, KeyError):
+        return {}, 0
+
+def _save_cache(cache_path: Path, files: dict[str, list]):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f".{cache_path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps({"written_ns": time.time_ns(), "files": files}, separators=(",", ":")))
+    os.replace(tmp_path, cache_path)
+
+def fingerprint_tree(base_path: Path, names: list[str], cache_path: Path | None = None, workers: int = 1) -> TreeFingerprint:
+    # Fingerprint of the entries names below base_path. Files whose size and mtime match the cache
+    # (the files of the previous fingerprint) aren't read again, the others are hashed in parallel.
+    cached, written_ns = _load_cache(cache_path)
+
+    # Relative path -> stat of every file, child names of every directory, target of every symlink
+    stats: dict[str, os.stat_result] = {}
+    children: dict[str, list[str]] = {}
+    links: dict[str, str] = {}
+
+    def add(path: Path, rel_path: str):
+        if path.is_symlink():
+            links[rel_path] = os.readlink(path)
+        elif path.is_dir():
+            children[rel_path] = sorted(os.listdir(path))
+            for name in children[rel_path]:
+                add(path / name, f"{rel_path}/{name}")
+        else:
+            stats[rel_path] = path.stat()
+
+    for name in names:
+        add(base_path / name, name)
+
+    hashes: dict[str, str] = {}
+    missing = []
+    for rel_path, stat in stats.items():
+        entry = cached.get(rel_path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns and stat.st_mtime_ns < written_ns - _RACY_NS:
+            hashes[rel_path] = entry[2]
+        else:
+            missing.append(rel_path)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for rel_path, sha256 in zip(missing, pool.map(lambda rel_path: _hash_file(base_path / rel_path), missing)):
+            hashes[rel_path] = sha256
+
+    def node(rel_path: str) -> str:
+        if rel_path in links:
+            return hashlib.sha256(f"link\0{links[rel_path]}".encode()).hexdigest()
+        if rel_path in children:
+            return _dir_node({name: node(f"{rel_path}/{name}") for name in children[rel_path]})
+        return _file_node(stats[rel_path].st_mode, hashes[rel_path])
+
+    entries = {name: node(name) for name in names}
+    files = {rel_path: [stat.st_size, stat.st_mtime_ns, hashes[rel_path]] for rel_path, stat in sorted(stats.items())}
+    if cache_path is not None:
+        _save_cache(cache_path, files)
+    return TreeFingerprint(_dir_node(entries), entries, files)
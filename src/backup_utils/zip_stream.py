@@ -0,0 +1,161 @@
+import zlib
+import struct
+
+from pathlib import Path
+from typing import BinaryIO
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_SIGNATURE = 0x04034b50
+_DESCRIPTOR_SIGNATURE = 0x08074b50
+_ZIP64_EXTRA = 0x0001
+
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+_STORED = 0
+_DEFLATED = 8
+
+class _StreamReader:
+    # Buffered reads from an unseekable stream with the option to push back bytes read too far
+    def __init__(self, stream: BinaryIO, chunk_size: int) -> None:
+        self.__stream = stream
+        self.__chunk_size = chunk_size
+        self.__buffer = b""
+
+    def read(self, size: int) -> bytes:
+        if not self.__buffer:
+            return self.__stream.read(min(size, self.__chunk_size))
+        data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        parts = []
+        while size > 0:
+            data = self.read(size)
+            if not data:
+                raise ZipStreamError("Unexpected end of zip stream")
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes):
+        self.__buffer = data + self.__buffer
+
+    def drain(self):
+        self.__buffer = b""
+        while self.__stream.read(self.__chunk_size):
+            pass
+
+def _parse_extra(extra: bytes) -> dict[int, bytes]:
+    fields = {}
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, length = struct.unpack_from("<HH", extra, pos)
+        fields[field_id] = extra[pos + 4:pos + 4 + length]
+        pos += 4 + length
+    return fields
+
+def safe_path(target_dir: Path, name: str) -> Path:
+    # Joins an archive/manifest path to target_dir, never pointing outside of it
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        raise ValueError(f"Refusing to extract unsafe path: {name}")
+    return target_dir.joinpath(*parts)
+
+def _copy_entry(reader: _StreamReader, target, method: int, flags: int, compress_size: int) -> tuple[int, int]:
+    # Returns (crc32, size) of the uncompressed data
+    crc = 0
+    size = 0
+    decompressor = zlib.decompressobj(-15) if method == _DEFLATED else None
+
+    if flags & _FLAG_DESCRIPTOR:
+        # Sizes are only known after the data, the end of a deflate stream marks the end of the entry
+        if decompressor is None:
+            raise ZipStreamError("Stored zip entries with data descriptor can't be streamed")
+        while not decompressor.eof:
+            data = reader.read(1024 * 1024)
+            if not data:
+                raise ZipStreamError("Unexpected end of zip stream")
+            plain = decompressor.decompress(data)
+            crc = zlib.crc32(plain, crc)
+            size += len(plain)
+            target.write(plain)
+        reader.unread(decompressor.unused_data)
+        return crc, size
+
+    remaining = compress_size
+    while remaining > 0:
+        data = reader.read(min(remaining, 1024 * 1024))
+        if not data:
+            raise ZipStreamError("Unexpected end of zip stream")
+        remaining -= len(data)
+        plain = decompressor.decompress(data) if decompressor else data
+        crc = zlib.crc32(plain, crc)
+        size += len(plain)
+        target.write(plain)
+    if decompressor:
+        plain = decompressor.flush()
+        crc = zlib.crc32(plain, crc)
+        size += len(plain)
+        target.write(plain)
+    return crc, size
+
+def extract_zip_stream(stream: BinaryIO, target_dir: Path, chunk_size: int = 1024 * 1024) -> int:
+    # Extracts a zip file from an unseekable stream by walking its local file headers, the
+    # central directory at the end is not needed and skipped. Returns the number of files.
+    reader = _StreamReader(stream, chunk_size)
+    files = 0
+
+    while True:
+        signature = reader.read_exact(4)
+        if struct.unpack("<I", signature)[0] != _LOCAL_SIGNATURE:
+            reader.drain()
+            return files
+
+        header = _LOCAL_HEADER.unpack(signature + reader.read_exact(_LOCAL_HEADER.size - 4))
+        _, _, flags, method, _, _, crc, compress_size, size, name_length, extra_length = header
+        raw_name = reader.read_exact(name_length)
+        name = raw_name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+        extra = _parse_extra(reader.read_exact(extra_length))
+
+        zip64 = _ZIP64_EXTRA in extra
+        if zip64:
+            # Only the sizes that are saturated in the header are present in the zip64 field
+            values = list(struct.unpack_from(f"<{len(extra[_ZIP64_EXTRA]) // 8}Q", extra[_ZIP64_EXTRA]))
+            if size == 0xFFFFFFFF and values:
+                size = values.pop(0)
+            if compress_size == 0xFFFFFFFF and values:
+                compress_size = values.pop(0)
+
+        if method not in (_STORED, _DEFLATED):
+            raise ZipStreamError(f"Unsupported compression method {method} of {name}")
+
+        path = safe_path(target_dir, name)
+        if name.endswith("/"):
+            path.mkdir(parents=True, exist_ok=True)
+            _copy_entry(reader, _Discard(), method, flags, compress_size)
+            actual_crc = crc
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                actual_crc, _ = _copy_entry(reader, f, method, flags, compress_size)
+            files += 1
+
+        if flags & _FLAG_DESCRIPTOR:
+            data = reader.read_exact(4)
+            if struct.unpack("<I", data)[0] != _DESCRIPTOR_SIGNATURE:
+                # The descriptor signature is optional
+                reader.unread(data)
+            descriptor = reader.read_exact(20 if zip64 else 12)
+            crc = struct.unpack_from("<I", descriptor)[0]
+
+        if not name.endswith("/") and actual_crc != crc:
+            raise ZipStreamError(f"CRC mismatch of {name}")
+
+class _Discard:
+    def write(self, data: bytes) -> int:
+        return len(data)
+
+
+class ZipStreamError(Exception):
+    pass
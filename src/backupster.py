@@ -1,29 +1,91 @@
+import os
+import json
+import hashlib
+import time
 import yaml
+import shutil
+import asyncio
+import threading
+import multiprocessing
 
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from multiprocessing.context import BaseContext
 from pathlib import Path
-from typing import NamedTuple
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterable, Iterator, NamedTuple
 
 import backup_sources as src
 import backup_destinations as dst
 import backup_utils as bu
 
+from backup_sources import AsyncBackupSource, BackupSource
+from backup_destinations import AsyncBackupDestination, BackupDestination
+
+if TYPE_CHECKING:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
 class _BackupsterSrcConf(NamedTuple):
     type: str
-    conf: src.DavBackupSourceConfig | src.VaultwardenBackupSourceConfig | src.TestBackupSourceConfig | None
+    # Config of the source type, see backup_sources.SOURCES
+    conf: NamedTuple
 
 class _BackupsterDstConf(NamedTuple):
     type: str
-    conf: dst.GCPBackupDestinationConfig
+    # Config of the destination type, see backup_destinations.DESTINATIONS
+    conf: NamedTuple
+    transfer: dst.TransferConf = dst.TransferConf()
 
-class _BackupsterConf(NamedTuple):
+class _EncryptionConf(NamedTuple):
+    # gpg: SimpleGPG with the "gpg" key, envelope: in-process EnvelopeEncryptor with public_key
+    engine: str = "gpg"
+    public_key: str = ""
+
+class _BackupsterJobConf(NamedTuple):
+    name: str
     src: _BackupsterSrcConf
-    dst: _BackupsterDstConf
+    dst: list[_BackupsterDstConf]
     gpg: str
+    stream: bool = False
+    workers: int = 1
+    dedup: bool = False
+    retention: dst.RetentionPolicy | None = None
+    archive: bu.ArchiveConf = bu.ArchiveConf()
+    encryption: _EncryptionConf = _EncryptionConf()
+    resume: bu.JournalConf = bu.JournalConf()
+    skip_unchanged: bool = False
+    # Cron expression the daemon runs the job at, not run by the daemon if empty
+    schedule: str = ""
+
+class _MetricsConf(NamedTuple):
+    textfile: str = ""
+    summary: str = ""
+    pushgateway: str = ""
+    instance: str = ""
+
+class _DaemonConf(NamedTuple):
+    # Health/status endpoint of the daemon, disabled with port 0
+    host: str = "127.0.0.1"
+    port: int = 8080
+
+class _BackupsterConf(NamedTuple):
+    jobs: list[_BackupsterJobConf]
+    concurrency: int = 1
+    engine: str = "threads"
+    metrics: _MetricsConf = _MetricsConf()
+    daemon: _DaemonConf = _DaemonConf()
+    # Jobs from a "jobs:" list get their own work/backup subdirectories
+    multi_job: bool = False
 
 class _SopsConf(NamedTuple):
     type: str
     secret_path: str
-    conf: bu.SopsConfGCP
+    # String annotations, the SOPS module (and sopsy) is only imported when the configuration is decrypted
+    conf: "bu.SopsConfGCP"
+    cache: "bu.SopsCacheConf"
+    # Decrypt in-process (KMS REST call + AES-GCM) instead of running the sops binary
+    native: bool = False
 
 
 class ConfParser:
@@ -36,63 +98,842 @@ class ConfParser:
             conf=bu.SopsConfGCP(
                 kms_id=data["conf"]["gcp_kms_id"],
                 svc_key=data["conf"]["gcp_svc_key"]
-            )
+            ),
+            cache=ConfParser.parse_sops_cache_conf(data.get("cache")),
+            native=data.get("native", False)
+        )
+
+    @staticmethod
+    def parse_sops_cache_conf(data: dict | None) -> "bu.SopsCacheConf":
+        data = data or {}
+        # tmpfs by default, the decrypted configuration never touches a disk
+        default_dir = "/dev/shm/backupster-sops" if Path("/dev/shm").is_dir() else ""
+        return bu.SopsCacheConf(
+            ttl_s=data.get("ttl_s", 600),
+            dir=data.get("dir", default_dir)
         )
 
     @staticmethod
     def parse_backupster_src_conf(data: dict) -> _BackupsterSrcConf:
+        # Imports the module of the type, the types of other configured sources are never imported
         src_type = data["type"]
-        if src_type == "dav":
-            conf = src.DavBackupSourceConfig(
-                caldav_url=data["conf"]["caldav_url"],
-                caldav_username=data["conf"]["caldav_username"],
-                caldav_password=data["conf"]["caldav_password"],
-                carddav_url=data["conf"]["carddav_url"],
-                carddav_username=data["conf"]["carddav_username"],
-                carddav_password=data["conf"]["carddav_password"]
-            )
-        elif src_type == "vaultwarden":
-            conf = src.VaultwardenBackupSourceConfig(
-                url=data["conf"]["vw_url"],
-                client_id=data["conf"]["vw_client_id"],
-                client_secret=data["conf"]["vw_client_secret"],
-                password=data["conf"]["vw_password"]
-            )
-        elif src_type == "test":
-            conf = src.TestBackupSourceConfig()
-        else:
-            raise ValueError(f"Unknown source type: {src_type}")
-        
         return _BackupsterSrcConf(
             type=src_type,
-            conf=conf
+            conf=src.SOURCES.load(src_type).parse_conf(data.get("conf") or {})
         )
     
     @staticmethod
     def parse_backupster_dst_conf(data: dict) -> _BackupsterDstConf:
         dst_type = data["type"]
-        if dst_type == "gcp":
-            conf = dst.GCPBackupDestinationConfig(
-                bucket_name=data["conf"]["gcp_bucket_name"],
-                svc_key=data["conf"]["gcp_svc_key"]
-            )
-        else:
-            raise ValueError(f"Unknown destination type: {dst_type}")
-        
+        conf = dst.DESTINATIONS.load(dst_type).parse_conf(data["conf"])
         return _BackupsterDstConf(
             type=dst_type,
-            conf=conf
+            conf=conf,
+            transfer=ConfParser.parse_transfer_conf(data.get("transfer"), conf)
+        )
+
+    @staticmethod
+    def parse_transfer_conf(data: dict | None, conf: NamedTuple) -> dst.TransferConf:
+        data = data or {}
+        # gcp_chunk_size_mb predates the transfer settings and stays the default part size of GCS
+        part_size_mb = getattr(conf, "chunk_size_mb", dst.TransferConf().part_size_mb)
+        return dst.TransferConf(
+            part_size_mb=data.get("part_size_mb", part_size_mb),
+            attempts=data.get("attempts", 5),
+            backoff_s=data.get("backoff_s", 0.5),
+            max_backoff_s=data.get("max_backoff_s", 30.0)
         )
     
+    @staticmethod
+    def parse_retention_conf(data: dict | None) -> dst.RetentionPolicy | None:
+        if not data:
+            return None
+        return dst.RetentionPolicy(
+            daily=data.get("daily", 0),
+            weekly=data.get("weekly", 0),
+            monthly=data.get("monthly", 0),
+            dry_run=data.get("dry_run", False)
+        )
+
+    @staticmethod
+    def parse_archive_conf(data: dict | None) -> bu.ArchiveConf:
+        data = data or {}
+        conf = bu.ArchiveConf(
+            codec=data.get("codec", "zip"),
+            level=data.get("level"),
+            threads=data.get("threads", 0),
+            deterministic=data.get("deterministic", False)
+        )
+        bu.check_codec(conf.codec)
+        return conf
+
+    @staticmethod
+    def parse_encryption_conf(data: dict | None) -> _EncryptionConf:
+        data = data or {}
+        engine = data.get("engine", "gpg")
+        if engine not in ("gpg", "envelope"):
+            raise ValueError(f"Unknown encryption engine: {engine}")
+        return _EncryptionConf(
+            engine=engine,
+            public_key=data.get("public_key", "")
+        )
+
+    @staticmethod
+    def parse_journal_conf(data: bool | dict | None) -> bu.JournalConf:
+        # "resume: true" or "resume: {max_age_h: 48}"
+        if isinstance(data, dict):
+            return bu.JournalConf(
+                enabled=data.get("enabled", True),
+                max_age_h=data.get("max_age_h", 24.0)
+            )
+        return bu.JournalConf(enabled=bool(data))
+
+    @staticmethod
+    def parse_schedule(expression: str | None) -> str:
+        # Checked when the configuration is loaded, not when the daemon first needs the next run
+        if expression:
+            bu.CronSchedule(expression).next_after(datetime.now())
+        return expression or ""
+
+    @staticmethod
+    def parse_daemon_conf(data: dict | None) -> _DaemonConf:
+        data = data or {}
+        return _DaemonConf(
+            host=data.get("host", "127.0.0.1"),
+            port=data.get("port", 8080)
+        )
+
+    @staticmethod
+    def parse_backupster_job_conf(data: dict, defaults: dict, name: str | None = None) -> _BackupsterJobConf:
+        src_conf = ConfParser.parse_backupster_src_conf(data["src"])
+        dst_data = data["dst"] if isinstance(data["dst"], list) else [data["dst"]]
+
+        def option(key: str, default):
+            return data.get(key, defaults.get(key, default))
+
+        return _BackupsterJobConf(
+            name=data.get("name", name or src_conf.type),
+            src=src_conf,
+            dst=[ConfParser.parse_backupster_dst_conf(d) for d in dst_data],
+            gpg=option("gpg", None),
+            stream=option("stream", False),
+            workers=option("workers", 1),
+            dedup=option("dedup", False),
+            retention=ConfParser.parse_retention_conf(option("retention", None)),
+            archive=ConfParser.parse_archive_conf(option("archive", None)),
+            encryption=ConfParser.parse_encryption_conf(option("encryption", None)),
+            resume=ConfParser.parse_journal_conf(option("resume", None)),
+            skip_unchanged=option("skip_unchanged", False),
+            schedule=ConfParser.parse_schedule(option("schedule", None))
+        )
+
+    @staticmethod
+    def parse_metrics_conf(data: dict) -> _MetricsConf:
+        return _MetricsConf(
+            textfile=data.get("textfile", ""),
+            summary=data.get("summary", ""),
+            pushgateway=data.get("pushgateway", ""),
+            instance=data.get("instance", "")
+        )
+
     @staticmethod
     def parse_backupster_conf(data: dict) -> _BackupsterConf:
+        engine = data.get("engine", "threads")
+        if engine not in ("threads", "async"):
+            raise ValueError(f"Unknown engine: {engine}")
+        metrics = ConfParser.parse_metrics_conf(data.get("metrics", {}))
+        daemon = ConfParser.parse_daemon_conf(data.get("daemon"))
+
+        if "jobs" in data:
+            jobs = [ConfParser.parse_backupster_job_conf(job, data) for job in data["jobs"]]
+            names = [job.name for job in jobs]
+            if len(set(names)) != len(names):
+                raise ValueError(f"Job names must be unique: {names}")
+            return _BackupsterConf(
+                jobs=jobs,
+                concurrency=data.get("concurrency", 1),
+                engine=engine,
+                metrics=metrics,
+                daemon=daemon,
+                multi_job=True
+            )
+
         return _BackupsterConf(
-            src=ConfParser.parse_backupster_src_conf(data["src"]),
-            dst=ConfParser.parse_backupster_dst_conf(data["dst"]),
-            gpg=data["gpg"]
+            jobs=[ConfParser.parse_backupster_job_conf(data, data)],
+            engine=engine,
+            metrics=metrics,
+            daemon=daemon
         )
 
 
+def _timed_archive(base_path: Path, dir_name: str, target_path: Path, conf: bu.ArchiveConf) -> tuple[Path, float]:
+    # Runs in the archive process pool, the duration excludes the time waiting for a free worker
+    start = time.perf_counter()
+    archive = bu.archive_directory(base_path, dir_name, target_path, conf)
+    return archive, time.perf_counter() - start
+
+
+def _conf_hash(*values) -> str:
+    return hashlib.sha256(repr(values).encode()).hexdigest()
+
+
+class _TeeWriter:
+    # Fans one stream out to the upload streams of several destinations
+    def __init__(self, targets: list[BinaryIO]) -> None:
+        self.__targets = targets
+
+    def write(self, data: bytes) -> int:
+        for target in self.__targets:
+            target.write(data)
+        return len(data)
+
+
+class _LazyEncryptor:
+    # Creates the encryption engine on first use, so commands that don't encrypt (restore, verify,
+    # prune, catalog) neither import gnupg nor import the job's key
+    def __init__(self, suffix: str, factory: Callable[[], bu.Encryptor]) -> None:
+        self.suffix = suffix
+        self.__factory = factory
+        self.__engine: bu.Encryptor | None = None
+        self.__lock = threading.Lock()
+
+    def __get(self) -> bu.Encryptor:
+        with self.__lock:
+            if self.__engine is None:
+                self.__engine = self.__factory()
+            return self.__engine
+
+    def encrypt_file(self, file_path, output_path, compress: bool = True):
+        return self.__get().encrypt_file(file_path, output_path, compress)
+
+    async def encrypt_file_async(self, file_path, output_path, compress: bool = True):
+        return await self.__get().encrypt_file_async(file_path, output_path, compress)
+
+    def encrypt_stream(self, source: BinaryIO | int, target: BinaryIO, chunk_size: int = 1024 * 1024, compress: bool = True):
+        return self.__get().encrypt_stream(source, target, chunk_size, compress)
+
+    def encrypt_bytes(self, data: bytes) -> bytes:
+        return self.__get().encrypt_bytes(data)
+
+
+class BackupJob:
+    def __init__(self,
+                 name: str,
+                 work_dir: Path,
+                 backup_dir: Path,
+                 source_factory: Callable[[], BackupSource | AsyncBackupSource],
+                 destinations: list[BackupDestination],
+                 encryptor: bu.Encryptor,
+                 stream: bool = False,
+                 workers: int = 1,
+                 dedup: bool = False,
+                 retention: dst.RetentionPolicy | None = None,
+                 archive: bu.ArchiveConf = bu.ArchiveConf(),
+                 resume: bu.JournalConf = bu.JournalConf(),
+                 fingerprint: str = "",
+                 journal_fingerprint: str | None = None,
+                 skip_unchanged: bool = False,
+                 mp_context: BaseContext | None = None) -> None:
+        self.name = name
+        self.__work_dir = work_dir
+        self.__backup_dir = backup_dir
+        self.__source_factory = source_factory
+        self.__destinations = destinations
+        self.__encryptor = encryptor
+        self.__suffix = encryptor.suffix
+        self.__stream = stream
+        self.__workers = max(1, workers)
+        self.__dedup = dedup
+        self.__retention = retention
+        self.__archive = archive
+        self.__resume = resume
+        # Identify the configuration of the job: a snapshot of another one isn't skipped as unchanged,
+        # a journal of another one isn't resumed
+        self.__fingerprint = fingerprint
+        self.__journal_fingerprint = fingerprint if journal_fingerprint is None else journal_fingerprint
+        self.__journal: bu.RunJournal | None = None
+        # Compare the source tree with the latest snapshot and skip the run if it is the same
+        self.__skip_unchanged = skip_unchanged
+        # Archive workers are never forked from this process: with several jobs (or the daemon) it runs
+        # upload and source threads whose locks (boto, gRPC, requests) a forked child could inherit held
+        self.__mp_context = mp_context or multiprocessing.get_context("forkserver")
+
+        # Timings and byte/file counters of the current (or last) run
+        self.metrics = bu.RunMetrics(name)
+        # Those of the last finished run, what is exported while the job may be running again
+        self.last_metrics: bu.RunMetrics | None = None
+
+    @property
+    def destinations(self) -> list[BackupDestination]:
+        return self.__destinations
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    @property
+    def stage_times(self) -> dict[str, float]:
+        # Wall time per stage of the last run, in seconds
+        return self.metrics.stage_times()
+
+    def __start_run(self):
+        self.metrics = bu.RunMetrics(self.name)
+        # Uploaded file names that are archives created by the pipeline, recorded in the catalog for restores
+        self.__archives: set[str] = set()
+        # Archives and encrypted files the pipeline writes into the backup dir, they aren't source output
+        self.__outputs: set[str] = set()
+        self.__journal = self.__open_journal()
+        for index, destination in enumerate(self.__destinations):
+            destination.metrics = self.metrics
+            destination.journal = self.__journal.section(f"dst{index}") if self.__journal else None
+            destination.begin_snapshot()
+
+    def __open_journal(self) -> bu.RunJournal | None:
+        if not self.__resume.enabled:
+            return None
+        journal = bu.RunJournal(self.__work_dir / ".journal.json", self.__journal_fingerprint, self.__resume)
+        if journal.resumed and journal.get("stages", "source") is None:
+            # Killed while the source was running, its output may be incomplete
+            journal.reset()
+        if journal.resumed:
+            print(f"Resuming the interrupted run of {self.name}.")
+        else:
+            # Leftovers of an interrupted run that can't be resumed
+            self.__cleanup()
+        return journal
+
+    def __stage_done(self, name: str) -> bool:
+        return self.__journal is not None and self.__journal.get("stages", name) is not None
+
+    def __finish_source(self):
+        if self.__journal is not None:
+            subdirs, files = self.__scan_source_entries()
+            self.__journal.put("stages", "source", {
+                "dirs": [subdir.name for subdir in subdirs],
+                "files": [entry.name for entry in files]
+            })
+
+    def __scan_source_entries(self) -> tuple[list[Path], list[Path]]:
+        # Artifacts reported early by the source may already be archived and encrypted next to the others
+        return ([subdir for subdir in self.__get_subdirs(self.__backup_dir) if subdir.name not in self.__outputs],
+                [entry for entry in self.__get_files(self.__backup_dir) if entry.name not in self.__outputs])
+
+    def __source_entries(self) -> tuple[list[Path], list[Path]]:
+        # Directories and files the source created; the backup dir of a resumed run also holds archives and encrypted files
+        info = self.__journal.get("stages", "source") if self.__journal is not None else None
+        if info is None:
+            return self.__scan_source_entries()
+        return [self.__backup_dir / name for name in info["dirs"]], [self.__backup_dir / name for name in info["files"]]
+
+    def __add_outputs(self, entry: Path):
+        # Registered before the pipeline writes them, so a scan of the backup dir never mistakes them for source output
+        if entry.is_dir():
+            self.__outputs.update({f"{entry.name}{self.__archive.suffix}", f"{entry.name}{self.__archive.suffix}{self.__suffix}"})
+        else:
+            self.__outputs.add(f"{entry.name}{self.__suffix}")
+
+    def __resume_artifact(self, file_name: str) -> bool:
+        # An archive or encrypted file the interrupted run completed
+        entry = self.__journal.get("artifacts", file_name) if self.__journal is not None else None
+        path = self.__backup_dir / file_name
+        if entry is None or not path.is_file() or path.stat().st_size != entry["size"]:
+            return False
+        if entry["archive"]:
+            self.__archives.add(file_name)
+        self.metrics.add("resume", bytes_in=entry["size"], files=1)
+        return True
+
+    def __record_artifact(self, path: Path):
+        if self.__journal is not None:
+            self.__journal.put("artifacts", path.name, {"size": path.stat().st_size, "archive": path.name in self.__archives})
+
+    def __prune_after_backup(self):
+        # A failed prune doesn't fail the backup, it is counted as error of the "prune" stage
+        if not self.__retention:
+            return
+        try:
+            with self.__stage("prune"):
+                for destination in self.__destinations:
+                    destination.prune(self.name, self.__retention)
+        except Exception as e:
+            print(f"Pruning {self.name} failed: {e}")
+
+    def prune(self, dry_run: bool = False) -> list[dst.PruneReport]:
+        if not self.__retention:
+            raise BackupsterError(f"No retention configured for job {self.name}")
+        policy = self.__retention._replace(dry_run=dry_run or self.__retention.dry_run)
+        return [destination.prune(self.name, policy) for destination in self.__destinations]
+
+    def __commit_snapshot(self, fingerprint: dict | None = None):
+        # Only complete snapshots are listed in the catalogs of the destinations
+        with self.__stage("catalog"):
+            for destination in self.__destinations:
+                destination.commit_snapshot(self.name, sorted(self.__archives), fingerprint)
+
+    def __fingerprint_source(self) -> dict | None:
+        # Merkle fingerprint of what the source produced, with the configuration it is backed up with;
+        # file hashes are cached by size and mtime in the work dir, e.g. for sources keeping a state dir
+        if not self.__skip_unchanged:
+            return None
+        subdirs, files = self.__source_entries()
+        with self.__stage("fingerprint"):
+            tree = bu.fingerprint_tree(self.__backup_dir, [entry.name for entry in subdirs + files],
+                                       self.__work_dir / ".conf" / "tree-cache.json", self.__workers)
+        self.metrics.add("fingerprint", bytes_in=sum(entry[0] for entry in tree.files.values()), files=len(tree.files))
+        return {**tree.as_dict(), "conf": self.__fingerprint}
+
+    def __unchanged(self, fingerprint: dict) -> bool:
+        # Unchanged if the latest snapshot of every destination was made of the same tree, those
+        # snapshots get a no-change marker instead of a new snapshot being archived, encrypted and uploaded
+        if self.__journal is not None and self.__journal.resumed:
+            # The interrupted run already uploaded parts of its snapshot, it is completed instead
+            return False
+
+        latest: list[tuple[str, dict]] = []
+        for destination in self.__destinations:
+            snapshot, previous = destination.latest_fingerprint(self.name) or ("", {})
+            if previous.get("root") != fingerprint["root"] or previous.get("conf") != fingerprint["conf"]:
+                if previous.get("conf") == fingerprint["conf"]:
+                    entries = previous.get("entries", {})
+                    changed = sorted(name for name in set(entries) | set(fingerprint["entries"]) if entries.get(name) != fingerprint["entries"].get(name))
+                    print(f"{self.name} changed since snapshot {snapshot}: {', '.join(changed)}")
+                return False
+            latest.append((snapshot, previous))
+
+        with self.__stage("catalog"):
+            for destination, (snapshot, _) in zip(self.__destinations, latest):
+                if not destination.record_unchanged(self.name, snapshot):
+                    print(f"Snapshot {snapshot} of {self.name} was removed in the meantime, creating a new one.")
+                    return False
+        self.metrics.add("unchanged", files=1)
+        print(f"{self.name} is unchanged since snapshot {', '.join(sorted({snapshot for snapshot, _ in latest}))}, skipping archive, encryption and upload.")
+        return True
+
+    @contextmanager
+    def __stage(self, name: str) -> Iterator[None]:
+        with self.metrics.stage(name):
+            yield
+
+    def __record_source(self):
+        files, size = bu.dir_stats(self.__backup_dir)
+        self.metrics.add("source", bytes_out=size, files=files)
+
+    def __get_subdirs(self, dir_path: Path) -> list[Path]:
+        return sorted(entry for entry in dir_path.iterdir() if entry.is_dir())
+
+    def __get_files(self, dir_path: Path) -> list[Path]:
+        return sorted(entry for entry in dir_path.iterdir() if entry.is_file() and not entry.name.startswith("."))
+
+    def __raise_errors(self, errors: dict[str, BaseException]):
+        if errors:
+            report = "\n".join(f"  {name}: {type(e).__name__}: {e}" for name, e in sorted(errors.items()))
+            raise BackupsterError(f"{len(errors)} backup artifact(s) of job {self.name} failed:\n{report}")
+
+    def __encrypt_entry(self, entry: Path, compress: bool = True):
+        start = time.perf_counter()
+        encrypted = Path(f"{entry}{self.__suffix}")
+        self.__encryptor.encrypt_file(entry, encrypted, compress=compress)
+        self.metrics.add_file("encrypt", entry.name, entry.stat().st_size, encrypted.stat().st_size, time.perf_counter() - start)
+        self.__record_artifact(encrypted)
+
+    def __archive_and_encrypt_backup(self):
+        # Archiving is CPU-bound in-process work and runs in a process pool; gpg already runs as
+        # its own process per file, so a thread pool is enough to keep several of them busy
+        # (the envelope engine encrypts in-process, in these threads)
+        errors: dict[str, BaseException] = {}
+        subdirs, files = self.__source_entries()
+        # Artifacts the interrupted run already encrypted are kept
+        subdirs = [subdir for subdir in subdirs if not self.__resume_artifact(f"{subdir.name}{self.__archive.suffix}{self.__suffix}")]
+        files = [entry for entry in files if not self.__resume_artifact(f"{entry.name}{self.__suffix}")]
+
+        with ProcessPoolExecutor(max_workers=self.__workers, mp_context=self.__mp_context) as archive_pool:
+            archive_futures: dict[Future, Path] = {
+                archive_pool.submit(_timed_archive, self.__backup_dir, subdir.name, self.__backup_dir, self.__archive): subdir
+                for subdir in subdirs
+            }
+
+            with ThreadPoolExecutor(max_workers=self.__workers) as gpg_pool:
+                gpg_futures: dict[Future, str] = {
+                    gpg_pool.submit(self.__encrypt_entry, entry): entry.name for entry in files
+                }
+
+                for future in as_completed(archive_futures):
+                    subdir = archive_futures[future]
+                    try:
+                        archive, duration = future.result()
+                    except Exception as e:
+                        errors[f"{subdir.name}{self.__archive.suffix}"] = e
+                        continue
+                    self.metrics.add_file("archive", archive.name, bu.dir_stats(subdir)[1], archive.stat().st_size, duration)
+                    self.__archives.add(f"{archive.name}{self.__suffix}")
+                    gpg_futures[gpg_pool.submit(self.__encrypt_entry, archive, not self.__archive.compressed)] = archive.name
+
+                for future in as_completed(gpg_futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors[gpg_futures[future]] = e
+
+        self.__raise_errors(errors)
+
+    @contextmanager
+    def __open_backup_streams(self, file_name: str, destinations: list[BackupDestination]) -> Iterator[BinaryIO]:
+        with ExitStack() as stack:
+            uploads = [stack.enter_context(d.open_backup_stream(self.name, file_name)) for d in destinations]
+            yield uploads[0] if len(uploads) == 1 else _TeeWriter(uploads)  # type: ignore[misc]
+
+    def __stream_dir(self, subdir: Path, destinations: list[BackupDestination]):
+        start = time.perf_counter()
+        file_name = f"{subdir.name}{self.__archive.suffix}{self.__suffix}"
+        self.__archives.add(file_name)
+        with self.__open_backup_streams(file_name, destinations) as upload, \
+                bu.archive_directory_pipe(self.__backup_dir, subdir.name, self.__archive) as archive_stream:
+            counter = bu.CountingWriter(upload)
+            self.__encryptor.encrypt_stream(archive_stream, counter, compress=not self.__archive.compressed)
+        self.metrics.add_file("stream", file_name, bu.dir_stats(subdir)[1], counter.bytes, time.perf_counter() - start)
+
+    def __stream_file(self, entry: Path, destinations: list[BackupDestination]):
+        start = time.perf_counter()
+        with self.__open_backup_streams(f"{entry.name}{self.__suffix}", destinations) as upload, \
+                open(entry, "rb") as f:
+            counter = bu.CountingWriter(upload)
+            self.__encryptor.encrypt_stream(f, counter)
+        self.metrics.add_file("stream", f"{entry.name}{self.__suffix}", entry.stat().st_size, counter.bytes, time.perf_counter() - start)
+
+    def __stream_backup(self):
+        # archive -> encryption -> resumable upload, all stages overlap and nothing is staged on disk
+        tasks: dict[str, Callable[[list[BackupDestination]], None]] = {}
+        subdirs, files = self.__source_entries()
+        for subdir in subdirs:
+            tasks[f"{subdir.name}{self.__archive.suffix}{self.__suffix}"] = lambda destinations, subdir=subdir: self.__stream_dir(subdir, destinations)
+        for entry in files:
+            tasks[f"{entry.name}{self.__suffix}"] = lambda destinations, entry=entry: self.__stream_file(entry, destinations)
+
+        # Streams can't be continued, but a stream the interrupted run completed is kept on the destinations
+        # that stored it, and only sent to the others
+        archives = {f"{subdir.name}{self.__archive.suffix}{self.__suffix}" for subdir in subdirs}
+        targets: dict[str, list[BackupDestination]] = {}
+        for name in tasks:
+            targets[name] = self.__destinations
+            if self.__journal is not None:
+                targets[name] = [destination for destination in self.__destinations if not destination.resume_upload(name)]
+                if not targets[name] and name in archives:
+                    self.__archives.add(name)
+
+        errors: dict[str, BaseException] = {}
+        with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+            futures = {pool.submit(task, targets[name]): name for name, task in tasks.items() if targets[name]}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[futures[future]] = e
+
+        self.__raise_errors(errors)
+
+    def __cleanup(self):
+        bu.cleanup_dir(self.__work_dir, exceptions=[".conf"])
+        bu.cleanup_dir(self.__backup_dir)
+
+    def __keep_for_resume(self, success: bool) -> bool:
+        # A journaled run that failed leaves its work to the next run, after a successful one the next starts over
+        if self.__journal is None:
+            return False
+        if success:
+            self.__journal.reset()
+            return False
+        print(f"Keeping the work of {self.name} for the next run to resume.")
+        return True
+
+    async def __process_artifact_async(self,
+                                       entry: Path,
+                                       destinations: list[AsyncBackupDestination],
+                                       archive_pool: ProcessPoolExecutor,
+                                       semaphore: asyncio.Semaphore):
+        async with semaphore:
+            encrypted_name = f"{entry.name}{self.__archive.suffix if entry.is_dir() else ''}{self.__suffix}"
+            if self.__resume_artifact(encrypted_name):
+                await asyncio.gather(*(d.upload_backup_file(self.name, self.__backup_dir / encrypted_name) for d in destinations))
+                return
+
+            files, size = await asyncio.to_thread(bu.dir_stats, entry) if entry.is_dir() else (1, entry.stat().st_size)
+            self.metrics.add("source", bytes_out=size, files=files)
+
+            compress = True
+            if entry.is_dir():
+                loop = asyncio.get_running_loop()
+                entry, duration = await loop.run_in_executor(archive_pool, _timed_archive, self.__backup_dir, entry.name, self.__backup_dir, self.__archive)
+                self.metrics.add_file("archive", entry.name, size, entry.stat().st_size, duration)
+                self.__archives.add(f"{entry.name}{self.__suffix}")
+                compress = not self.__archive.compressed
+
+            start = time.perf_counter()
+            encrypted = Path(f"{entry}{self.__suffix}")
+            await self.__encryptor.encrypt_file_async(entry, encrypted, compress)
+            self.metrics.add_file("encrypt", entry.name, entry.stat().st_size, encrypted.stat().st_size, time.perf_counter() - start)
+            self.__record_artifact(encrypted)
+            await asyncio.gather(*(d.upload_backup_file(self.name, encrypted) for d in destinations))
+
+    async def backup_async(self):
+        if self.__dedup or self.__stream:
+            # Both modes are already pipelined internally and run as a whole in a worker thread
+            await asyncio.to_thread(self.backup)
+            return
+
+        self.__work_dir.mkdir(parents=True, exist_ok=True)
+        self.__backup_dir.mkdir(parents=True, exist_ok=True)
+        self.__start_run()
+        success = False
+
+        try:
+            source = await asyncio.to_thread(self.__source_factory)
+            async_source = src.as_async_source(source)
+            destinations = [dst.as_async_destination(d) for d in self.__destinations]
+
+            semaphore = asyncio.Semaphore(self.__workers)
+            tasks: dict[str, asyncio.Task] = {}
+
+            with ProcessPoolExecutor(max_workers=self.__workers, mp_context=self.__mp_context) as archive_pool:
+                # Artifacts the source reports as complete are archived, encrypted and uploaded
+                # while it is still producing the others
+                def artifact_ready(entry: Path):
+                    if entry.name not in tasks and entry.name not in self.__outputs:
+                        self.__add_outputs(entry)
+                        tasks[entry.name] = asyncio.create_task(
+                            self.__process_artifact_async(entry, destinations, archive_pool, semaphore))
+
+                if self.__stage_done("source"):
+                    print(f"Skipping the source of {self.name}, completed by the interrupted run.")
+                else:
+                    try:
+                        with self.__stage("source"):
+                            # Whether anything is uploaded is only known once the tree is complete
+                            await async_source.create_backup(None if self.__skip_unchanged else artifact_ready)
+                    except BaseException:
+                        for task in tasks.values():
+                            task.cancel()
+                        await asyncio.gather(*tasks.values(), return_exceptions=True)
+                        raise
+                    self.__finish_source()
+
+                fingerprint = await asyncio.to_thread(self.__fingerprint_source)
+                if fingerprint is not None and await asyncio.to_thread(self.__unchanged, fingerprint):
+                    success = True
+                    return
+
+                subdirs, files = self.__source_entries()
+                for entry in subdirs + files:
+                    artifact_ready(entry)
+
+                # Remaining time of the overlapped archive/encrypt/upload pipeline after the source finished
+                with self.__stage("pipeline"):
+                    results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+            self.__raise_errors({name: e for name, e in zip(tasks.keys(), results) if isinstance(e, BaseException)})
+            await asyncio.to_thread(self.__commit_snapshot, fingerprint)
+            success = True
+            await asyncio.to_thread(self.__prune_after_backup)
+        finally:
+            if not self.__keep_for_resume(success):
+                with self.__stage("cleanup"):
+                    await asyncio.to_thread(self.__cleanup)
+            self.metrics.finish(success)
+            self.last_metrics = self.metrics
+
+    def backup(self):
+        self.__work_dir.mkdir(parents=True, exist_ok=True)
+        self.__backup_dir.mkdir(parents=True, exist_ok=True)
+        self.__start_run()
+        success = False
+
+        try:
+            if self.__stage_done("source"):
+                print(f"Skipping the source of {self.name}, completed by the interrupted run.")
+            else:
+                with self.__stage("source"):
+                    source = self.__source_factory()
+                    if isinstance(source, AsyncBackupSource):
+                        asyncio.run(source.create_backup())
+                    else:
+                        source.create_backup()
+                self.__record_source()
+                self.__finish_source()
+
+            fingerprint = self.__fingerprint_source()
+            if fingerprint is not None and self.__unchanged(fingerprint):
+                success = True
+                return
+
+            if self.__dedup:
+                with self.__stage("chunk_upload"):
+                    for destination in self.__destinations:
+                        destination.upload_chunked_backup(self.name, self.__encryptor.encrypt_bytes, self.__suffix)
+            elif self.__stream:
+                with self.__stage("stream"):
+                    self.__stream_backup()
+            else:
+                with self.__stage("archive_encrypt"):
+                    self.__archive_and_encrypt_backup()
+                with self.__stage("upload"):
+                    for destination in self.__destinations:
+                        destination.upload_backup(self.name, self.__suffix)
+            self.__commit_snapshot(fingerprint)
+            success = True
+            self.__prune_after_backup()
+        finally:
+            if not self.__keep_for_resume(success):
+                with self.__stage("cleanup"):
+                    self.__cleanup()
+            self.metrics.finish(success)
+            self.last_metrics = self.metrics
+
+
+def _plain_name(file_name: str) -> str:
+    for suffix in bu.ENCRYPTED_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name.removesuffix(suffix)
+    return file_name
+
+
+class RestoreJob:
+    # Restores a snapshot of a backup: every file is fetched with parallel ranged downloads, piped
+    # through `gpg --decrypt` (operator keyring) or the envelope decryption (identity) and
+    # extracted on the fly, nothing is staged on disk
+
+    def __init__(self,
+                 name: str,
+                 destination: BackupDestination,
+                 workers: int = 1,
+                 gnupghome: str | None = None,
+                 identity: "X25519PrivateKey | None" = None) -> None:
+        self.name = name
+        self.__destination = destination
+        self.__workers = max(1, workers)
+        self.__gnupghome = gnupghome
+        self.__identity = identity
+        self.metrics = bu.RunMetrics(f"{name}-restore")
+
+    def list_snapshots(self) -> list[str]:
+        return self.__destination.list_snapshots(self.name)
+
+    def restore(self, target_dir: Path, snapshot: str | None = None) -> str:
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            raise BackupsterError(f"No snapshots found for {self.name}")
+        snapshot = snapshot or snapshots[-1]
+        if snapshot not in snapshots:
+            raise BackupsterError(f"Snapshot {snapshot} of {self.name} not found, available: {', '.join(snapshots)}")
+
+        target_dir.mkdir(parents=True, exist_ok=True)
+        self.metrics = bu.RunMetrics(f"{self.name}-restore")
+        success = False
+        try:
+            files = self.__destination.list_snapshot_files(self.name, snapshot)
+            with self.metrics.stage("restore"):
+                if any(file_name.startswith("manifest.json") for file_name in files):
+                    self.__restore_chunked(snapshot, target_dir)
+                else:
+                    self.__restore_files(snapshot, files, target_dir)
+            success = True
+        finally:
+            self.metrics.finish(success)
+
+        print(f"Restored {self.name} snapshot {snapshot} to {target_dir}.")
+        return snapshot
+
+    def __require_identity(self) -> "X25519PrivateKey":
+        if self.__identity is None:
+            raise BackupsterError(f"{self.name} has envelope encrypted files, an identity (private key) is needed to restore them")
+        return self.__identity
+
+    def __decrypt_bytes(self, data: bytes) -> bytes:
+        # Chunks have no suffix, the engine is told apart by the envelope header
+        if bu.is_envelope(data):
+            return bu.envelope_decrypt_bytes(data, self.__require_identity())
+        return bu.decrypt_bytes(data, self.__gnupghome)
+
+    def __decrypt_stream(self, file_name: str, download: BinaryIO):
+        if file_name.endswith(bu.ENVELOPE_SUFFIX):
+            return bu.envelope_decrypt_stream(download, self.__require_identity())
+        return bu.decrypt_pipe(download, self.__gnupghome)
+
+    def __restore_file(self, snapshot: str, file_name: str, archives: list[str] | None, target_dir: Path):
+        # Snapshots from before the catalog recorded archives are recognized by their suffix
+        plain_name = _plain_name(file_name)
+        is_archive = file_name in archives if archives is not None else True
+        codec = bu.codec_of(plain_name) if is_archive else None
+
+        start = time.perf_counter()
+        with self.__destination.open_download_stream(self.name, snapshot, file_name) as download, \
+                self.__decrypt_stream(file_name, download) as plain:
+            if codec:
+                bu.extract_archive_stream(plain, target_dir, codec)
+                written = bu.dir_stats(target_dir / plain_name.removesuffix(bu.ArchiveConf(codec).suffix))[1]
+            else:
+                with open(target_dir / plain_name, "wb") as f:
+                    shutil.copyfileobj(plain, f, 1024 * 1024)
+                    written = f.tell()
+        self.metrics.add_file("restore", file_name, download.bytes_read, written, time.perf_counter() - start)
+
+    def __restore_files(self, snapshot: str, files: list[str], target_dir: Path):
+        archives = self.__destination.read_catalog(self.name).snapshots.get(snapshot, {}).get("archives")
+        errors: dict[str, BaseException] = {}
+        with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+            futures = {
+                pool.submit(self.__restore_file, snapshot, file_name, archives, target_dir): file_name
+                for file_name in files if file_name.endswith(bu.ENCRYPTED_SUFFIXES)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[futures[future]] = e
+
+        if errors:
+            report = "\n".join(f"  {name}: {type(e).__name__}: {e}" for name, e in sorted(errors.items()))
+            raise BackupsterError(f"{len(errors)} file(s) of {self.name} snapshot {snapshot} failed to restore:\n{report}")
+
+    def __fetch_chunk(self, chunk_id: str) -> bytes:
+        # Only chunked snapshots need the chunker (and numpy)
+        import backup_utils.chunking as chunking
+
+        data = self.__decrypt_bytes(self.__destination.download_chunk(self.name, chunk_id))
+        if chunking.chunk_id(data) != chunk_id:
+            raise BackupsterError(f"Chunk {chunk_id} of {self.name} is corrupt")
+        return data
+
+    def __ordered_chunks(self, pool: ThreadPoolExecutor, chunk_ids: Iterable[str]) -> Iterator[bytes]:
+        # Like pool.map, but with a bounded number of chunks in flight
+        pending: deque[Future] = deque()
+        for chunk_id in chunk_ids:
+            pending.append(pool.submit(self.__fetch_chunk, chunk_id))
+            if len(pending) >= self.__workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def __restore_chunked(self, snapshot: str, target_dir: Path):
+        manifest_name = next(f for f in self.__destination.list_snapshot_files(self.name, snapshot) if f.startswith("manifest.json"))
+        manifest = json.loads(self.__decrypt_bytes(self.__destination.download_snapshot_data(self.name, snapshot, manifest_name)))
+
+        for dir_name in manifest["dirs"]:
+            bu.safe_path(target_dir, dir_name).mkdir(parents=True, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+            for entry in manifest["files"]:
+                start = time.perf_counter()
+                path = bu.safe_path(target_dir, entry["path"])
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, "wb") as f:
+                    for data in self.__ordered_chunks(pool, entry["chunks"]):
+                        f.write(data)
+                    written = f.tell()
+                if written != entry["size"]:
+                    raise BackupsterError(f"{entry['path']} restored with {written} instead of {entry['size']} bytes")
+                os.chmod(path, entry["mode"])
+                self.metrics.add_file("restore", entry["path"], written, written, time.perf_counter() - start)
+
+
 class Backupster:
     def __init__(self):
         self.__work_dir = Path(".workdir")
@@ -103,28 +944,39 @@ class Backupster:
         mnt_conf_sops_file = self.__mount_dir / "sops.yaml"
         mnt_conf_backupster_file = self.__mount_dir / "backupster.yaml"
 
-        sops = self.__load_sops(mnt_conf_sops_file)
-        conf_raw = sops.decrypt_file(mnt_conf_backupster_file)
+        # Timings of the process-wide setup, exported next to the job metrics
+        self.metrics = bu.RunMetrics("backupster")
+
+        # Process-wide setup, shared by all jobs: SOPS decryption once, one keyring import per GPG key
+        with self.metrics.stage("sops_decrypt"):
+            sops = self.__load_sops(mnt_conf_sops_file)
+            conf_raw = sops.decrypt_file(mnt_conf_backupster_file)
+        self.metrics.add("sops_decrypt", bytes_in=mnt_conf_backupster_file.stat().st_size, files=1)
+
+        self.jobs: list[BackupJob] = []
+        # Job name -> schedule of the jobs the daemon runs
+        self.schedules: dict[str, bu.CronSchedule] = {}
+        self.daemon_conf = _DaemonConf()
+        self.__concurrency = 1
+        self.__engine = "threads"
+        self.__metrics_conf = _MetricsConf()
+        self.__metrics_lock = threading.Lock()
+        self.__encryptor_cache: dict[tuple[str, str], bu.Encryptor] = {}
+        self.__encryptor_lock = threading.Lock()
+        # Start method of the archive process pools of all jobs, one fork server serves them all
+        self.__mp_context = multiprocessing.get_context("forkserver")
 
         if conf_raw:
             conf = ConfParser.parse_backupster_conf(conf_raw)
-            self.__src_type = conf.src.type
-            if self.__src_type == "dav" and isinstance(conf.src.conf, src.DavBackupSourceConfig):
-                self.source = src.DavBackupSource(self.__work_dir, self.__backup_dir, conf.src.conf)
-            elif self.__src_type == "vaultwarden" and isinstance(conf.src.conf, src.VaultwardenBackupSourceConfig):
-                self.source = src.VaultwardenBackupSource(self.__work_dir, self.__backup_dir, conf.src.conf)
-            elif self.__src_type == "test" and isinstance(conf.src.conf, src.TestBackupSourceConfig):
-                self.source = src.TestBackupSource(self.__work_dir, self.__backup_dir, conf.src.conf)
-            else:
-                raise ValueError(f"Unknown source type: {self.__src_type}")
-    
-            self.__dst_type = conf.dst.type
-            if self.__dst_type == "gcp" and isinstance(conf.dst.conf, dst.GCPBackupDestinationConfig):
-                self.destination = dst.GCPBackupDestination(self.__conf_dir, self.__backup_dir, conf.dst.conf)
-
-            self.__gpg = bu.SimpleGPG(conf.gpg)
+            self.__concurrency = max(1, conf.concurrency)
+            self.__engine = conf.engine
+            self.__metrics_conf = conf.metrics
+            self.daemon_conf = conf.daemon
+            self.jobs = [self.__create_job(job_conf, conf.multi_job) for job_conf in conf.jobs]
+            self.schedules = {job_conf.name: bu.CronSchedule(job_conf.schedule) for job_conf in conf.jobs if job_conf.schedule}
+        self.metrics.finish(True)
 
-    def __load_sops(self, conf_file: Path) -> bu.SimpleSops:
+    def __load_sops(self, conf_file: Path) -> "bu.SimpleSops":
         with open(conf_file, "r") as f:
             conf = ConfParser.parse_sops_conf(yaml.safe_load(f))
 
@@ -134,34 +986,193 @@ class Backupster:
             pw = pw_file.read().strip()
 
         if sops_type == "gcp" and isinstance(conf.conf, bu.SopsConfGCP):
-            return bu.SimpleSops(self.__conf_dir, pw, sops_type, conf.conf)
+            return bu.SimpleSops(self.__conf_dir, pw, sops_type, conf.conf, conf.cache, conf.native)
 
         raise SopsError("No valid SOPS provider configured!")
 
-    def __get_subdirs(self, dir_path: Path) -> list[Path]:
-        return [entry for entry in dir_path.iterdir() if entry.is_dir()]
+    def __get_encryptor(self, conf: _BackupsterJobConf) -> bu.Encryptor:
+        engine = conf.encryption.engine
+        key = conf.encryption.public_key if engine == "envelope" else conf.gpg
+        if not key:
+            raise ValueError(f"No {'envelope public key' if engine == 'envelope' else 'GPG key'} configured for job {conf.name}")
 
-    def __zip_backup(self):
-        for subdir in self.__get_subdirs(self.__backup_dir):
-            bu.zip_directory(self.__backup_dir, subdir.name, self.__backup_dir)
+        suffix = bu.ENVELOPE_SUFFIX if engine == "envelope" else bu.GPG_SUFFIX
+        return _LazyEncryptor(suffix, lambda: self.__create_encryptor(engine, key))
 
-    def __encrypt_backup(self):
-        for entry in Path(self.__backup_dir).iterdir():
-            if entry.is_file() and not entry.name.startswith("."):  # check if it's a file
-                self.__gpg.encrypt_file(entry, f"{entry}.gpg")
+    def __create_encryptor(self, engine: str, key: str) -> bu.Encryptor:
+        # Jobs sharing a key share the engine (and a single key import)
+        with self.__encryptor_lock:
+            if (engine, key) not in self.__encryptor_cache:
+                if engine == "envelope":
+                    self.__encryptor_cache[(engine, key)] = bu.EnvelopeEncryptor(key)
+                else:
+                    with self.metrics.stage("gpg_import"):
+                        self.__encryptor_cache[(engine, key)] = bu.SimpleGPG(key)
+                    self.metrics.add("gpg_import", files=1)
+            return self.__encryptor_cache[(engine, key)]
 
-    def __cleanup(self):
-        bu.cleanup_dir(self.__work_dir, exceptions=[self.__conf_dir.name])
-        bu.cleanup_dir(self.__backup_dir)
+    def __create_source(self, conf: _BackupsterSrcConf, work_dir: Path, backup_dir: Path) -> BackupSource | AsyncBackupSource:
+        source_type = src.SOURCES.load(conf.type)
+        if self.__engine == "async" and source_type.async_source is not None:
+            return source_type.async_source(work_dir, backup_dir, conf.conf)
+        return source_type.source(work_dir, backup_dir, conf.conf)
+
+    def __create_destination(self, conf: _BackupsterDstConf, backup_dir: Path, workers: int) -> BackupDestination:
+        return dst.DESTINATIONS.load(conf.type).destination(self.__conf_dir, backup_dir, conf.conf, workers, conf.transfer)
+
+    def __create_job(self, conf: _BackupsterJobConf, multi_job: bool) -> BackupJob:
+        work_dir = self.__work_dir / conf.name if multi_job else self.__work_dir
+        backup_dir = self.__backup_dir / conf.name if multi_job else self.__backup_dir
+
+        # Sources are only created when the job runs, e.g. the Vaultwarden source logs in on creation
+        return BackupJob(
+            name=conf.name,
+            work_dir=work_dir,
+            backup_dir=backup_dir,
+            source_factory=lambda: self.__create_source(conf.src, work_dir, backup_dir),
+            destinations=[self.__create_destination(d, backup_dir, conf.workers) for d in conf.dst],
+            encryptor=self.__get_encryptor(conf),
+            stream=conf.stream,
+            workers=conf.workers,
+            dedup=conf.dedup,
+            retention=conf.retention,
+            archive=conf.archive,
+            resume=conf.resume,
+            # Only the settings that change what a run produces, e.g. not the schedule, workers or retention
+            fingerprint=_conf_hash(conf.src, conf.archive, conf.encryption, conf.gpg, conf.dedup, conf.stream),
+            # The journal also holds the uploads per destination
+            journal_fingerprint=_conf_hash(conf.src, conf.archive, conf.encryption, conf.gpg, conf.dedup, conf.stream, conf.dst),
+            skip_unchanged=conf.skip_unchanged,
+            mp_context=self.__mp_context
+        )
+
+    def __get_job(self, name: str) -> BackupJob:
+        for job in self.jobs:
+            if job.name == name:
+                return job
+        raise BackupsterError(f"Unknown job {name}, configured: {', '.join(job.name for job in self.jobs)}")
+
+    def get_destination(self, name: str, destination: int = 0) -> BackupDestination:
+        return self.__get_job(name).destinations[destination]
+
+    def create_restore_job(self, name: str, destination: int = 0, gnupghome: str | None = None, identity: Path | None = None) -> RestoreJob:
+        job = self.__get_job(name)
+        # A passphrase protected identity is unlocked with BACKUPSTER_IDENTITY_PASSPHRASE
+        private_key = bu.load_identity(identity, os.environ.get("BACKUPSTER_IDENTITY_PASSPHRASE")) if identity else None
+        return RestoreJob(job.name, job.destinations[destination], job.workers, gnupghome, private_key)
+
+    def prune(self, names: list[str] | None = None, dry_run: bool = False):
+        jobs = [self.__get_job(name) for name in names] if names else self.jobs
+        errors: dict[str, BaseException] = {}
+        for job in jobs:
+            try:
+                job.prune(dry_run)
+            except Exception as e:
+                print(f"Pruning {job.name} failed: {e}")
+                errors[job.name] = e
+        self.__raise_job_errors(errors)
+
+    def verify(self, names: list[str] | None = None, snapshot: str | None = None, latest: bool = False):
+        # Every destination of the jobs, from object metadata only; the objects of a destination are checked in parallel
+        jobs = [self.__get_job(name) for name in names] if names else self.jobs
+        errors: dict[str, BaseException] = {}
+        for job in jobs:
+            for index, destination in enumerate(job.destinations):
+                try:
+                    snapshots = [snapshot] if snapshot else destination.list_snapshots(job.name)[-1:] if latest else None
+                    report = destination.verify(job.name, snapshots)
+                    if report.failures:
+                        raise BackupsterError(f"{len(report.failures)} of {report.objects} object(s) failed verification")
+                except Exception as e:
+                    print(f"Verifying {job.name} (destination {index}) failed: {e}")
+                    errors[f"{job.name}[{index}]"] = e
+        self.__raise_job_errors(errors)
+
+    def __raise_job_errors(self, errors: dict[str, BaseException]):
+        if errors:
+            report = "\n".join(f"  {name}: {type(e).__name__}: {e}" for name, e in sorted(errors.items()))
+            raise BackupsterError(f"{len(errors)} of {len(self.jobs)} job(s) failed:\n{report}")
+
+    async def backup_async(self):
+        semaphore = asyncio.Semaphore(self.__concurrency)
 
+        async def run(job: BackupJob):
+            async with semaphore:
+                try:
+                    await job.backup_async()
+                    print(f"Job {job.name} finished.")
+                except Exception as e:
+                    print(f"Job {job.name} failed: {e}")
+                    raise
+
+        results = await asyncio.gather(*(run(job) for job in self.jobs), return_exceptions=True)
+        self.__raise_job_errors({job.name: e for job, e in zip(self.jobs, results) if isinstance(e, BaseException)})
+
+    @property
+    def concurrency(self) -> int:
+        return self.__concurrency
+
+    def __export_metrics(self, jobs: list[BackupJob] | None = None):
+        # Jobs of the daemon may be running in other threads, their counters are still changing
+        runs = [self.metrics] + [job.last_metrics for job in self.jobs if job.last_metrics is not None]
+        for job in jobs or self.jobs:
+            print(f"Job {job.name} stages: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in job.stage_times.items()))
+
+        # A failing metrics sink must neither hide the other sinks nor the result of the backup
+        conf = self.__metrics_conf
+        exports: list[tuple[str, Callable[[], None]]] = [
+            (conf.textfile, lambda: bu.write_textfile(Path(conf.textfile), runs)),
+            (conf.summary, lambda: bu.write_summary(Path(conf.summary), runs)),
+            (conf.pushgateway, lambda: bu.push_gateway(conf.pushgateway, runs, conf.instance))
+        ]
+        for target, export in exports:
+            if not target:
+                continue
+            try:
+                # Jobs of the daemon finish independently of each other
+                with self.__metrics_lock:
+                    export()
+            except Exception as e:
+                print(f"Failed to export metrics to {target}: {e}")
+
+    def run_job(self, name: str):
+        # A single run of one job, e.g. by the daemon; the metrics of all jobs are exported after it
+        job = self.__get_job(name)
+        try:
+            if self.__engine == "async":
+                asyncio.run(job.backup_async())
+            else:
+                job.backup()
+        finally:
+            self.__export_metrics([job])
 
     def backup(self):
-        self.source.create_backup()
-        self.__zip_backup()
-        self.__encrypt_backup()
-        self.destination.upload_backup(self.__src_type)
-        self.__cleanup()
+        try:
+            if self.__engine == "async":
+                asyncio.run(self.backup_async())
+            else:
+                self.__backup_threads()
+        finally:
+            self.__export_metrics()
+
+    def __backup_threads(self):
+        errors: dict[str, BaseException] = {}
+
+        with ThreadPoolExecutor(max_workers=self.__concurrency) as pool:
+            futures = {pool.submit(job.backup): job.name for job in self.jobs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    print(f"Job {futures[future]} finished.")
+                except Exception as e:
+                    print(f"Job {futures[future]} failed: {e}")
+                    errors[futures[future]] = e
+
+        self.__raise_job_errors(errors)
 
 
 class SopsError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class BackupsterError(Exception):
+    pass
@@ -0,0 +1,103 @@
+import io
+import os
+import json
+import time
+import base64
+import argparse
+import tempfile
+
+from pathlib import Path
+
+import gnupg
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+import backup_utils as bu
+
+class _NullWriter:
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.bytes += len(data)
+        return len(data)
+
+def _engines(gnupg_home: str) -> dict:
+    # (encryptor, decrypt_stream, decrypt_bytes) per engine, with throwaway keys
+    gpg = gnupg.GPG(gnupghome=gnupg_home)
+    key = gpg.gen_key(gpg.gen_key_input(name_email="benchmark@backupster.invalid", key_type="RSA", key_length=2048, no_protection=True))
+    gpg_public = base64.b64encode(gpg.export_keys(key.fingerprint).encode()).decode()
+    identity = X25519PrivateKey.generate()
+    envelope_public = base64.b64encode(identity.public_key().public_bytes_raw()).decode()
+    return {
+        "gpg": (bu.SimpleGPG(gpg_public), lambda source: bu.decrypt_pipe(source, gnupg_home), lambda data: bu.decrypt_bytes(data, gnupg_home)),
+        "envelope": (bu.EnvelopeEncryptor(envelope_public), lambda source: bu.envelope_decrypt_stream(source, identity), lambda data: bu.envelope_decrypt_bytes(data, identity))
+    }
+
+def _result(engine: str, case: str, size: int, seconds: float, **extra) -> dict:
+    result = {
+        "engine": engine,
+        "case": case,
+        "mb": round(size / (1024 * 1024), 2),
+        "seconds": round(seconds, 3),
+        "throughput_mb_s": round(size / (1024 * 1024) / seconds, 2) if seconds else None,
+        **extra
+    }
+    print(json.dumps(result))
+    return result
+
+def run(engines: list[str], stream_mb: int, chunks: int, chunk_kb: int) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="backupster-bench-") as tmp:
+        # SimpleGPG imports into the default keyring
+        os.environ["GNUPGHOME"] = str(Path(tmp, "gnupg"))
+        Path(tmp, "gnupg").mkdir(mode=0o700)
+        available = _engines(os.environ["GNUPGHOME"])
+
+        # Random data, compression of gpg can't hide the cost of the cipher
+        source_path = Path(tmp, "source.bin")
+        with open(source_path, "wb") as f:
+            for _ in range(stream_mb):
+                f.write(os.urandom(1024 * 1024))
+        chunk_data = [os.urandom(chunk_kb * 1024) for _ in range(chunks)]
+
+        for engine in engines:
+            encryptor, decrypt_stream, decrypt_bytes = available[engine]
+
+            # Stream/files mode: one large file through encrypt_stream, like a streamed archive
+            start = time.perf_counter()
+            with open(source_path, "rb") as f:
+                sealed = io.BytesIO()
+                encryptor.encrypt_stream(f, sealed, compress=False)
+            results.append(_result(engine, "encrypt_stream", source_path.stat().st_size, time.perf_counter() - start,
+                                   overhead_bytes=sealed.tell() - source_path.stat().st_size))
+
+            start = time.perf_counter()
+            sealed.seek(0)
+            with decrypt_stream(sealed) as plain:
+                null = _NullWriter()
+                while data := plain.read(1024 * 1024):
+                    null.write(data)
+            results.append(_result(engine, "decrypt_stream", null.bytes, time.perf_counter() - start))
+
+            # Dedup mode: one encryption per chunk, where a subprocess per call costs the most
+            start = time.perf_counter()
+            sealed_chunks = [encryptor.encrypt_bytes(data) for data in chunk_data]
+            seconds = time.perf_counter() - start
+            results.append(_result(engine, "encrypt_chunks", chunks * chunk_kb * 1024, seconds,
+                                   chunks=chunks, ms_per_chunk=round(seconds * 1000 / chunks, 2)))
+
+            start = time.perf_counter()
+            for data in sealed_chunks:
+                decrypt_bytes(data)
+            results.append(_result(engine, "decrypt_chunks", chunks * chunk_kb * 1024, time.perf_counter() - start, chunks=chunks))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gpg subprocess against the in-process envelope encryption")
+    parser.add_argument("--engines", nargs="+", choices=["gpg", "envelope"], default=["gpg", "envelope"])
+    parser.add_argument("--stream-mb", type=int, default=256, help="size of the streamed file")
+    parser.add_argument("--chunks", type=int, default=200, help="number of chunks encrypted one by one")
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    args = parser.parse_args()
+    run(args.engines, args.stream_mb, args.chunks, args.chunk_kb)
@@ -0,0 +1,61 @@
+import argparse
+import json
+import tempfile
+import time
+
+from pathlib import Path
+
+import pykeepass
+
+from backup_sources.vaultwarden_backup_source import KeepassBuilder
+
+from . import synthetic
+
+def _build_legacy(keepass_path: Path, folders: dict[str, str], items: list[dict]):
+    # The former implementation, one XPath search per folder segment and per item
+    keepass_db = pykeepass.create_database(str(keepass_path), "benchmark")
+    for folder in folders.values():
+        last_group = keepass_db.root_group
+        for group in folder.split("/"):
+            group_exists = keepass_db.find_groups(path=[*last_group.path, group])
+            last_group = group_exists if group_exists else keepass_db.add_group(last_group, group)
+
+    for entry in items:
+        if not entry["folderId"] or not entry["login"]:
+            continue
+        group = keepass_db.find_groups(path=folders[entry["folderId"]].split("/"))
+        keepass_db.add_entry(group, entry["name"], entry["login"]["username"] or "", entry["login"]["password"])
+    keepass_db.save()
+
+def _build(keepass_path: Path, folders: dict[str, str], items: list[dict]):
+    keepass = KeepassBuilder(keepass_path, "benchmark")
+    keepass.add_folders(folders)
+    keepass.add_items(items)
+    keepass.save()
+
+def run(sizes: list[int], legacy: bool) -> list[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            folders, items = synthetic.vault(size)
+            implementations = [("index", _build)] + ([("legacy", _build_legacy)] if legacy else [])
+            for name, build in implementations:
+                keepass_path = Path(tmp, f"{name}-{size}.kdbx")
+                start = time.perf_counter()
+                build(keepass_path, folders, items)
+                results.append({
+                    "implementation": name,
+                    "items": size,
+                    "folders": len(folders),
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "kdbx_bytes": keepass_path.stat().st_size
+                })
+                print(json.dumps(results[-1]))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the KeePass export of the Vaultwarden source")
+    parser.add_argument("sizes", nargs="*", type=int, default=[10000, 50000])
+    parser.add_argument("--legacy", action="store_true", help="also time the former XPath based implementation (slow)")
+    args = parser.parse_args()
+    run(args.sizes, args.legacy)
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import asyncio
+import time
+import base64
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple
+
+import gnupg
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+import backup_utils as bu
+
+from backupster import BackupJob
+from backup_sources import BackupSource
+from backup_destinations import BackupDestination, LocalBackupDestination, LocalBackupDestinationConfig
+from backup_sources.vaultwarden_backup_source import KeepassBuilder
+
+from . import synthetic
+
+class SyntheticBackupSourceConfig(NamedTuple):
+    contacts: int = 0
+    events: int = 0
+    blobs: int = 0
+    blob_size_mb: int = 0
+    vault_items: int = 0
+
+class SyntheticBackupSource(BackupSource):
+
+    def __init__(self, work_dir: Path, backup_dir: Path, conf: SyntheticBackupSourceConfig) -> None:
+        super().__init__(work_dir, backup_dir, conf)
+        self.__conf = conf
+        self.bytes_written = 0
+
+    def create_backup(self):
+        self.bytes_written += synthetic.write_dav_tree(self._backup_dir, self.__conf.contacts, self.__conf.events)
+        self.bytes_written += synthetic.write_blobs(self._backup_dir, self.__conf.blobs, self.__conf.blob_size_mb * 1024 * 1024)
+
+        if self.__conf.vault_items:
+            folders, items = synthetic.vault(self.__conf.vault_items)
+            keepass_path = self._backup_dir / "vaultwarden-backup.kdbx"
+            keepass = KeepassBuilder(keepass_path, "benchmark")
+            keepass.add_folders(folders)
+            keepass.add_items(items)
+            keepass.save()
+            self.bytes_written += keepass_path.stat().st_size
+
+class _CountingWriter:
+    def __init__(self, destination: "NullBackupDestination") -> None:
+        self.__destination = destination
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.__destination.count(len(data))
+        self.bytes += len(data)
+        return len(data)
+
+class NullBackupDestination(BackupDestination):
+    # In-memory stand-in: reads everything it's given, only keeps the object names and byte counts
+
+    def __init__(self, conf_dir: Path, backup_dir: Path, workers: int = 1) -> None:
+        super().__init__(conf_dir, backup_dir, SyntheticBackupSourceConfig(), workers)
+        self.__lock = threading.Lock()
+        self.objects: dict[str, int] = {}
+        self.__documents: dict[str, bytes] = {}
+        self.__generations: dict[str, int] = {}
+        self.uploaded_bytes = 0
+
+    def count(self, size: int):
+        with self.__lock:
+            self.uploaded_bytes += size
+
+    def _download_file(self, file_name: str, target_path: Path):
+        raise NotImplementedError("The benchmark destination keeps no data")
+
+    def _upload_data(self, data: bytes, target_path: str):
+        self.count(len(data))
+        self.objects[target_path] = len(data)
+
+    def _list_files(self, prefix: str) -> list[str]:
+        return [name for name in self.objects if name.startswith(prefix)]
+
+    def _get_size(self, source_path: str) -> int:
+        return self.objects[source_path]
+
+    def _download_range(self, source_path: str, start: int, end: int) -> bytes:
+        raise NotImplementedError("The benchmark destination keeps no data")
+
+    def _delete_files(self, paths: list[str]):
+        with self.__lock:
+            for path in paths:
+                self.objects.pop(path, None)
+
+    def _remote_checksum(self, source_path: str) -> tuple[int, str | None]:
+        return self.objects[source_path], None
+
+    def _get_generation(self, source_path: str) -> int:
+        return self.__generations.get(source_path, 0)
+
+    def _read_versioned(self, source_path: str) -> tuple[bytes | None, int]:
+        return self.__documents.get(source_path), self.__generations.get(source_path, 0)
+
+    def _write_versioned(self, data: bytes, target_path: str, generation: int) -> int | None:
+        # Small metadata objects (the catalog) are kept, they are read back by the next write
+        with self.__lock:
+            if self.__generations.get(target_path, 0) != generation:
+                return None
+            self.__generations[target_path] = generation + 1
+            self.__documents[target_path] = data
+        self.count(len(data))
+        return generation + 1
+
+    @contextmanager
+    def _open_upload_stream(self, target_path: str) -> Iterator[BinaryIO]:
+        writer = _CountingWriter(self)
+        yield writer  # type: ignore[misc]
+        self.objects[target_path] = writer.bytes
+
+class _DiskSampler:
+    # Polls the size of the scratch directories to find their high-water mark
+    def __init__(self, paths: list[Path], interval: float = 0.05) -> None:
+        self.__paths = paths
+        self.__interval = interval
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.high_water = 0
+
+    def __size(self) -> int:
+        total = 0
+        for path in self.__paths:
+            for root, _, files in os.walk(path):
+                for name in files:
+                    try:
+                        total += os.lstat(os.path.join(root, name)).st_size
+                    except FileNotFoundError:
+                        pass
+        return total
+
+    def __run(self):
+        while not self.__stop.is_set():
+            self.high_water = max(self.high_water, self.__size())
+            self.__stop.wait(self.__interval)
+
+    def __enter__(self) -> "_DiskSampler":
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.__stop.set()
+        self.__thread.join()
+
+SCENARIOS = {
+    "small-files": lambda args: SyntheticBackupSourceConfig(contacts=args.contacts, events=args.events),
+    "blobs": lambda args: SyntheticBackupSourceConfig(blobs=args.blobs, blob_size_mb=args.blob_size_mb),
+    "vault": lambda args: SyntheticBackupSourceConfig(vault_items=args.vault_items),
+    "mixed": lambda args: SyntheticBackupSourceConfig(contacts=args.contacts, events=args.events, blobs=1,
+                                                      blob_size_mb=args.blob_size_mb, vault_items=args.vault_items),
+}
+
+MODES = ["files", "stream", "dedup", "async"]
+
+def _create_gpg_key(gnupg_home: str) -> str:
+    gpg = gnupg.GPG(gnupghome=gnupg_home)
+    key_input = gpg.gen_key_input(name_email="benchmark@backupster.invalid", key_type="RSA", key_length=2048, no_protection=True)
+    key = gpg.gen_key(key_input)
+    return base64.b64encode(gpg.export_keys(key.fingerprint).encode()).decode()
+
+def _mb(size: int) -> float:
+    return round(size / (1024 * 1024), 2)
+
+def run_scenario(scenario: str, mode: str, codec: str, engine: str, workers: int, conf: SyntheticBackupSourceConfig, target: str = "null") -> dict:
+    with tempfile.TemporaryDirectory(prefix="backupster-bench-") as tmp:
+        os.environ["GNUPGHOME"] = str(Path(tmp, "gnupg"))
+        Path(tmp, "gnupg").mkdir(mode=0o700)
+        if engine == "envelope":
+            encryptor: bu.Encryptor = bu.EnvelopeEncryptor(base64.b64encode(X25519PrivateKey.generate().public_key().public_bytes_raw()).decode())
+        else:
+            encryptor = bu.SimpleGPG(_create_gpg_key(os.environ["GNUPGHOME"]))
+
+        work_dir, backup_dir = Path(tmp, "work"), Path(tmp, "backup")
+        # local writes through the transfer core to disk (temp file, fsync, read-back check, rename)
+        destination: BackupDestination
+        if target == "local":
+            destination = LocalBackupDestination(Path(tmp), backup_dir, LocalBackupDestinationConfig(str(Path(tmp, "store"))), workers)
+        else:
+            destination = NullBackupDestination(Path(tmp), backup_dir, workers)
+        sources: list[SyntheticBackupSource] = []
+
+        def source_factory() -> SyntheticBackupSource:
+            sources.append(SyntheticBackupSource(work_dir, backup_dir, conf))
+            return sources[-1]
+
+        job = BackupJob(scenario, work_dir, backup_dir, source_factory, [destination], encryptor,
+                        stream=mode == "stream", workers=workers, dedup=mode == "dedup",
+                        archive=bu.ArchiveConf(codec, threads=-1 if codec == "zstd" else 0))
+
+        with _DiskSampler([work_dir, backup_dir]) as sampler:
+            start = time.perf_counter()
+            if mode == "async":
+                asyncio.run(job.backup_async())
+            else:
+                job.backup()
+            total = time.perf_counter() - start
+
+        input_bytes = sources[0].bytes_written if sources else 0
+        if isinstance(destination, NullBackupDestination):
+            uploaded_bytes, objects = destination.uploaded_bytes, len(destination.objects)
+        else:
+            stored = [path for path in Path(tmp, "store").rglob("*") if path.is_file() and not path.name.startswith(".")]
+            uploaded_bytes, objects = sum(path.stat().st_size for path in stored), len(stored)
+        return {
+            "scenario": scenario,
+            "mode": mode,
+            "codec": codec,
+            "encryption": engine,
+            "destination": target,
+            "workers": workers,
+            "source": conf._asdict(),
+            "input_mb": _mb(input_bytes),
+            "uploaded_mb": _mb(uploaded_bytes),
+            "objects": objects,
+            "total_seconds": round(total, 3),
+            "throughput_mb_s": round(_mb(input_bytes) / total, 2) if total else None,
+            "stages": {
+                name: {
+                    "seconds": round(seconds, 3),
+                    "throughput_mb_s": round(_mb(input_bytes) / seconds, 2) if seconds and name not in ("source", "cleanup") else None
+                }
+                for name, seconds in job.stage_times.items()
+            },
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+            "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 2),
+            "scratch_high_water_mb": _mb(sampler.high_water)
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Backupster's backup pipeline with synthetic sources")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--codecs", nargs="+", choices=list(bu.ARCHIVE_SUFFIXES), default=["zip"])
+    parser.add_argument("--encryption", nargs="+", choices=["gpg", "envelope"], default=["gpg"])
+    parser.add_argument("--destination", choices=["null", "local"], default="null", help="null discards uploads, local writes them to disk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--contacts", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--blobs", type=int, default=2)
+    parser.add_argument("--blob-size-mb", type=int, default=256)
+    parser.add_argument("--vault-items", type=int, default=10000)
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--run", nargs=4, metavar=("SCENARIO", "MODE", "CODEC", "ENGINE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process for a single run, so peak RSS is not inherited from earlier runs
+        scenario, mode, codec, engine = args.run
+        print(json.dumps(run_scenario(scenario, mode, codec, engine, args.workers, SCENARIOS[scenario](args), args.destination)))
+        return
+
+    results = []
+    for scenario in args.scenarios:
+        for mode in args.modes:
+            for codec in args.codecs:
+                for engine in args.encryption:
+                    child_args = [
+                        "--destination", args.destination, "--workers", str(args.workers), "--contacts", str(args.contacts), "--events", str(args.events),
+                        "--blobs", str(args.blobs), "--blob-size-mb", str(args.blob_size_mb), "--vault-items", str(args.vault_items)
+                    ]
+                    res = subprocess.run([sys.executable, "-m", "benchmarks.pipeline", *child_args, "--run", scenario, mode, codec, engine],
+                                         stdout=subprocess.PIPE, check=True)
+                    results.append(json.loads(res.stdout.decode().strip().splitlines()[-1]))
+                    print(f"{scenario}/{mode}/{codec}/{engine}: {results[-1]['total_seconds']}s", file=sys.stderr)
+
+    report = json.dumps({
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results
+    }, indent=2)
+
+    if args.output:
+        args.output.write_text(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
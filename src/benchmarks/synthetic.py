@@ -0,0 +1,102 @@
+import random
+import string
+
+from pathlib import Path
+
+def _word(rng: random.Random, length: int = 8) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=length))
+
+def vault(items: int, folders: int | None = None, seed: int = 0) -> tuple[dict[str, str], list[dict]]:
+    # Vault shaped like `bw list folders` / `bw list items` output, with nested folders
+    # and a mix of logins, notes, cards, identities and items without folder
+    rng = random.Random(seed)
+    folder_count = folders if folders is not None else max(1, items // 50)
+
+    folder_names: list[str] = []
+    for i in range(folder_count):
+        parent = rng.choice(folder_names) if folder_names and rng.random() < 0.6 else ""
+        name = f"{parent}/{_word(rng)}-{i}" if parent and parent.count("/") < 3 else f"{_word(rng)}-{i}"
+        folder_names.append(name)
+    folder_map = {f"folder-{i}": name for i, name in enumerate(folder_names)}
+    folder_ids = list(folder_map.keys())
+
+    vault_items = []
+    for i in range(items):
+        item_type = rng.choices([1, 2, 3, 4], weights=[85, 7, 4, 4])[0]
+        item: dict = {
+            "id": f"item-{i}",
+            "type": item_type,
+            "name": f"{_word(rng)} {i}",
+            "folderId": rng.choice(folder_ids) if rng.random() < 0.8 else None,
+            "notes": _word(rng, 40) if rng.random() < 0.2 else None,
+            "login": None
+        }
+        if item_type == 1:
+            item["login"] = {
+                "username": f"{_word(rng)}@example.com" if rng.random() < 0.9 else None,
+                "password": _word(rng, 20),
+                "uris": [{"uri": f"https://{_word(rng)}.example.com"}] if rng.random() < 0.7 else [],
+                "totp": None
+            }
+        elif item_type == 3:
+            item["card"] = {"cardholderName": _word(rng), "brand": "Visa", "number": "4111111111111111",
+                            "expMonth": "1", "expYear": "2030", "code": "123"}
+        elif item_type == 4:
+            item["identity"] = {"firstName": _word(rng), "lastName": _word(rng), "email": f"{_word(rng)}@example.com"}
+        vault_items.append(item)
+
+    return folder_map, vault_items
+
+def vcard(rng: random.Random, i: int) -> str:
+    first, last = _word(rng, 6).title(), _word(rng, 9).title()
+    return (
+        "BEGIN:VCARD\r\nVERSION:3.0\r\n"
+        f"UID:contact-{i}\r\nFN:{first} {last}\r\nN:{last};{first};;;\r\n"
+        f"EMAIL;TYPE=INTERNET:{first.lower()}.{last.lower()}@example.com\r\n"
+        f"TEL;TYPE=CELL:+49 {rng.randint(100, 999)} {rng.randint(1000000, 9999999)}\r\n"
+        f"NOTE:{_word(rng, rng.randint(0, 200))}\r\n"
+        "END:VCARD\r\n"
+    )
+
+def vevent(rng: random.Random, i: int) -> str:
+    day = rng.randint(1, 28)
+    month = rng.randint(1, 12)
+    return (
+        "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//backupster//benchmark//EN\r\n"
+        f"BEGIN:VEVENT\r\nUID:event-{i}\r\nDTSTAMP:2024{month:02d}{day:02d}T120000Z\r\n"
+        f"DTSTART:2024{month:02d}{day:02d}T{rng.randint(6, 20):02d}0000Z\r\n"
+        f"SUMMARY:{_word(rng)} {_word(rng)}\r\nDESCRIPTION:{_word(rng, rng.randint(0, 400))}\r\n"
+        "END:VEVENT\r\nEND:VCALENDAR\r\n"
+    )
+
+def write_dav_tree(backup_dir: Path, contacts: int, events: int, seed: int = 0) -> int:
+    # Same layout as the vdirsyncer storages of the DAV source: one file per item plus one combined file
+    rng = random.Random(seed)
+    written = 0
+    for name, count, render, ext in [("contacts", contacts, vcard, "vcf"), ("calendar", events, vevent, "ics")]:
+        if not count:
+            continue
+        item_dir = Path(backup_dir, name, f"{name}_i", "default")
+        combined_dir = Path(backup_dir, name, f"{name}_c")
+        item_dir.mkdir(parents=True, exist_ok=True)
+        combined_dir.mkdir(parents=True, exist_ok=True)
+
+        with open(combined_dir / f"default.{ext}", "w", newline="") as combined:
+            for i in range(count):
+                data = render(rng, i)
+                (item_dir / f"{name}-{i}.{ext}").write_text(data, newline="")
+                combined.write(data)
+                written += 2 * len(data)
+    return written
+
+def write_blobs(backup_dir: Path, count: int, size: int, seed: int = 0, chunk_size: int = 8 * 1024 * 1024) -> int:
+    # Incompressible data, written in chunks so multi-GB blobs don't need the memory
+    rng = random.Random(seed)
+    for i in range(count):
+        with open(Path(backup_dir, f"blob-{i}.bin"), "wb") as f:
+            remaining = size
+            while remaining > 0:
+                n = min(chunk_size, remaining)
+                f.write(rng.randbytes(n))
+                remaining -= n
+    return count * size
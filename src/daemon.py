@@ -0,0 +1,190 @@
+import json
+import signal
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import backup_utils as bu
+
+from backupster import Backupster
+
+# Longest sleep of the scheduler, so changes of the system clock are noticed
+_MAX_SLEEP_S = 30.0
+
+# /healthz fails if the scheduler loop didn't come around for this long
+_STALE_S = _MAX_SLEEP_S * 4
+
+class _JobState:
+    # Schedule and run history of a job, shown by /status
+    def __init__(self, schedule: bu.CronSchedule, now: datetime) -> None:
+        self.schedule = schedule
+        self.next_run = schedule.next_after(now)
+        # Held from the moment a run is due until it finished, a due run of a held job is skipped
+        self.lock = threading.Lock()
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_start: datetime | None = None
+        self.last_end: datetime | None = None
+        self.last_success: bool | None = None
+        self.last_error = ""
+
+    def as_dict(self) -> dict:
+        def iso(moment: datetime | None) -> str | None:
+            return moment.isoformat(timespec="seconds") if moment else None
+        return {
+            "schedule": self.schedule.expression,
+            "next_run": iso(self.next_run),
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_start": iso(self.last_start),
+            "last_end": iso(self.last_end),
+            "last_success": self.last_success,
+            "last_error": self.last_error
+        }
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    # GET /healthz: 200 while the scheduler runs, GET /status: the state of every scheduled job
+    server: "_StatusServer"
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            healthy = self.server.backup_daemon.healthy()
+            self.__send(200 if healthy else 503, {"status": "ok" if healthy else "stale"})
+        elif self.path == "/status":
+            self.__send(200, self.server.backup_daemon.status())
+        else:
+            self.__send(404, {"error": "not found"})
+
+    def log_message(self, format: str, *args):
+        # Probes would flood the log
+        pass
+
+    def __send(self, code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class _StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], daemon: "BackupDaemon") -> None:
+        super().__init__(address, _StatusHandler)
+        self.backup_daemon = daemon
+
+class BackupDaemon:
+    # Runs the scheduled jobs of one Backupster for as long as the process lives, so the decrypted
+    # configuration, the GPG keyring and the storage clients with their connection pools are set up
+    # once instead of per run. At most `concurrency` jobs run at a time and runs of the same job
+    # never overlap: a run that is due while the previous one still runs (or waits) is skipped.
+
+    def __init__(self, backupster: Backupster) -> None:
+        self.__backupster = backupster
+        now = datetime.now()
+        self.__states = {name: _JobState(schedule, now) for name, schedule in backupster.schedules.items()}
+        self.__stop = threading.Event()
+        self.__started = now
+        self.__heartbeat = time.monotonic()
+
+        unscheduled = [job.name for job in backupster.jobs if job.name not in self.__states]
+        if unscheduled:
+            print(f"Jobs without schedule, not run by the daemon: {', '.join(unscheduled)}")
+        if not self.__states:
+            raise DaemonError("No job has a schedule, nothing to run")
+
+    def healthy(self) -> bool:
+        return not self.__stop.is_set() and time.monotonic() - self.__heartbeat < _STALE_S
+
+    def status(self) -> dict:
+        return {
+            "started": self.__started.isoformat(timespec="seconds"),
+            "jobs": {name: state.as_dict() for name, state in self.__states.items()}
+        }
+
+    def stop(self):
+        self.__stop.set()
+
+    def run(self, run_now: bool = False):
+        conf = self.__backupster.daemon_conf
+        server = _StatusServer((conf.host, conf.port), self) if conf.port else None
+        if server is not None:
+            threading.Thread(target=server.serve_forever, name="status", daemon=True).start()
+            print(f"Status endpoint on http://{conf.host}:{server.server_address[1]}/status")
+
+        # Running jobs finish before the process exits, e.g. on a pod shutdown
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.stop())
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.__backupster.concurrency, thread_name_prefix="job") as pool:
+                for name, state in self.__states.items():
+                    print(f"Job {name}: schedule {state.schedule.expression}, next run {state.next_run:%Y-%m-%d %H:%M}")
+                    if run_now:
+                        self.__submit(pool, name, state)
+
+                while not self.__stop.is_set():
+                    self.__heartbeat = time.monotonic()
+                    now = datetime.now()
+                    for name, state in self.__states.items():
+                        if now >= state.next_run:
+                            state.next_run = state.schedule.next_after(now)
+                            self.__submit(pool, name, state)
+
+                    wait = min(state.next_run for state in self.__states.values()) - datetime.now()
+                    self.__stop.wait(min(max(wait.total_seconds(), 0.0), _MAX_SLEEP_S))
+
+                print("Stopping, waiting for running jobs to finish.")
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+
+    #### Helpers ####
+
+
+    def __submit(self, pool: ThreadPoolExecutor, name: str, state: _JobState):
+        if not state.lock.acquire(blocking=False):
+            state.skipped += 1
+            print(f"Job {name} is still running, skipping the run due now.")
+            return
+        try:
+            pool.submit(self.__run_job, name, state)
+        except BaseException:
+            state.lock.release()
+            raise
+
+    def __run_job(self, name: str, state: _JobState):
+        try:
+            if self.__stop.is_set():
+                return
+            state.running = True
+            state.last_start = datetime.now()
+            try:
+                self.__backupster.run_job(name)
+                state.last_success = True
+                state.last_error = ""
+                print(f"Job {name} finished, next run {state.next_run:%Y-%m-%d %H:%M}.")
+            except Exception as e:
+                state.failures += 1
+                state.last_success = False
+                state.last_error = f"{type(e).__name__}: {e}"
+                print(f"Job {name} failed: {e}")
+            state.runs += 1
+            state.last_end = datetime.now()
+        finally:
+            state.running = False
+            state.lock.release()
+
+
+class DaemonError(Exception):
+    pass
@@ -1,5 +1,86 @@
+import time
+
+# Startup of the CLI for --profile-startup, storage client libraries are only imported for the configured types
+_import_start = time.perf_counter()
+
+import argparse
+
+from pathlib import Path
+
+import backup_sources as src
+import backup_destinations as dst
+
 from backupster import Backupster
 
+_import_time = time.perf_counter() - _import_start
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="backupster")
+    parser.add_argument("--profile-startup", action="store_true", help="print where the startup time went (imports, configuration, source/destination types)")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("backup", help="run all configured backup jobs (default)")
+
+    restore = commands.add_parser("restore", help="list or restore the snapshots of a job")
+    restore.add_argument("job", help="name of the job, the source type for configurations without jobs:")
+    restore.add_argument("--list", action="store_true", help="only list the available snapshots")
+    restore.add_argument("--snapshot", help="snapshot to restore, defaults to the latest one")
+    restore.add_argument("--target", type=Path, default=Path(".restore"), help="directory to restore into")
+    restore.add_argument("--dst", type=int, default=0, help="index of the destination of the job to restore from")
+    restore.add_argument("--gnupghome", help="GPG home holding the private key, defaults to the one of the user")
+    restore.add_argument("--identity", type=Path, help="private key (PEM) of envelope encrypted backups")
+
+    catalog = commands.add_parser("catalog", help="show the snapshot catalog of a job")
+    catalog.add_argument("job", help="name of the job, the source type for configurations without jobs:")
+    catalog.add_argument("--rebuild", action="store_true", help="add snapshots missing in the catalog from a full listing")
+    catalog.add_argument("--dst", type=int, default=0, help="index of the destination of the job")
+
+    prune = commands.add_parser("prune", help="delete snapshots outside of the retention policy of the jobs")
+    prune.add_argument("jobs", nargs="*", help="jobs to prune, defaults to all")
+    prune.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+
+    verify = commands.add_parser("verify", help="check the stored snapshots of the jobs against the catalog, without downloading them")
+    verify.add_argument("jobs", nargs="*", help="jobs to verify, defaults to all")
+    verify.add_argument("--snapshot", help="only verify this snapshot")
+    verify.add_argument("--latest", action="store_true", help="only verify the latest snapshot")
+
+    daemon = commands.add_parser("daemon", help="run the jobs on their schedules until stopped, with a health/status endpoint")
+    daemon.add_argument("--run-now", action="store_true", help="also run every scheduled job once right away")
+
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    conf_start = time.perf_counter()
     data_backupper = Backupster()
-    data_backupper.backup()
\ No newline at end of file
+
+    if args.profile_startup:
+        # Type modules are imported while the configuration is parsed, their time is part of it
+        print(f"Startup: imports {_import_time * 1000:.1f} ms, configuration {(time.perf_counter() - conf_start) * 1000:.1f} ms")
+        for kind, registry in (("source", src.SOURCES), ("destination", dst.DESTINATIONS)):
+            for name, seconds in sorted(registry.load_times.items()):
+                print(f"  {kind} type {name}: {seconds * 1000:.1f} ms")
+
+    if args.command == "catalog":
+        destination = data_backupper.get_destination(args.job, args.dst)
+        catalog = destination.rebuild_catalog(args.job) if args.rebuild else destination.read_catalog(args.job)
+        for snapshot, entry in sorted(catalog.snapshots.items()):
+            size = sum(f["size"] for f in entry["files"].values())
+            print(f"{snapshot}  {entry['created']}  {len(entry['files'])} file(s)  {size} bytes")
+    elif args.command == "prune":
+        data_backupper.prune(args.jobs, args.dry_run)
+    elif args.command == "verify":
+        data_backupper.verify(args.jobs, args.snapshot, args.latest)
+    elif args.command == "daemon":
+        # Imported here, the one-shot commands don't need the HTTP server
+        from daemon import BackupDaemon
+        BackupDaemon(data_backupper).run(args.run_now)
+    elif args.command == "restore":
+        restore_job = data_backupper.create_restore_job(args.job, args.dst, args.gnupghome, args.identity)
+        if args.list:
+            for snapshot in restore_job.list_snapshots():
+                print(snapshot)
+        else:
+            restore_job.restore(args.target, args.snapshot)
+    else:
+        data_backupper.backup()
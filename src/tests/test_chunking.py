@@ -0,0 +1,68 @@
+import io
+import random
+
+import pytest
+
+import backup_utils.chunking as chunking
+
+from backup_utils.chunking import ChunkerConf
+
+pytestmark = pytest.mark.skipif(chunking.numpy is None, reason="numpy is not installed")
+
+# Small sizes, so the Python loop stays fast and inputs span many chunks
+_CONF = ChunkerConf(min_size=1024, avg_size=4096, max_size=16 * 1024)
+
+def _random(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+def _low_entropy(size: int, seed: int = 0) -> bytes:
+    # Long runs of a few byte values, like sparse or padded files
+    rng = random.Random(seed)
+    data = bytearray()
+    while len(data) < size:
+        data += bytes([rng.choice(b"\x00\x01 ")]) * rng.randrange(1, 5000)
+    return bytes(data[:size])
+
+def _chunk_sizes(data: bytes, conf: ChunkerConf) -> list[int]:
+    return [len(chunk) for chunk in chunking.iter_chunks(io.BytesIO(data), conf)]
+
+def _loop_chunk_sizes(monkeypatch: pytest.MonkeyPatch, data: bytes, conf: ChunkerConf) -> list[int]:
+    with monkeypatch.context() as patch:
+        patch.setattr(chunking, "numpy", None)
+        return _chunk_sizes(data, conf)
+
+@pytest.mark.parametrize("data", [_random(300_000), _random(300_000, seed=1), _low_entropy(300_000), bytes(100_000)],
+                         ids=["random", "random-2", "low-entropy", "zeros"])
+@pytest.mark.parametrize("block_size", [chunking._BLOCK_SIZE, 64, 97, 1000])
+def test_vectorized_cut_points_match_loop(monkeypatch, data, block_size):
+    # Small blocks put many cut points (and the 31 bytes of context) across block boundaries
+    monkeypatch.setattr(chunking, "_BLOCK_SIZE", block_size)
+    assert _chunk_sizes(data, _CONF) == _loop_chunk_sizes(monkeypatch, data, _CONF)
+
+def test_cut_point_at_every_offset_matches_loop(monkeypatch):
+    monkeypatch.setattr(chunking, "_BLOCK_SIZE", 128)
+    data = _random(40_000, seed=2)
+    for offset in range(0, 20_000, 37):
+        window = bytearray(data[offset:])
+        vectorized = chunking._cut_point(window, _CONF)
+        with monkeypatch.context() as patch:
+            patch.setattr(chunking, "numpy", None)
+            assert chunking._cut_point(window, _CONF) == vectorized
+
+def test_max_size_cut():
+    # A constant input never matches the masks, every chunk is cut at max_size
+    sizes = _chunk_sizes(bytes(5 * _CONF.max_size + 10), _CONF)
+    assert sizes == [_CONF.max_size] * 5 + [10]
+
+def test_max_size_cut_matches_loop(monkeypatch):
+    conf = ChunkerConf(min_size=1024, avg_size=64 * 1024, max_size=6000)
+    data = _random(100_000, seed=3)
+    sizes = _chunk_sizes(data, conf)
+    assert max(sizes) == conf.max_size
+    assert sizes == _loop_chunk_sizes(monkeypatch, data, conf)
+
+def test_short_input_is_one_chunk(monkeypatch):
+    for size in (0, 1, _CONF.min_size, _CONF.min_size + 1):
+        data = _random(size)
+        assert b"".join(chunking.iter_chunks(io.BytesIO(data), _CONF)) == data
+        assert _chunk_sizes(data, _CONF) == _loop_chunk_sizes(monkeypatch, data, _CONF)
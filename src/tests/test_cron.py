@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from backup_utils.cron import CronError, CronSchedule
+
+def _runs(expression: str, start: datetime, count: int) -> list[datetime]:
+    schedule = CronSchedule(expression)
+    runs = []
+    for _ in range(count):
+        start = schedule.next_after(start)
+        runs.append(start)
+    return runs
+
+def test_next_minute_is_strictly_after():
+    schedule = CronSchedule("* * * * *")
+    assert schedule.next_after(datetime(2026, 1, 1, 12, 0, 0)) == datetime(2026, 1, 1, 12, 1)
+    assert schedule.next_after(datetime(2026, 1, 1, 12, 0, 59, 999)) == datetime(2026, 1, 1, 12, 1)
+
+def test_steps_lists_and_ranges():
+    assert _runs("*/20 9-10 * * *", datetime(2026, 1, 1, 10, 30), 4) == [
+        datetime(2026, 1, 1, 10, 40), datetime(2026, 1, 2, 9, 0), datetime(2026, 1, 2, 9, 20), datetime(2026, 1, 2, 9, 40)
+    ]
+    assert _runs("5,35 1 * * *", datetime(2026, 1, 1), 3) == [
+        datetime(2026, 1, 1, 1, 5), datetime(2026, 1, 1, 1, 35), datetime(2026, 1, 2, 1, 5)
+    ]
+    # A start with a step runs to the end of the range
+    assert _runs("50/5 0 * * *", datetime(2026, 1, 1), 3) == [
+        datetime(2026, 1, 1, 0, 50), datetime(2026, 1, 1, 0, 55), datetime(2026, 1, 2, 0, 50)
+    ]
+
+def test_month_and_day_names():
+    # 2026-01-01 is a Thursday
+    assert _runs("0 3 * feb,Apr mon-wed", datetime(2026, 1, 1), 4) == [
+        datetime(2026, 2, 2, 3), datetime(2026, 2, 3, 3), datetime(2026, 2, 4, 3), datetime(2026, 2, 9, 3)
+    ]
+
+@pytest.mark.parametrize("sunday", ["0", "7", "sun", "SUN"])
+def test_sunday(sunday):
+    assert CronSchedule(f"0 0 * * {sunday}").next_after(datetime(2026, 1, 1)) == datetime(2026, 1, 4)
+
+def test_aliases():
+    assert CronSchedule("@daily").next_after(datetime(2026, 1, 1, 12)) == datetime(2026, 1, 2)
+    assert CronSchedule("@weekly").next_after(datetime(2026, 1, 1)) == datetime(2026, 1, 4)
+    assert CronSchedule("@monthly").next_after(datetime(2026, 1, 15)) == datetime(2026, 2, 1)
+    assert CronSchedule("@yearly").next_after(datetime(2026, 1, 1)) == datetime(2027, 1, 1)
+
+def test_day_of_month_or_day_of_week():
+    # Both restricted: the 13th or any Friday
+    days = [run.day for run in _runs("0 0 13 * fri", datetime(2026, 2, 1), 5)]
+    assert days == [6, 13, 20, 27, 6]
+
+def test_day_of_month_and_unrestricted_day_of_week():
+    assert [run.day for run in _runs("0 0 13 * *", datetime(2026, 1, 1), 2)] == [13, 13]
+    # Fridays only, the day of month isn't restricted
+    assert [run.day for run in _runs("0 0 * * fri", datetime(2026, 2, 1), 3)] == [6, 13, 20]
+
+def test_star_step_counts_as_unrestricted():
+    # "*/2" restricts the days, but like a "*" field it doesn't switch on the OR rule: odd days that are Mondays
+    runs = _runs("0 0 */2 * mon", datetime(2026, 1, 1), 3)
+    assert [(run.month, run.day) for run in runs] == [(1, 5), (1, 19), (2, 9)]
+    assert all(run.isoweekday() == 1 for run in runs)
+    # The same for a stepped day-of-week field: odd days that are Sunday, Tuesday, Thursday or Saturday
+    runs = _runs("0 0 1-31/2 * */2", datetime(2025, 12, 31), 4)
+    assert [run.day for run in runs] == [1, 3, 11, 13]
+
+def test_leap_day():
+    assert CronSchedule("0 0 29 2 *").next_after(datetime(2026, 1, 1)) == datetime(2028, 2, 29)
+
+def test_never_matching_expression():
+    with pytest.raises(CronError, match="doesn't match"):
+        CronSchedule("0 0 30 2 *").next_after(datetime(2026, 1, 1))
+
+@pytest.mark.parametrize("expression", ["", "* * * *", "* * * * * *", "60 * * * *", "* 24 * * *", "* * 0 * *",
+                                        "* * * 13 *", "* * * * 8", "*/0 * * * *", "5-1 * * * *", "* * * foo *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(CronError):
+        CronSchedule(expression)
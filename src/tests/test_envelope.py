@@ -0,0 +1,102 @@
+import io
+import os
+import base64
+
+import pytest
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from backup_utils import envelope
+from backup_utils.envelope import EnvelopeEncryptor, EnvelopeError, envelope_decrypt_bytes, envelope_decrypt_stream
+
+_SEGMENT = envelope._SEGMENT_SIZE
+_SEALED = envelope._SEGMENT_SIZE + envelope._TAG_SIZE
+_HEADER = envelope._HEADER.size
+
+@pytest.fixture(scope="module")
+def identity() -> X25519PrivateKey:
+    return X25519PrivateKey.generate()
+
+@pytest.fixture(scope="module")
+def encryptor(identity) -> EnvelopeEncryptor:
+    return EnvelopeEncryptor(base64.b64encode(identity.public_key().public_bytes_raw()).decode())
+
+class _TrickleReader(io.RawIOBase):
+    # Returns at most a few bytes per read, like a network stream
+    def __init__(self, data: bytes, size: int = 1000) -> None:
+        super().__init__()
+        self.__source = io.BytesIO(data)
+        self.__size = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.__source.read(min(len(buffer), self.__size))
+        buffer[:len(data)] = data
+        return len(data)
+
+@pytest.mark.parametrize("size", [0, 1, _SEGMENT - 1, _SEGMENT, _SEGMENT + 1, 3 * _SEGMENT, 3 * _SEGMENT + 5])
+def test_round_trip(encryptor, identity, size):
+    data = os.urandom(size)
+    sealed = encryptor.encrypt_bytes(data)
+    assert envelope.is_envelope(sealed)
+    # A full last segment isn't followed by an empty one, an empty input is one empty segment
+    assert len(sealed) == _HEADER + size + max(1, -(size // -_SEGMENT)) * envelope._TAG_SIZE
+    assert envelope_decrypt_bytes(sealed, identity) == data
+    with envelope_decrypt_stream(_TrickleReader(sealed), identity) as reader:
+        assert reader.read() == data
+
+@pytest.mark.parametrize("write_size", [1, 1000, _SEGMENT, _SEGMENT + 7, 5 * _SEGMENT])
+def test_stream_writes_of_any_size(encryptor, identity, write_size):
+    data = os.urandom(3 * _SEGMENT + 123)
+    target = io.BytesIO()
+    encryptor.encrypt_stream(io.BytesIO(data), target, chunk_size=write_size)
+    assert envelope_decrypt_bytes(target.getvalue(), identity) == data
+
+def _segments(sealed: bytes) -> tuple[bytes, list[bytes]]:
+    body = sealed[_HEADER:]
+    return sealed[:_HEADER], [body[i:i + _SEALED] for i in range(0, len(body), _SEALED)]
+
+def test_truncated_segments_are_rejected(encryptor, identity):
+    sealed = encryptor.encrypt_bytes(os.urandom(3 * _SEGMENT + 10))
+    header, segments = _segments(sealed)
+    assert len(segments) == 4
+    # Cut at a segment boundary: the new last segment wasn't sealed as the last one
+    for count in range(0, len(segments)):
+        with pytest.raises(EnvelopeError):
+            envelope_decrypt_bytes(header + b"".join(segments[:count]), identity)
+    # Cut inside a segment
+    with pytest.raises(EnvelopeError):
+        envelope_decrypt_bytes(sealed[:-1], identity)
+    with pytest.raises(EnvelopeError):
+        envelope_decrypt_bytes(sealed[:_HEADER - 1], identity)
+
+def test_truncated_stream_fails_after_the_consumer(encryptor, identity):
+    sealed = encryptor.encrypt_bytes(os.urandom(2 * _SEGMENT + 10))
+    with pytest.raises(EnvelopeError):
+        with envelope_decrypt_stream(io.BytesIO(sealed[:_HEADER + 2 * _SEALED]), identity) as reader:
+            reader.read(10)
+
+def test_reordered_segments_are_rejected(encryptor, identity):
+    header, segments = _segments(encryptor.encrypt_bytes(os.urandom(3 * _SEGMENT)))
+    reordered = [segments[1], segments[0]] + segments[2:]
+    with pytest.raises(EnvelopeError):
+        envelope_decrypt_bytes(header + b"".join(reordered), identity)
+
+def test_tampered_data_and_header_are_rejected(encryptor, identity):
+    sealed = bytearray(encryptor.encrypt_bytes(os.urandom(1000)))
+    for position in (_HEADER + 10, _HEADER - 1):
+        tampered = bytearray(sealed)
+        tampered[position] ^= 1
+        with pytest.raises(EnvelopeError):
+            envelope_decrypt_bytes(bytes(tampered), identity)
+
+def test_other_key_is_rejected(encryptor):
+    sealed = encryptor.encrypt_bytes(b"secret")
+    with pytest.raises(EnvelopeError, match="another key"):
+        envelope_decrypt_bytes(sealed, X25519PrivateKey.generate())
+
+def test_not_an_envelope(identity):
+    with pytest.raises(EnvelopeError, match="header"):
+        envelope_decrypt_bytes(b"-----BEGIN PGP MESSAGE-----" + bytes(100), identity)
@@ -0,0 +1,124 @@
+import base64
+import random
+import threading
+
+from pathlib import Path
+
+import pytest
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+import backup_utils as bu
+
+from backup_destinations import LocalBackupDestination, LocalBackupDestinationConfig, TransferConf
+from backup_destinations._backup_destination import transfer
+from backup_sources import BackupSource
+from backupster import BackupJob
+
+# Smallest part size part_size() hands out (it rounds up to MiB)
+_PART_SIZE = 1024 * 1024
+_BIG_SIZE = 10 * _PART_SIZE + 100
+
+class _Interrupted(Exception):
+    # Not retryable, ends the run like a killed process would
+    pass
+
+class _MultipartLocalDestination(LocalBackupDestination):
+    # Local destination with multipart calls; parts are kept in a directory that outlives the object,
+    # like the open uploads of a cloud bucket outlive the process that started them
+    _multipart = True
+
+    def __init__(self, tmp: Path, fail_at_part: int | None = None) -> None:
+        super().__init__(tmp / "conf", tmp / "backup", LocalBackupDestinationConfig(path=str(tmp / "store")),
+                         workers=2, transfer=TransferConf(part_size_mb=0, backoff_s=0))
+        self.__parts_dir = tmp / "parts"
+        self.__fail_at_part = fail_at_part
+        self.__lock = threading.Lock()
+        self.begun: list[str] = []
+        self.put_parts: list[int] = []
+        self.single_uploads: list[str] = []
+
+    def _multipart_begin(self, target_path: str) -> str:
+        upload_id = f"upload{len(list(self.__parts_dir.glob('*'))) if self.__parts_dir.exists() else 0}"
+        (self.__parts_dir / upload_id).mkdir(parents=True)
+        self.begun.append(target_path)
+        return upload_id
+
+    def _multipart_put(self, target_path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        if part_number == self.__fail_at_part:
+            raise _Interrupted(f"interrupted at part {part_number}")
+        (self.__parts_dir / upload_id / str(part_number)).write_bytes(data)
+        with self.__lock:
+            self.put_parts.append(part_number)
+        return str(part_number)
+
+    def _multipart_complete(self, target_path: str, upload_id: str, parts: list[str]):
+        data = b"".join((self.__parts_dir / upload_id / part).read_bytes() for part in parts)
+        LocalBackupDestination._upload_data(self, data, target_path)
+
+    def _multipart_abort(self, target_path: str, upload_id: str):
+        pass
+
+    def _upload_data(self, data: bytes, target_path: str):
+        if target_path.endswith(".enc"):
+            self.single_uploads.append(target_path.rsplit("/", 1)[-1])
+        super()._upload_data(data, target_path)
+
+class _CountingEncryptor(bu.EnvelopeEncryptor):
+    def __init__(self, public_key_base64: str) -> None:
+        super().__init__(public_key_base64)
+        self.encrypted: list[str] = []
+
+    def encrypt_file(self, file_path, output_path, compress: bool = True):
+        self.encrypted.append(Path(file_path).name)
+        super().encrypt_file(file_path, output_path, compress)
+
+class _FilesSource(BackupSource):
+    def __init__(self, work_dir: Path, backup_dir: Path, files: dict[str, bytes], runs: list[int]) -> None:
+        super().__init__(work_dir, backup_dir, None)
+        self.__files = files
+        runs.append(1)
+
+    def create_backup(self):
+        for name, data in self.__files.items():
+            (self._backup_dir / name).write_bytes(data)
+
+def _job(tmp: Path, destination: LocalBackupDestination, encryptor: bu.Encryptor, files: dict[str, bytes], runs: list[int]) -> BackupJob:
+    return BackupJob("job", tmp / "work", tmp / "backup", lambda: _FilesSource(tmp / "work", tmp / "backup", files, runs),
+                     [destination], encryptor, workers=2, resume=bu.JournalConf(enabled=True))
+
+def test_interrupted_multipart_upload_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "_MIN_PART_SIZE", _PART_SIZE)
+    identity = X25519PrivateKey.generate()
+    encryptor = _CountingEncryptor(base64.b64encode(identity.public_key().public_bytes_raw()).decode())
+    files = {"big.bin": random.Random(0).randbytes(_BIG_SIZE), "small.json": b'{"a": 1}'}
+    runs: list[int] = []
+
+    first = _MultipartLocalDestination(tmp_path, fail_at_part=6)
+    with pytest.raises(Exception, match="interrupted at part 6"):
+        _job(tmp_path, first, encryptor, files, runs).backup()
+    assert first.begun == ["job/" + first._timestamp + "/big.bin.enc"]
+    assert first.single_uploads == ["small.json.enc"]
+    assert set(range(1, 6)) <= set(first.put_parts)
+    assert sorted(encryptor.encrypted) == ["big.bin", "small.json"]
+
+    # A new process: the encrypted artifacts and the journal are all that is left
+    second = _MultipartLocalDestination(tmp_path)
+    _job(tmp_path, second, encryptor, files, runs).backup()
+
+    assert len(runs) == 1, "the completed source ran again"
+    assert len(encryptor.encrypted) == 2, "the encrypted artifacts were encrypted again"
+    assert second.begun == [], "the upload started over instead of resuming"
+    assert second.single_uploads == [], "the uploaded file was sent again"
+    # Parts still in flight when part 6 failed weren't recorded, only those are sent again
+    recorded = min(second.put_parts) - 1
+    assert 1 <= recorded <= 5 and sorted(second.put_parts) == list(range(recorded + 1, 12))
+
+    catalog = second.read_catalog("job")
+    snapshot = first._timestamp
+    assert catalog.snapshot_ids() == [snapshot]
+    assert sorted(catalog.snapshots[snapshot]["files"]) == ["big.bin.enc", "small.json.enc"]
+    for name, data in files.items():
+        sealed = (tmp_path / "store" / "job" / snapshot / f"{name}.enc").read_bytes()
+        assert bu.envelope_decrypt_bytes(sealed, identity) == data
+    assert not (tmp_path / "work" / ".journal.json").exists()
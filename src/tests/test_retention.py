@@ -0,0 +1,43 @@
+from backup_destinations._backup_destination.retention import RetentionPolicy, select_snapshots
+
+def test_daily_keeps_newest_of_each_day():
+    snapshots = ["20260101-080000", "20260101-235959", "20260102-000001", "20260102-120000", "20260103-060000"]
+    keep, delete = select_snapshots(snapshots, RetentionPolicy(daily=2))
+    assert keep == ["20260102-120000", "20260103-060000"]
+    assert delete == ["20260101-080000", "20260101-235959", "20260102-000001"]
+
+def test_daily_splits_at_midnight():
+    keep, _ = select_snapshots(["20260101-235959", "20260102-000000"], RetentionPolicy(daily=2))
+    assert keep == ["20260101-235959", "20260102-000000"]
+
+def test_weekly_uses_iso_weeks_across_the_year():
+    # ISO week 1 of 2026 runs from Monday 2025-12-29 to Sunday 2026-01-04
+    snapshots = ["20251228-120000", "20251229-120000", "20260103-120000", "20260104-120000", "20260105-120000", "20260111-120000"]
+    keep, delete = select_snapshots(snapshots, RetentionPolicy(weekly=3))
+    assert keep == ["20251228-120000", "20260104-120000", "20260111-120000"]
+    assert delete == ["20251229-120000", "20260103-120000", "20260105-120000"]
+
+def test_monthly_splits_at_month_end():
+    snapshots = ["20260115-000000", "20260131-235959", "20260201-000000", "20260215-000000"]
+    keep, delete = select_snapshots(snapshots, RetentionPolicy(monthly=2))
+    assert keep == ["20260131-235959", "20260215-000000"]
+    assert delete == ["20260115-000000", "20260201-000000"]
+
+def test_buckets_are_combined():
+    snapshots = ["20251115-000000", "20251220-000000", "20260105-000000", "20260112-000000", "20260113-000000"]
+    keep, delete = select_snapshots(snapshots, RetentionPolicy(daily=1, weekly=2, monthly=3))
+    assert keep == ["20251115-000000", "20251220-000000", "20260105-000000", "20260113-000000"]
+    assert delete == ["20260112-000000"]
+
+def test_newest_is_always_kept():
+    snapshots = ["20260101-000000", "20260102-000000", "20260103-000000"]
+    assert select_snapshots(snapshots, RetentionPolicy()) == (["20260103-000000"], ["20260101-000000", "20260102-000000"])
+
+def test_unparseable_ids_are_kept():
+    snapshots = ["20260101-000000", "20260102-000000", "manual", "2026-01-01"]
+    keep, delete = select_snapshots(snapshots, RetentionPolicy())
+    assert keep == ["2026-01-01", "20260102-000000", "manual"]
+    assert delete == ["20260101-000000"]
+
+def test_no_snapshots():
+    assert select_snapshots([], RetentionPolicy(daily=7)) == ([], [])